@@ -1,20 +1,83 @@
 
 import sys, os
+import json
+from datetime import datetime
 from flask import jsonify
-from flask import Flask, render_template, redirect, url_for, request, flash
+from flask import Flask, Response, render_template, redirect, url_for, request, flash
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from db.models import Request, CallHistory, KnowledgeBase
+from db import firebase
+from db.backends import DB_BACKEND
+from db.models import Request, CallHistory, KnowledgeBase, DashboardStats
+from utils.cache import ReadCache
+from utils.feed import RequestFeed
 
 app = Flask(__name__)
 
+PAGE_SIZE = 20
+
+# dashboards refresh constantly; the TTL bounds how stale writes from agent workers
+# (other processes) can look, writes made here invalidate right away
+cache = ReadCache(maxsize=int(os.getenv('ADMIN_CACHE_SIZE', '256')),
+                  ttl=float(os.getenv('ADMIN_CACHE_TTL', '10')))
+
+@cache.cached('pending')
+def pending_page(limit=None, start_after=None, fields=None):
+    return Request.get_pending_requests(limit=limit, start_after=start_after, fields=fields)
+
+@cache.cached('knowledge')
+def knowledge_page(limit=None, start_after=None, fields=None):
+    return KnowledgeBase.get_all(limit=limit, start_after=start_after, fields=fields)
+
+@cache.cached('stats')
+def dashboard_counts():
+    return DashboardStats.get()
+
+# pushes request changes to connected dashboards (see /events); a client that falls
+# more than EVENTS_QUEUE_SIZE events behind is told to resync instead of slowing the feed
+feed = RequestFeed(queue_size=int(os.getenv('EVENTS_QUEUE_SIZE', '100')))
+# changes made by agent workers show up here first, so drop the affected cache entries right away
+feed.add_listener(lambda event: cache.invalidate('pending', event['type'].split('.')[-1], 'stats'))
+
+def status_requests(status, since=None, until=None, **kwargs):
+    return cache.get_or_load(('status_requests', status, since, until, kwargs),
+                             lambda: list(Request.query_by_status(status, since=since, until=until, **kwargs)),
+                             tags=[status])
+
+# only what the list views render, so pages don't pull whole documents
+REQUEST_LIST_FIELDS = ['customer_phone', 'query', 'call_id', 'status', 'category', 'created_at']
+KNOWLEDGE_LIST_FIELDS = ['key_phrase', 'question', 'answer', 'created_by', 'created_at']
+
+def paginate(fetch, fields=None, page_size=PAGE_SIZE):
+    """One page from a model list method plus the cursor (last id) for the next page, or None"""
+    cursor = request.args.get('after') or None
+    # one extra tells us whether there is a next page without counting
+    items = fetch(limit=page_size + 1, start_after=cursor, fields=fields)
+    next_cursor = items[page_size - 1].id if len(items) > page_size else None
+    return items[:page_size], next_cursor
+
+def date_range():
+    """?since= and ?until= (ISO dates) from the query string, None when missing or invalid"""
+    def parse(name):
+        try:
+            return datetime.fromisoformat(request.args[name])
+        except (KeyError, ValueError):
+            return None
+    return parse('since'), parse('until')
+
+def status_page(status, fields):
+    """One page of requests with a status, newest first, within the requested date range"""
+    since, until = date_range()
+    fetch = lambda **kwargs: status_requests(status, since=since, until=until, **kwargs)
+    return paginate(fetch, fields)
+
 # admin dashboard
 @app.route('/')
 def index():
     """Main dashboard view for supervisors"""
-    # recent pending requests
-    pending_requests = Request.get_pending_requests()[:20]
+    # first page of pending requests and learned answers, fetched with a limit
+    pending_requests = pending_page(limit=PAGE_SIZE, fields=['customer_phone', 'call_id', 'category', 'created_at'])
     print(f"Pending requests: {pending_requests}")
-    learned_answers = KnowledgeBase.get_all()[:20]
+    learned_answers = knowledge_page(limit=PAGE_SIZE, fields=['key_phrase', 'answer', 'created_at'])
     print(f"Learned answers: {learned_answers}")
 
     return render_template('dashboard.html', 
@@ -25,15 +88,13 @@ def index():
 @app.route('/stats', strict_slashes=False, methods=['GET'])
 def stats():
     """Return needed stats for the dashboard."""
-    pending_count = len(Request.get_pending_requests())
-    all_requests = Request.get_request_history()
-    resolved = [req for req in all_requests if req.status == 'resolved']
-    resolved_count = len(resolved)
-    unresolved = [req for req in all_requests if req.status == 'unresolved']
-    unresolved_count = len(unresolved)
-    call_history = CallHistory.get_all()
-    total_calls = len(call_history)
-    ai_handled_calls = len([call for call in call_history if call.ai_handled])
+    # one document read, the counters are maintained by the model writes (utils/rebuild_stats.py recounts)
+    counts = dashboard_counts()
+    pending_count = counts['pending']
+    resolved_count = counts['resolved']
+    unresolved_count = counts['unresolved']
+    total_calls = counts['total_calls']
+    ai_handled_calls = counts['ai_handled_calls']
 
     ai_handled_ratio = (ai_handled_calls / total_calls * 100) if total_calls > 0 else 0
 
@@ -45,28 +106,61 @@ def stats():
         "total_calls": total_calls
     })
 
+# read cache hit/miss counters, for sizing ADMIN_CACHE_SIZE / ADMIN_CACHE_TTL
+@app.route('/cache/stats', strict_slashes=False, methods=['GET'])
+def cache_stats():
+    """Return the admin read cache counters."""
+    return jsonify(cache.stats())
+
+# live request events for the dashboard (Server-Sent Events)
+@app.route('/events', strict_slashes=False, methods=['GET'])
+def events():
+    """Stream new, resolved and unresolved requests as they happen."""
+    subscriber = feed.subscribe()
+
+    def stream():
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                event = subscriber.get(timeout=15)
+                if event is None:
+                    yield ': keepalive\n\n'  # also how we notice a client that went away
+                    continue
+                yield f"id: {event['seq']}\nevent: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+        finally:
+            feed.unsubscribe(subscriber)
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/events/stats', strict_slashes=False, methods=['GET'])
+def events_stats():
+    """Return the event feed counters."""
+    return jsonify(feed.stats())
+
 # route to get pending requests
 @app.route('/requests/pending', strict_slashes=False)
 def pending_requests():
-    """View all pending requests"""
-    requests = Request.get_pending_requests()
-    return render_template('pending.html', pending_requests=requests)
+    """View pending requests, a page at a time"""
+    requests, next_cursor = paginate(pending_page, REQUEST_LIST_FIELDS)
+    return render_template('pending.html', pending_requests=requests, next_cursor=next_cursor,
+                           is_first_page=not request.args.get('after'))
 
 # route to get resolved requests
 @app.route('/requests/resolved', strict_slashes=False)
 def resolved_requests():
-    """View all resolved requests"""
-    all_requests = Request.get_request_history()
-    resolved = [req for req in all_requests if req.status == 'resolved']
-    return render_template('resolved.html', resolved_requests=resolved)
+    """View resolved requests, newest first, a page at a time"""
+    resolved, next_cursor = status_page('resolved', REQUEST_LIST_FIELDS + ['updated_at', 'answer'])
+    return render_template('resolved.html', resolved_requests=resolved, next_cursor=next_cursor,
+                           is_first_page=not request.args.get('after'))
 
 # route to get unresolved requests
 @app.route('/requests/unresolved', strict_slashes=False)
 def unresolved_requests():
-    """View all unresolved requests"""
-    all_requests = Request.get_request_history()
-    unresolved = [req for req in all_requests if req.status == 'unresolved']
-    return render_template('unresolved.html', unresolved_requests=unresolved)
+    """View unresolved requests, newest first, a page at a time"""
+    unresolved, next_cursor = status_page('unresolved', REQUEST_LIST_FIELDS + ['unresolved_reason'])
+    return render_template('unresolved.html', unresolved_requests=unresolved, next_cursor=next_cursor,
+                           is_first_page=not request.args.get('after'))
 
 # route to get call history
 @app.route('/calls/history', strict_slashes=False)
@@ -87,7 +181,9 @@ def resolve_request(call_id):
     
     req = Request.get(call_id)
     if req:
+        previous = req.status
         req.resolve(answer)
+        cache.invalidate(previous, 'resolved', 'stats')
         flash('Request resolved successfully', 'success')
     else:
         flash('Request not found', 'error')
@@ -102,7 +198,9 @@ def mark_unresolved(call_id):
     
     req = Request.get(call_id)
     if req:
+        previous = req.status
         req.mark_unresolved(reason)
+        cache.invalidate(previous, 'unresolved', 'stats')
         flash('Request marked as unresolved', 'success')
     else:
         flash('Request not found', 'error')
@@ -112,9 +210,10 @@ def mark_unresolved(call_id):
 # route to get knowledge base
 @app.route('/knowledge', strict_slashes=False)
 def knowledge_base():
-    """View knowledge base entries"""
-    entries = KnowledgeBase.get_all()
-    return render_template('knowledge_base.html', entries=entries)
+    """View knowledge base entries, a page at a time"""
+    entries, next_cursor = paginate(knowledge_page, KNOWLEDGE_LIST_FIELDS)
+    return render_template('knowledge_base.html', entries=entries, next_cursor=next_cursor,
+                           is_first_page=not request.args.get('after'))
 
 # route to add to knowledge base
 @app.route('/knowledge/add', methods=['GET', 'POST'], strict_slashes=False)
@@ -130,11 +229,16 @@ def add_knowledge():
             return render_template('add_knowledge.html')
         
         KnowledgeBase.create(key_phrase, question, answer, created_by='supervisor')
+        cache.invalidate('knowledge')
         flash('Knowledge base entry added', 'success')
         return redirect(url_for('knowledge_base'))
     
     return render_template('add_knowledge.html')
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    # connect to Firestore while Flask starts up instead of on the first page load
+    if DB_BACKEND == 'firestore':
+        firebase.prewarm()
+    # every /events client holds a thread for as long as it is connected
+    app.run(debug=True, threaded=True)
  
\ No newline at end of file
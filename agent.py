@@ -1,33 +1,50 @@
 import asyncio
 import logging
+import os
+import time
 from datetime import datetime
 from typing import Optional
 from dataclasses import dataclass
 
 from dotenv import load_dotenv
-from livekit import api
-from livekit.api import ListParticipantsRequest
-from livekit.agents import (
-    Agent,
-    AgentSession,
-    JobContext,
-    RunContext,
-    RoomInputOptions,
-    RoomOutputOptions,
-    AudioConfig,
-    BackgroundAudioPlayer,
-    BuiltinAudioClip,
-    WorkerOptions,
-    get_job_context,
-    cli,
-)
-from livekit.agents.llm import function_tool
-from livekit.agents.stt import SpeechEvent
-from livekit.plugins import groq, silero
 
-# Your DB models and helper
-from db.models import Request, CallHistory
-from utils.help import needs_human_intervention
+from utils import startup
+
+with startup.timed("livekit_imports"):
+    from livekit import api
+    from livekit.api import ListParticipantsRequest
+    from livekit.agents import (
+        Agent,
+        AgentSession,
+        JobContext,
+        JobProcess,
+        RunContext,
+        RoomInputOptions,
+        RoomOutputOptions,
+        AudioConfig,
+        BackgroundAudioPlayer,
+        BuiltinAudioClip,
+        WorkerOptions,
+        get_job_context,
+        cli,
+    )
+    from livekit.agents.llm import ChatContext, ChatMessage, StopResponse, function_tool
+    from livekit.agents.stt import SpeechEvent
+    from livekit.agents.voice import MetricsCollectedEvent
+    from livekit.plugins import groq, silero
+
+# Your DB models and helper (the Firebase client itself is created lazily, see db/firebase.py)
+with startup.timed("app_imports"):
+    from db import firebase
+    from db.backends import DB_BACKEND
+    from db.models import Request, CallHistory
+    from db.outbox import commit_to_backend, start_write_behind
+    from utils.help import needs_human_intervention, start_pattern_watcher
+    from utils import knowledge
+    from utils import livekit_api
+    from utils.intents import FastPath
+    from utils.tts_cache import tts_cache
+    from utils import latency
 
 load_dotenv()
 logger = logging.getLogger("salon-agent")
@@ -41,6 +58,12 @@ SALON_INFO = {
     "services": ["hair styling", "manicure & pedicure", "facials", "makeup artistry"],
 }
 
+# said word for word on every call, so their audio comes from the TTS cache (utils/tts_cache.py)
+NAME_GREETING = "Hello, Welcome to Veluxe Beauty Lounge, can i know your name please"
+WELCOME = "Hello! Welcome to Veluxe Beauty Lounge. How can I assist you today?"
+GOODBYE = "Thank you for your time, have a wonderful day."
+FIXED_PHRASES = [NAME_GREETING, WELCOME, GOODBYE]
+
 # Instructions for the agent
 instructions = (
     f"Your name is Joy. You are a friendly and witty receptionist at {SALON_INFO['name']}. "
@@ -53,28 +76,67 @@ instructions = (
 class UserInfo:
     user_name: str | None = None
     call_record: CallHistory | None = None
+    fast_path: FastPath | None = None
+
+# how often the fallback list_participants poll runs; room events normally get there first
+DISCONNECT_POLL_INTERVAL = float(os.getenv("DISCONNECT_POLL_INTERVAL", "30"))
+
+
+class CallEnder:
+    """Ends a call record exactly once, whichever of the event, the poll or shutdown sees it first"""
+
+    def __init__(self, call_record: CallHistory):
+        self.call_record = call_record
+        self.started = time.perf_counter()
+        self.ended_by: Optional[str] = None
+        self.task: Optional[asyncio.Task] = None
+        self.api_calls = 0
+
+    def end(self, source: str, identity: str = "") -> None:
+        # sync on purpose: checking and setting ended_by can't interleave with another end()
+        if self.ended_by is not None:
+            return
+        self.ended_by = source
+        logger.info(f"Participant disconnected: {identity} (detected by {source})")
+        self.task = asyncio.get_running_loop().create_task(self.call_record.aend_call(escalated=False))
+
+    async def wait(self) -> None:
+        if self.task is not None:
+            await self.task
 
-async def monitor_disconnects(room_name: str, call_record: CallHistory, interval: float = 2.0):
+    def report(self) -> None:
+        seconds = time.perf_counter() - self.started
+        # the old loop called list_participants every 2 seconds for the whole call
+        logger.info(f"Call {self.call_record.id} ended by {self.ended_by} after {seconds:.0f}s, "
+                    f"{self.api_calls} list_participants calls (2s polling: ~{int(seconds / 2) + 1})")
+
+
+async def monitor_disconnects(ctx: JobContext, ender: CallEnder, interval: float = DISCONNECT_POLL_INTERVAL):
     """when our caller leaves, end the call and updates call history."""
-    prev = set()
-    async with api.LiveKitAPI() as lkapi:
-        res = await lkapi.room.list_participants(ListParticipantsRequest(room=room_name))
+    room = ctx.room
+
+    def on_participant_disconnected(participant):
+        ender.end("event", participant.identity)
+
+    room.on("participant_disconnected", on_participant_disconnected)
+    try:
         # I am assuming a single caller
-        prev = {p.identity for p in res.participants}
-
-    while True:
-        await asyncio.sleep(interval)
-        async with api.LiveKitAPI() as lkapi:
-            res = await lkapi.room.list_participants(ListParticipantsRequest(room=room_name))
-            current = {p.identity for p in res.participants}
-        gone = prev - current
-        if gone:
-            for identity in gone:
-                print(f"Participant disconnected: {identity}")
-            # End the call (no escalation here)
-            call_record.end_call(escalated=False)
-            break
-        prev = current
+        prev = {p.identity for p in room.remote_participants.values()}
+        while ender.ended_by is None:
+            await asyncio.sleep(interval)
+            if ender.ended_by is not None:
+                break
+            # fallback in case an event was missed (e.g. during a reconnect), on the shared pooled client
+            res = await livekit_api.get_livekit_api().room.list_participants(ListParticipantsRequest(room=room.name))
+            ender.api_calls += 1
+            current = {p.identity for p in res.participants if p.identity != room.local_participant.identity}
+            gone = prev - current
+            if gone:
+                ender.end("poll", ", ".join(gone))
+            prev = current
+        await ender.wait()
+    finally:
+        room.off("participant_disconnected", on_participant_disconnected)
 
 
 class BioCollector(Agent):
@@ -85,7 +147,7 @@ class BioCollector(Agent):
         )
 
     async def on_enter(self) -> None:
-        await self.session.say("Hello, Welcome to Veluxe Beauty Lounge, can i know your name please", allow_interruptions=False)
+        await tts_cache.say(self.session, NAME_GREETING, allow_interruptions=False)
         # Start disconnect monitor
 
     @function_tool()
@@ -109,19 +171,32 @@ class BioCollector(Agent):
     @function_tool()
     async def end_call(self, ctx: RunContext) -> None:
         """Use this tool to indicate when the user says bye or signify they want to end the call"""
-        await self.session.say("Thank you for your time, have a wonderful day.")
+        await tts_cache.say(self.session, GOODBYE)
         job_ctx = get_job_context()
         current_speech = ctx.session.current_speech
         if current_speech:
             await current_speech.wait_for_playout()
-        await job_ctx.api.room.delete_room(api.DeleteRoomRequest(room=job_ctx.room.name))
+        await livekit_api.get_livekit_api().room.delete_room(api.DeleteRoomRequest(room=job_ctx.room.name))
 
 class SalonAgent(Agent):
     def __init__(self):
         super().__init__(instructions=instructions)
     
     async def on_enter(self) -> None:
-        await self.session.say("Hello! Welcome to Veluxe Beauty Lounge. How can I assist you today?", allow_interruptions=False)
+        await tts_cache.say(self.session, WELCOME, allow_interruptions=False)
+
+    async def on_user_turn_completed(self, turn_ctx: ChatContext, new_message: ChatMessage) -> None:
+        # FAQ turns (hours, address, ...) are answered right here, no LLM round trip or tool call
+        fast_path = self.session.userdata.fast_path
+        answer = await fast_path.handle_turn(new_message.text_content or "") if fast_path else None
+        if answer is None:
+            return
+        # StopResponse drops the user's message too, keep it in the history for later turns
+        chat_ctx = self.chat_ctx.copy()
+        chat_ctx.items.append(new_message)
+        await self.update_chat_ctx(chat_ctx)
+        tts_cache.say(self.session, answer)
+        raise StopResponse()
         
     @function_tool(
         name="process_query",
@@ -135,69 +210,158 @@ class SalonAgent(Agent):
         Returns:
             str: The generated response to the user's question.
         """
-        call_record = context.userdata.call_history
-        phone = call_record.customer_phone
-        call_id = call_record.id
-        name = context.userdata.user_name
-
-        # first check if the customer's query needs human intervention
-        needs, reason = needs_human_intervention(query)
-        if needs:
-            req = Request.create(customer_phone=phone, query=query, call_id=call_id, category=reason)
-            logger.info(f"Escalation request created for {name}: {req.id}")
-            return "Let me check with my supervisor and get back to you."
+        # the whole tool call, including the database writes timed separately below
+        with latency.recorder.timed("tool.process_query"):
+            call_record = context.userdata.call_record
+            phone = call_record.customer_phone
+            call_id = call_record.id
+            name = context.userdata.user_name
 
-        # simple lookup
-        q = query.lower()
-        if "hours" in q:
-            return f"Our hours are {SALON_INFO['hours']}."
-        if "address" in q or "location" in q:
-            return f"We are located at {SALON_INFO['address']}."
-        if "phone" in q or "contact" in q:
-            return f"You can reach us at {SALON_INFO['phone']}."
-        if "services" in q or "offer" in q:
-            services_list = ", ".join(SALON_INFO["services"])
-            return f"At {SALON_INFO['name']}, we offer {services_list}."
-            
-        # unknown → general escalation
-        req = Request.create(customer_phone=phone, query=query, call_id=call_id, category="general")
-        logger.info(f"Pending request created: {req.id}")
-        return "Let me check with my supervisor and get back to you."
+            # first check if the customer's query needs human intervention
+            needs, reason = needs_human_intervention(query)
+            if needs:
+                with latency.recorder.timed("db.request_create"):
+                    req = await Request.acreate(customer_phone=phone, query=query, call_id=call_id, category=reason)
+                logger.info(f"Escalation request created for {name}: {req.id}")
+                return "Let me check with my supervisor and get back to you."
+
+            # simple lookup
+            q = query.lower()
+            if "hours" in q:
+                return f"Our hours are {SALON_INFO['hours']}."
+            if "address" in q or "location" in q:
+                return f"We are located at {SALON_INFO['address']}."
+            if "phone" in q or "contact" in q:
+                return f"You can reach us at {SALON_INFO['phone']}."
+            if "services" in q or "offer" in q:
+                services_list = ", ".join(SALON_INFO["services"])
+                return f"At {SALON_INFO['name']}, we offer {services_list}."
+
+            # answers supervisors already gave to similar questions
+            with latency.recorder.timed("kb.lookup"):
+                answer = await knowledge.lookup_learned_answer(query)
+            if answer:
+                return answer
+
+            # unknown → general escalation
+            with latency.recorder.timed("db.request_create"):
+                req = await Request.acreate(customer_phone=phone, query=query, call_id=call_id, category="general")
+            logger.info(f"Pending request created: {req.id}")
+            return "Let me check with my supervisor and get back to you."
 
     @function_tool()
     async def end_call(self, ctx: RunContext) -> None:
         """Use this tool to indicate when the user says bye or signify they want to end the call"""
-        await self.session.say("Thank you for your time, have a wonderful day.")
+        await tts_cache.say(self.session, GOODBYE)
         job_ctx = get_job_context()
         current_speech = ctx.session.current_speech
         if current_speech:
             await current_speech.wait_for_playout()
-        await job_ctx.api.room.delete_room(api.DeleteRoomRequest(room=job_ctx.room.name))
+        await livekit_api.get_livekit_api().room.delete_room(api.DeleteRoomRequest(room=job_ctx.room.name))
+
+
+def create_plugins() -> dict:
+    """VAD model and STT/LLM/TTS clients for an AgentSession"""
+    return {
+        "vad": silero.VAD.load(),
+        "stt": groq.STT(model="whisper-large-v3-turbo"),
+        "llm": groq.LLM(),
+        "tts": groq.TTS(model="playai-tts", voice="Arista-PlayAI"),
+    }
+
+
+def prewarm(proc: JobProcess):
+    # runs once per worker process before it takes jobs, so the Firestore channel,
+    # the VAD model and the plugin clients are ready by the time a call comes in
+    if DB_BACKEND == "firestore":
+        firebase.prewarm()
+    livekit_api.prewarm()
+    latency.start_server()
+    with startup.timed("tts_cache_load"):
+        tts_cache.prewarm()
+    with startup.timed("plugins_load"):
+        proc.userdata["plugins"] = create_plugins()
+    startup.log_report("prewarm")
 
 
 async def entrypoint(ctx: JobContext):
+    accepted = time.perf_counter()
+    # loaded once per process in prewarm; only a job without prewarm pays for it here
+    plugins = ctx.proc.userdata.get("plugins")
+    warm = plugins is not None
+    if not warm:
+        plugins = create_plugins()
+
+    # the API connection's TLS handshake happens while the room connects
+    warm_api = asyncio.create_task(livekit_api.warm(ctx.room.name))
     await ctx.connect()
     logger.info(f"Connected to room: {ctx.room.name}")
-    
-    # List participants in the room
-    async with api.LiveKitAPI() as lkapi:
-        res = await lkapi.room.list_participants(ListParticipantsRequest(
-            room=ctx.room.name
-        ))
-        print(f"Participants in room: {[p.identity for p in res.participants]}")
-        print(f"this is their sid: {[p.sid for p in res.participants]}")
-    
+
+    # keeps the escalation phrases current without restarting the worker
+    start_pattern_watcher()
+
+    # database writes are batched in the background so they never block a turn
+    write_queue = start_write_behind(commit=latency.recorder.timed_call("db.commit", commit_to_backend))
+
+    # a plain function: LiveKit passes the shutdown reason to callbacks that take an argument,
+    # and a bound method's `self` counts as one
+    async def flush_writes():
+        await write_queue.flush()
+    ctx.add_shutdown_callback(flush_writes)
+
+    # load learned answers into the in-memory search index without blocking the call
+    knowledge.refresh_index_if_stale()
+
+    # answers FAQ turns without the LLM, see utils/intents.py
+    fast_path = FastPath(SALON_INFO)
+
+    async def on_shutdown():
+        logger.info(f"Knowledge base lookups: {knowledge.stats.summary()}")
+        logger.info(f"Fast path: {fast_path.stats.summary()}")
+        logger.info(f"TTS cache: {tts_cache.stats.summary()}")
+        logger.info(f"Stage latency (ms, this worker): {latency.recorder.summary()}")
+    ctx.add_shutdown_callback(on_shutdown)
+
     agent = BioCollector()
     # Simulate extracting caller info 
     customer_phone = "+2348001234567"
-    call_record = CallHistory.create(customer_phone=customer_phone)
+    call_record = await CallHistory.acreate(customer_phone=customer_phone)
     call_id = call_record.id
     logger.info(f"Call started: {call_id}") 
+    startup.log_report("first call")
 
-    asyncio.create_task(monitor_disconnects(ctx.room.name, call_record))
+    ender = CallEnder(call_record)
+    monitor = asyncio.create_task(monitor_disconnects(ctx, ender))
+
+    async def finish_call():
+        # the room can close without a disconnect event reaching us; end the record anyway
+        monitor.cancel()
+        # wait for it to stop, a poll in flight would otherwise still be using the API client
+        await asyncio.gather(monitor, return_exceptions=True)
+        ender.end("shutdown")
+        await ender.wait()
+        ender.report()
+        # shutdown callbacks run in order and the flush above already ran
+        await write_queue.flush()
+    ctx.add_shutdown_callback(finish_call)
+
+    # shutdown callbacks run in order: registered after finish_call, this closes the client only
+    # once the monitor is stopped, so its fallback poll can't open a new one
+    async def close_api():
+        logger.info(f"LiveKit API calls: {livekit_api.stats.summary()}")
+        await livekit_api.close_livekit_api()
+    ctx.add_shutdown_callback(close_api)
+
+    # List participants in the room
+    await warm_api
+    res = await livekit_api.get_livekit_api().room.list_participants(ListParticipantsRequest(
+        room=ctx.room.name
+    ))
+    print(f"Participants in room: {[p.identity for p in res.participants]}")
+    print(f"this is their sid: {[p.sid for p in res.participants]}")
 
     # set the call record in the user data
-    user_info = UserInfo(call_record=call_record)
+    user_info = UserInfo(call_record=call_record, fast_path=fast_path)
 
     # Custom STT node to log user speech
     async def custom_stt_node(self, audio, settings):
@@ -210,15 +374,14 @@ async def entrypoint(ctx: JobContext):
     agent.stt_node = custom_stt_node.__get__(agent, Agent)
 
     # Building session
-    session = AgentSession[UserInfo](
-        vad=silero.VAD.load(),
-        stt=groq.STT(model="whisper-large-v3-turbo"),
-        llm=groq.LLM(),
-        tts=groq.TTS(
-            model="playai-tts",
-            voice="Arista-PlayAI"),
-        userdata=user_info,
-    )
+    session = AgentSession[UserInfo](**plugins, userdata=user_info)
+    startup.log_first_audio(session, accepted, warm)
+    fast_path.attach(session)
+
+    # VAD/STT/LLM/TTS timings per turn, exported at /metrics (see utils/latency.py)
+    @session.on("metrics_collected")
+    def record_metrics(ev: MetricsCollectedEvent):
+        latency.recorder.record_metrics(ev.metrics)
 
     # Start the conversation
     await session.start(
@@ -238,7 +401,16 @@ async def entrypoint(ctx: JobContext):
     )
     await background_audio.start(room=ctx.room, agent_session=session)
 
+    # synthesize any fixed phrase this worker hasn't cached yet (the greeting is already playing, and stored after)
+    warm_tts = asyncio.create_task(tts_cache.warm(plugins["tts"], FIXED_PHRASES))
+
+    # a phrase cut off here is just synthesized again on the next call (it uses the TTS, not the API client)
+    async def stop_warming():
+        warm_tts.cancel()
+        await asyncio.gather(warm_tts, return_exceptions=True)
+    ctx.add_shutdown_callback(stop_warming)
+
   
 
 if __name__ == "__main__":
-    cli.run_app(WorkerOptions(entrypoint_fnc=entrypoint))
\ No newline at end of file
+    cli.run_app(WorkerOptions(entrypoint_fnc=entrypoint, prewarm_fnc=prewarm))
\ No newline at end of file
@@ -0,0 +1,181 @@
+import math
+import os
+import re
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Optional
+
+# prompt tokens per request: system prompt, summary, kept turns and the new question.
+# llama3-8b-8192 has 8192 in total, the rest is left for the answer
+MEMORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "4096"))
+# 'summarize' keeps a short extractive summary of turns that no longer fit, 'drop' forgets them
+MEMORY_POLICY = os.getenv("MEMORY_POLICY", "summarize")
+MEMORY_SUMMARY_TOKENS = int(os.getenv("MEMORY_SUMMARY_TOKENS", "300"))
+# a tokenizer.json matching the model (e.g. Llama 3's); without one tokens are estimated
+MEMORY_TOKENIZER = os.getenv("MEMORY_TOKENIZER")
+
+# role header and end of turn tokens the chat template adds around every message
+MESSAGE_OVERHEAD = 4
+SUMMARY_WORDS = 20
+PIECE_RE = re.compile(r"[A-Za-z]+|\d{1,3}|[^\sA-Za-z\d]")
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+class EstimateCounter:
+    """Dependency-free token estimate, on the high side for English so the budget holds.
+
+    Counts words, 3-digit number groups and punctuation like a BPE tokenizer would,
+    with long words split roughly every 6 letters.
+    """
+    name = "estimate"
+
+    def count(self, text: str) -> int:
+        return sum(math.ceil(len(piece) / 6) if piece[0].isalpha() else 1 for piece in PIECE_RE.findall(text))
+
+
+class TokenizerCounter:
+    """Exact counts from a local tokenizer.json through the tokenizers library"""
+
+    def __init__(self, path: str):
+        from tokenizers import Tokenizer
+
+        self._tokenizer = Tokenizer.from_file(path)
+        self.name = f"tokenizer:{os.path.basename(path)}"
+
+    def count(self, text: str) -> int:
+        return len(self._tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+_counter = None
+
+
+def get_counter():
+    """The tokenizer counter when MEMORY_TOKENIZER is set, otherwise the estimate (made once)"""
+    global _counter
+    if _counter is None:
+        _counter = TokenizerCounter(MEMORY_TOKENIZER) if MEMORY_TOKENIZER else EstimateCounter()
+    return _counter
+
+
+@dataclass
+class Turn:
+    role: str
+    content: str
+    tokens: int  # counted once when added, including MESSAGE_OVERHEAD
+
+
+def _gist(text: str) -> str:
+    """First sentence, at most SUMMARY_WORDS words"""
+    words = SENTENCE_RE.split(text.strip(), maxsplit=1)[0].split()
+    gist = " ".join(words[:SUMMARY_WORDS])
+    return gist + "..." if len(words) > SUMMARY_WORDS else gist
+
+
+class ConversationMemory:
+    """Chat history that fits a token budget.
+
+    Recent turns are sent verbatim. When a request would go over the budget the
+    oldest exchanges are moved out: with the 'summarize' policy each becomes one
+    line of a running summary (capped at summary_tokens, oldest lines go first),
+    with 'drop' they are just forgotten. Everything held is bounded by the budget.
+    """
+
+    def __init__(self, budget: int = MEMORY_TOKEN_BUDGET, policy: str = MEMORY_POLICY,
+                 summary_tokens: int = MEMORY_SUMMARY_TOKENS, counter=None):
+        if policy not in ("summarize", "drop"):
+            raise ValueError(f"Unknown memory policy {policy!r}, use 'summarize' or 'drop'")
+        self.budget = budget
+        self.policy = policy
+        self.summary_tokens = summary_tokens
+        self.counter = counter or get_counter()
+        self.turns: Deque[Turn] = deque()
+        self.summary: Deque[Turn] = deque()  # one line per compacted exchange
+        self.compacted = 0
+        self.dropped = 0
+        self.last_request_tokens = 0
+        self._system_prompt: Optional[str] = None
+        self._system_tokens = 0
+
+    def _turn(self, role: str, content: str) -> Turn:
+        return Turn(role, content, self.counter.count(content) + MESSAGE_OVERHEAD)
+
+    def add(self, role: str, content: str) -> None:
+        self.turns.append(self._turn(role, content))
+
+    @property
+    def history(self) -> List[Dict[str, str]]:
+        """The turns still held verbatim, as chat messages"""
+        return [{"role": turn.role, "content": turn.content} for turn in self.turns]
+
+    def _summary_message(self) -> Optional[str]:
+        if not self.summary:
+            return None
+        return "Summary of earlier turns in this call:\n" + "\n".join(line.content for line in self.summary)
+
+    def _summary_cost(self) -> int:
+        if not self.summary:
+            return 0
+        # the header line plus the lines themselves (their overhead stands in for the newlines)
+        return sum(line.tokens for line in self.summary) + 8 + MESSAGE_OVERHEAD
+
+    def _evict(self) -> None:
+        """Move the oldest exchange (a user turn and the replies up to the next one) out"""
+        exchange = [self.turns.popleft()]
+        while self.turns and self.turns[0].role != "user":
+            exchange.append(self.turns.popleft())
+        if self.policy == "drop":
+            self.dropped += 1
+            return
+        said = [f"{'Caller' if turn.role == 'user' else 'You'}: {_gist(turn.content)}" for turn in exchange]
+        self.summary.append(self._turn("system", " / ".join(said)))
+        self.compacted += 1
+        while self.summary and self._summary_cost() > self.summary_tokens:
+            self.summary.popleft()
+            self.dropped += 1
+
+    def _fit_last(self, room: int) -> None:
+        """The newest turn alone is over the budget: cut its text down to what fits"""
+        last = self.turns[-1]
+        keep = max(1, int(len(last.content) * max(room - MESSAGE_OVERHEAD, 1) / (last.tokens - MESSAGE_OVERHEAD or 1)))
+        while keep > 1:
+            self.turns[-1] = self._turn(last.role, last.content[:keep])
+            if self.turns[-1].tokens <= room:
+                return
+            keep = int(keep * 0.9)
+
+    def messages(self, system_prompt: str) -> List[Dict[str, str]]:
+        """Messages for the next request, compacting history until they fit the budget"""
+        if system_prompt != self._system_prompt:
+            # counted again only when the salon info changes
+            self._system_prompt = system_prompt
+            self._system_tokens = self.counter.count(system_prompt) + MESSAGE_OVERHEAD
+
+        def total() -> int:
+            return self._system_tokens + self._summary_cost() + sum(turn.tokens for turn in self.turns)
+
+        # always keep the newest exchange, it holds the question being asked
+        while total() > self.budget and len(self.turns) > 1 and any(
+                turn.role == "user" for turn in list(self.turns)[1:]):
+            self._evict()
+        while total() > self.budget and self.summary:
+            self.summary.popleft()
+            self.dropped += 1
+        if self.turns and total() > self.budget:
+            self._fit_last(self.budget - total() + self.turns[-1].tokens)
+
+        messages = [{"role": "system", "content": system_prompt}]
+        summary = self._summary_message()
+        if summary:
+            messages.append({"role": "system", "content": summary})
+        messages.extend(self.history)
+        self.last_request_tokens = total()
+        return messages
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "turns": len(self.turns),
+            "summary_lines": len(self.summary),
+            "compacted": self.compacted,
+            "dropped": self.dropped,
+            "last_request_tokens": self.last_request_tokens,
+        }
@@ -7,65 +7,205 @@
 ###############################################################
 
 
-from groq import AsyncGroq
+from groq import AsyncGroq, DefaultAsyncHttpxClient
+import asyncio
+import httpx
 import os, sys
 import json
-from typing import Dict, Any, Tuple
+import threading
+from dataclasses import dataclass
+from typing import Dict, Any, Optional, Tuple
+from cachetools import TTLCache
 from dotenv import load_dotenv
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from db.models import Request
+from ai.memory import ConversationMemory
+from db.models import CallHistory, Request
 
 load_dotenv()
 
+# conversations of calls that have gone quiet are dropped after this many seconds
+ASSISTANT_IDLE_TTL = float(os.getenv("ASSISTANT_IDLE_TTL", "1800"))
+ASSISTANT_CACHE_SIZE = int(os.getenv("ASSISTANT_CACHE_SIZE", "1000"))
+# one pooled client per process, connections kept open between queries
+GROQ_MAX_CONNECTIONS = int(os.getenv("GROQ_MAX_CONNECTIONS", "50"))
+GROQ_KEEPALIVE = float(os.getenv("GROQ_KEEPALIVE", "60"))
+
+
+def build_system_prompt(business_info: Dict[str, Any]) -> str:
+    """Creates a strictly‐constrained system prompt based on the salon data."""
+    # Dump the complete salon_info JSON
+    data = json.dumps(business_info, indent=2)
+
+    return (
+        f"You are the AI assistant for {business_info['name']}.\n"
+        "You must use **only** the information between <<<JSON>>> and <<<END JSON>>>\n"
+        "Do NOT add, infer, or invent any details not present in that data.\n"
+        "If asked about anything outside that data, respond exactly:\n"
+        "I am not sure\n\n"
+        "<<<JSON>>>\n"
+        f"{data}\n"
+        "<<<END JSON>>>"
+    )
+
+
+@dataclass(frozen=True)
+class SalonProfile:
+    """A parsed salon info file and the system prompt rendered from it"""
+    path: str
+    info: Dict[str, Any]
+    system_prompt: str
+    mtime_ns: int
+
+
+_profiles: Dict[str, SalonProfile] = {}
+_profiles_lock = threading.Lock()
+
+
+def _parse_salon_info(path: str) -> Dict[str, Any]:
+    with open(path, 'r', encoding='utf-8') as f:
+        # salon.json starts with a // note, which json itself won't take
+        return json.loads("".join(line for line in f if not line.lstrip().startswith("//")))
+
+
+def load_salon_profile(path: str) -> SalonProfile:
+    """The salon info at path, parsed once and re-read only when the file changes"""
+    mtime_ns = os.stat(path).st_mtime_ns
+    profile = _profiles.get(path)
+    if profile is not None and profile.mtime_ns == mtime_ns:
+        return profile
+    with _profiles_lock:
+        profile = _profiles.get(path)
+        if profile is None or profile.mtime_ns != mtime_ns:
+            info = _parse_salon_info(path)
+            profile = SalonProfile(path=path, info=info, system_prompt=build_system_prompt(info), mtime_ns=mtime_ns)
+            _profiles[path] = profile
+    return profile
+
+
+# httpx connections belong to the loop that opened them, so one client per loop
+_clients: Dict[asyncio.AbstractEventLoop, AsyncGroq] = {}
+
+
+def get_groq_client() -> AsyncGroq:
+    """The shared AsyncGroq client for the running loop, created on first use. Don't close it."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is not None and not client.is_closed():
+        return client
+    for old in [old for old in _clients if old.is_closed()]:
+        del _clients[old]
+    client = AsyncGroq(
+        api_key=os.getenv('GROQ_API_KEY'),
+        http_client=DefaultAsyncHttpxClient(limits=httpx.Limits(
+            max_connections=GROQ_MAX_CONNECTIONS,
+            max_keepalive_connections=GROQ_MAX_CONNECTIONS,
+            keepalive_expiry=GROQ_KEEPALIVE,
+        )),
+    )
+    _clients[loop] = client
+    return client
+
+
+async def close_groq_client() -> None:
+    """Close the client of the running loop (at shutdown)"""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.close()
+
 
 class SalonAIAssistant:
     """Salon AI Assistant that uses Groq for responses"""
-    def __init__(self, business_info):
+    def __init__(self, business_info, client: Optional[AsyncGroq] = None, system_prompt: Optional[str] = None):
         self.business_info = business_info
-        self.system_prompt = self._build_system_prompt()
-        self.client = AsyncGroq(api_key=os.getenv('GROQ_API_KEY'))
-        self.message_history = []  # Initialize conversation history
+        self.system_prompt = system_prompt or self._build_system_prompt()
+        self._client = client  # None means the shared pooled client
+        self.memory = ConversationMemory()  # conversation history, kept under the token budget
+        # one turn at a time, so overlapping queries of a call don't interleave the history
+        self._turn_lock = asyncio.Lock()
+
+    @property
+    def client(self) -> AsyncGroq:
+        return self._client or get_groq_client()
 
+    @property
+    def message_history(self):
+        return self.memory.history
 
     def _build_system_prompt(self):
-        """Creates a strictly‐constrained system prompt based on the salon data."""
-        # Dump the complete salon_info JSON
-        data = json.dumps(self.business_info, indent=2)
-
-        return (
-            f"You are the AI assistant for {self.business_info['name']}.\n"
-            "You must use **only** the information between <<<JSON>>> and <<<END JSON>>>\n"
-            "Do NOT add, infer, or invent any details not present in that data.\n"
-            "If asked about anything outside that data, respond exactly:\n"
-            "I am not sure\n\n"
-            "<<<JSON>>>\n"
-            f"{data}\n"
-            "<<<END JSON>>>"
-        )
+        return build_system_prompt(self.business_info)
+
+    def use_profile(self, profile: SalonProfile) -> None:
+        """Switch to updated salon info, keeping the conversation so far"""
+        self.business_info = profile.info
+        self.system_prompt = profile.system_prompt
 
 
     async def get_response(self, user_prompt):
         """Asks Groq and returns the smart salon response while maintaining conversation history."""
-        # Add the user's message to the history
-        self.message_history.append({"role": "user", "content": user_prompt})
+        async with self._turn_lock:
+            # Add the user's message to the history
+            self.memory.add("user", user_prompt)
+
+            # System prompt, summary of older turns and the recent ones, within the token budget
+            messages = self.memory.messages(self.system_prompt)
+
+            # Get the response from the AI model
+            response = await self.client.chat.completions.create(
+                model="llama3-8b-8192",  # or another Groq model like "mixtral-8x7b-32768"
+                messages=messages,
+                temperature=0.0,
+            )
 
-        # Include the system prompt and message history in the request
-        messages = [{"role": "system", "content": self.system_prompt}] + self.message_history
+            # Extract the assistant's response
+            assistant_response = response.choices[0].message.content
 
-        # Get the response from the AI model
-        response = await self.client.chat.completions.create(
-            model="llama3-8b-8192",  # or another Groq model like "mixtral-8x7b-32768"
-            messages=messages,
-            temperature=0.0,
-        )
+            # Add the assistant's response to the history
+            self.memory.add("assistant", assistant_response)
 
-        # Extract the assistant's response
-        assistant_response = response.choices[0].message.content
+            return assistant_response
 
-        # Add the assistant's response to the history
-        self.message_history.append({"role": "assistant", "content": assistant_response})
 
-        return assistant_response
+class AssistantRegistry:
+    """Long-lived assistants, one per (salon info file, call_id).
+
+    Idle conversations expire after ttl seconds, and at most maxsize are kept, so
+    calls that never say goodbye don't pile up. Queries without a call_id get a
+    fresh assistant, but still share the parsed info and the pooled client.
+    """
+
+    def __init__(self, maxsize: int = ASSISTANT_CACHE_SIZE, ttl: float = ASSISTANT_IDLE_TTL):
+        self._assistants = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def get(self, path: str, call_id: Optional[str] = None) -> SalonAIAssistant:
+        profile = load_salon_profile(path)
+        if call_id is None:
+            return SalonAIAssistant(profile.info, system_prompt=profile.system_prompt)
+        key = (path, call_id)
+        with self._lock:
+            assistant = self._assistants.get(key)
+            if assistant is None:
+                assistant = SalonAIAssistant(profile.info, system_prompt=profile.system_prompt)
+            elif assistant.business_info is not profile.info:
+                assistant.use_profile(profile)
+            # setting it again restarts the idle timer
+            self._assistants[key] = assistant
+        return assistant
+
+    def end_call(self, call_id: str) -> None:
+        """Forget a finished call's conversation"""
+        with self._lock:
+            for key in [key for key in self._assistants if key[1] == call_id]:
+                self._assistants.pop(key, None)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._assistants)
+
+
+assistants = AssistantRegistry()
+# a finished call's conversation is dropped right away instead of waiting for the idle TTL
+CallHistory.on_end(assistants.end_call)
 
 
 async def process_salon_query(query: str, call_id: str = None, customer_phone: str = None) -> Tuple[str, bool]:
@@ -74,11 +214,9 @@ async def process_salon_query(query: str, call_id: str = None, customer_phone: s
     Returns the response and a boolean indicating if escalation is needed
     """
 
-    salon_info = os.getenv('SALON_INFO_PATH')
-    with open(salon_info, 'r') as f:
-        salon_data = json.load(f)   
-    assistant = SalonAIAssistant(salon_data)
-    
+    # same assistant (and history) for every turn of a call, info file parsed once
+    assistant = assistants.get(os.getenv('SALON_INFO_PATH'), call_id)
+
     # Get response from Groq-powered assistant
     response = await assistant.get_response(query)
     
@@ -87,6 +225,6 @@ async def process_salon_query(query: str, call_id: str = None, customer_phone: s
     
     # If we need to escalate and have call tracking info, create a request
     if needs_escalation and call_id and customer_phone:
-        Request.create(customer_phone, query, call_id, category="general")  # default category is general when ai canot answer
+        await Request.acreate(customer_phone, query, call_id, category="general")  # default category is general when ai canot answer
     
     return response, needs_escalation
@@ -0,0 +1,215 @@
+"""
+Local stand-ins for the Groq STT/LLM/TTS plugins and the room's audio output.
+
+They take the same code paths in AgentSession as the real plugins (streams, metrics,
+tool calls) but answer after a configurable latency, seeded so runs are repeatable.
+The caller side of a conversation is a Caller: it speaks the next scripted line once
+the agent stops talking, and the FakeSTT "hears" it.
+"""
+import asyncio
+import json
+import random
+import time
+from typing import List, Optional
+
+from livekit import rtc
+from livekit.agents import DEFAULT_API_CONNECT_OPTIONS, NOT_GIVEN, APIConnectOptions, llm, stt, tts, utils
+from livekit.agents.llm.tool_context import get_function_info
+from livekit.agents.voice import io
+
+
+class Latency:
+    """Delay distribution in milliseconds, "mean" or "mean:jitter" (normal, never below zero)"""
+
+    def __init__(self, mean_ms: float, jitter_ms: float = 0.0, seed: int = 0):
+        self.mean_ms = mean_ms
+        self.jitter_ms = jitter_ms
+        self._rng = random.Random(seed)
+
+    @classmethod
+    def parse(cls, spec: str, seed: int = 0) -> "Latency":
+        mean, _, jitter = spec.partition(":")
+        return cls(float(mean), float(jitter or 0), seed)
+
+    def seconds(self) -> float:
+        return max(0.0, self._rng.gauss(self.mean_ms, self.jitter_ms)) / 1000
+
+
+class Caller:
+    """Scripted caller: says the next line after the agent finishes speaking and records turn latency"""
+
+    def __init__(self, script: List[str], think: Latency, turn_timeout: float = 15.0):
+        self.script = script
+        self.think = think
+        self.turn_timeout = turn_timeout
+        self.utterances: asyncio.Queue = asyncio.Queue()
+        # end of the caller's speech to the agent starting to answer, per turn
+        self.latencies: List[float] = []
+        self.timeouts = 0
+        self._spoke_at: Optional[float] = None
+        self._done_speaking = asyncio.Event()
+
+    def attach(self, session) -> None:
+        session.on("agent_state_changed", self._on_state_changed)
+
+    def _on_state_changed(self, ev) -> None:
+        if ev.new_state == "speaking" and self._spoke_at is not None:
+            self.latencies.append((time.perf_counter() - self._spoke_at) * 1000)
+            self._spoke_at = None
+        if ev.old_state == "speaking" and ev.new_state == "listening":
+            self._done_speaking.set()
+
+    async def _wait_for_agent(self) -> None:
+        try:
+            await asyncio.wait_for(self._done_speaking.wait(), self.turn_timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+        self._done_speaking.clear()
+
+    async def run(self) -> None:
+        for line in self.script:
+            await self._wait_for_agent()
+            await asyncio.sleep(self.think.seconds())
+            self._spoke_at = time.perf_counter()
+            self.utterances.put_nowait(line)
+        await self._wait_for_agent()
+
+
+class FakeSTT(stt.STT):
+    """Streaming STT that returns the caller's lines as final transcripts after a delay"""
+
+    def __init__(self, caller: Caller, latency: Latency):
+        super().__init__(capabilities=stt.STTCapabilities(streaming=True, interim_results=False))
+        self.caller = caller
+        self.latency = latency
+
+    async def _recognize_impl(self, buffer, *, language=NOT_GIVEN, conn_options=DEFAULT_API_CONNECT_OPTIONS):
+        return stt.SpeechEvent(type=stt.SpeechEventType.FINAL_TRANSCRIPT, alternatives=[stt.SpeechData(language="en", text="")])
+
+    def stream(self, *, language=NOT_GIVEN, conn_options: APIConnectOptions = DEFAULT_API_CONNECT_OPTIONS):
+        return FakeRecognizeStream(stt=self, conn_options=conn_options)
+
+
+class FakeRecognizeStream(stt.RecognizeStream):
+    async def _run(self) -> None:
+        # there is no audio input in a load run, the transcript comes from the caller script
+        while True:
+            text = await self._stt.caller.utterances.get()
+            await asyncio.sleep(self._stt.latency.seconds())
+            self._event_ch.send_nowait(stt.SpeechEvent(
+                type=stt.SpeechEventType.FINAL_TRANSCRIPT,
+                alternatives=[stt.SpeechData(language="en", text=text)],
+            ))
+
+
+def respond(chat_ctx: llm.ChatContext, tool_names: List[str]) -> dict:
+    """What a well-behaved model would do next with the agents' tools: a tool call or some text"""
+    last = chat_ctx.items[-1] if chat_ctx.items else None
+    if last is not None and last.type == "function_call_output":
+        return {"text": last.output or "All done."}
+    if last is not None and last.type == "message" and last.role == "user":
+        said = last.text_content or ""
+        if "record_name" in tool_names:
+            return {"tool": "record_name", "arguments": {"name": said.split()[-1] if said else "Guest"}}
+        if "process_query" in tool_names:
+            return {"tool": "process_query", "arguments": {"query": said}}
+    return {"text": "How can I help you today?"}
+
+
+class FakeLLM(llm.LLM):
+    """Replies per respond() after a time to first token, then streams words"""
+
+    def __init__(self, ttft: Latency, tokens_per_second: float = 60.0):
+        super().__init__()
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+
+    def chat(self, *, chat_ctx, tools=None, conn_options=DEFAULT_API_CONNECT_OPTIONS,
+             parallel_tool_calls=NOT_GIVEN, tool_choice=NOT_GIVEN, extra_kwargs=NOT_GIVEN):
+        return FakeLLMStream(self, chat_ctx=chat_ctx, tools=tools or [], conn_options=conn_options)
+
+
+class FakeLLMStream(llm.LLMStream):
+    async def _run(self) -> None:
+        await asyncio.sleep(self._llm.ttft.seconds())
+        request_id = utils.shortuuid("fake_")
+        reply = respond(self._chat_ctx, [get_function_info(tool).name for tool in self._tools])
+        if "tool" in reply:
+            call = llm.FunctionToolCall(name=reply["tool"], arguments=json.dumps(reply["arguments"]),
+                                        call_id=utils.shortuuid("call_"))
+            self._event_ch.send_nowait(llm.ChatChunk(id=request_id, delta=llm.ChoiceDelta(role="assistant", tool_calls=[call])))
+            return
+        for i, word in enumerate(reply["text"].split(" ")):
+            if i:
+                await asyncio.sleep(1 / self._llm.tokens_per_second)
+            self._event_ch.send_nowait(llm.ChatChunk(
+                id=request_id, delta=llm.ChoiceDelta(role="assistant", content=word if i == 0 else f" {word}")))
+
+
+class FakeTTS(tts.TTS):
+    """Silence as long as the text would take to say, first frame after a time to first byte"""
+
+    def __init__(self, ttfb: Latency, sample_rate: int = 24000, ms_per_char: float = 60.0):
+        super().__init__(capabilities=tts.TTSCapabilities(streaming=False), sample_rate=sample_rate, num_channels=1)
+        self.ttfb = ttfb
+        self.ms_per_char = ms_per_char
+        self._samples = sample_rate // 50
+        self._silence = bytes(self._samples * 2)
+
+    def synthesize(self, text: str, *, conn_options: Optional[APIConnectOptions] = None):
+        return FakeChunkedStream(tts=self, input_text=text, conn_options=conn_options)
+
+
+class FakeChunkedStream(tts.ChunkedStream):
+    async def _run(self) -> None:
+        fake = self._tts
+        await asyncio.sleep(fake.ttfb.seconds())
+        request_id = utils.shortuuid("fake_")
+        frames = max(1, int(len(self._input_text) * fake.ms_per_char / 20))
+        for i in range(frames):
+            frame = rtc.AudioFrame(fake._silence, fake.sample_rate, 1, fake._samples)
+            self._event_ch.send_nowait(tts.SynthesizedAudio(frame=frame, request_id=request_id))
+            if i % 50 == 49:
+                await asyncio.sleep(0)  # a real client yields between network reads
+
+
+class FakeAudioOutput(io.AudioOutput):
+    """Stands in for the room: audio "plays" for its duration divided by speed"""
+
+    def __init__(self, speed: float = 1.0):
+        super().__init__(next_in_chain=None, sample_rate=None)
+        self.speed = speed
+        self._pushed = 0.0
+        self._started = 0.0
+        self._capturing = False
+        self._handle: Optional[asyncio.TimerHandle] = None
+
+    async def capture_frame(self, frame: rtc.AudioFrame) -> None:
+        await super().capture_frame(frame)
+        if not self._capturing:
+            self._capturing = True
+            self._pushed = 0.0
+            self._started = time.monotonic()
+        self._pushed += frame.duration
+
+    def flush(self) -> None:
+        super().flush()
+        if not self._capturing:
+            return
+        self._capturing = False
+        remaining = max(0.0, self._pushed / self.speed - (time.monotonic() - self._started))
+        self._handle = asyncio.get_running_loop().call_later(remaining, self._finished, False)
+
+    def clear_buffer(self) -> None:
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        if self._capturing or self._pushed:
+            self._capturing = False
+            self._finished(True)
+
+    def _finished(self, interrupted: bool) -> None:
+        played = min(self._pushed, (time.monotonic() - self._started) * self.speed)
+        self._pushed = 0.0
+        self._handle = None
+        self.on_playback_finished(playback_position=played, interrupted=interrupted)
@@ -0,0 +1,292 @@
+"""
+Benchmarks for the code that runs on every turn, checked against a stored baseline.
+
+Times escalation matching (cold and warm, short to long transcripts), the keyword
+routing in agent.py's SalonAgent.process_query and main.py's _lookup_answer,
+KnowledgeBase.search on the in-memory backend at growing corpus sizes, and the model
+constructor/to_dict round trips. Each result is the median of several repeats, in
+microseconds per call, with the interquartile range of the repeats as its noise.
+--save times the suite --rounds times and stores how far apart the runs landed as
+each path's noise. Compared to benchmarks/baseline.json, a path fails the run (exit
+code 1) when it is slower by more than --threshold percent and by more than its
+noise allows (--noise times the spread of the baseline and this run, at least
+--floor microseconds), and is still that slow when its group is timed again
+(--confirm times). Timings are first scaled by a fixed calibration loop timed in
+both runs, so a machine that is slower today than when the baseline was saved
+doesn't fail it. Run from the project root:
+
+    python benchmarks/hot_paths.py
+    python benchmarks/hot_paths.py --save          # record a new baseline on this machine
+    python benchmarks/hot_paths.py --only search --threshold 40
+
+The baseline is machine specific: record one on the machine that runs the checks.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import timeit
+from types import SimpleNamespace
+from typing import Dict, Tuple
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+
+os.environ.setdefault("DB_BACKEND", "memory")
+os.environ.setdefault("ESCALATION_CSV_PATH", os.path.join(ROOT, "db", "engine", "help.csv"))
+os.environ.setdefault("METRICS_ENABLED", "0")
+
+import agent
+import main as main_agent
+from db.backends import create_backend, set_backend
+from db.models import CallHistory, KnowledgeBase, Request
+from utils import help
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+DEFAULT_THRESHOLD = float(os.getenv("BENCH_THRESHOLD", "25"))
+# slowdowns smaller than this many microseconds are noise whatever the percentage
+DEFAULT_FLOOR_US = float(os.getenv("BENCH_FLOOR_US", "0.5"))
+# a slowdown must also be this many times the spread of the baseline and current runs
+DEFAULT_NOISE = float(os.getenv("BENCH_NOISE", "1"))
+# times a flagged group is run again, it only fails if every run is still slow
+DEFAULT_CONFIRM = int(os.getenv("BENCH_CONFIRM", "2"))
+DEFAULT_SAVE_ROUNDS = 3
+
+TEXTS = {
+    "short": "what are your hours",
+    "medium": "hi there, I booked a manicure last week and wanted to know if you also do pedicures "
+              "for kids, and whether I can bring my daughter along on saturday afternoon",
+    "long": "so I was in the salon on tuesday and the stylist was lovely but the colour came out a bit "
+            "different from the photo I showed her, not a big deal, I just wanted to ask if you offer "
+            "a touch up or what you would suggest before my sister's wedding next month " * 6,
+}
+ROUTING_QUERIES = ["what are your hours", "where is your location", "what is your phone number",
+                   "what services do you offer"]
+CORPUS_SIZES = (100, 1000, 10000)
+# every repeat runs at least this long, so one scheduler hiccup can't decide a tiny path
+MIN_REPEAT_SECONDS = 0.05
+REPEATS = 15
+
+# (median, interquartile range) of the per-call times of the repeats, in microseconds
+Timing = Tuple[float, float]
+
+
+def spread(per_call: list) -> Timing:
+    quartiles = statistics.quantiles(per_call, n=4)
+    return statistics.median(per_call), quartiles[2] - quartiles[0]
+
+
+def per_item(timing: Timing, items: int) -> Timing:
+    return timing[0] / items, timing[1] / items
+
+
+def time_us(func, number: int, repeat: int = REPEATS) -> Timing:
+    """Median time per call of func over the repeats and their spread, in microseconds"""
+    once = timeit.timeit(func, number=number)
+    if once < MIN_REPEAT_SECONDS:
+        number = int(number * MIN_REPEAT_SECONDS / max(once, 1e-9)) + 1
+    return spread([total / number * 1e6 for total in timeit.repeat(func, number=number, repeat=repeat)])
+
+
+def calibrate() -> float:
+    """Time of a fixed pure-Python workload (string, dict and list work like the hot paths)"""
+    words = ("what are your hours do you do braids and nails on saturday " * 4).split()
+
+    def workload():
+        counts = {}
+        for word in words:
+            counts[word.lower()] = counts.get(word, 0) + 1
+        return sorted(counts.items(), key=lambda item: -item[1])[:5]
+    # the fastest repeat: what the machine can do, whatever else is running
+    once = timeit.timeit(workload, number=2000)
+    number = max(2000, int(2000 * MIN_REPEAT_SECONDS / max(once, 1e-9)) + 1)
+    return min(timeit.repeat(workload, number=number, repeat=9)) / number * 1e6
+
+
+def time_us_async(make_coro, number: int, repeat: int = REPEATS) -> Timing:
+    async def run() -> list:
+        per_call = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(number):
+                await make_coro()
+            per_call.append((time.perf_counter() - start) / number * 1e6)
+        return per_call
+    return spread(asyncio.run(run()))
+
+
+def bench_escalation(results: Dict[str, Timing]) -> None:
+    def cold():
+        # what the first transcript of a worker pays: reading the CSV and building the matcher
+        help._index, help._patterns_initialized = None, False
+        help.needs_human_intervention(TEXTS["short"])
+    results["escalation.cold"] = time_us(cold, number=1, repeat=10)
+
+    help.initialize_patterns()
+    for name, text in TEXTS.items():
+        results[f"escalation.warm.{name}"] = time_us(lambda: help.needs_human_intervention(text), number=2000)
+
+
+def bench_routing(results: Dict[str, Timing]) -> None:
+    salon = agent.SalonAgent()
+    context = SimpleNamespace(userdata=SimpleNamespace(
+        call_record=SimpleNamespace(customer_phone="+2348001234567", id="bench"), user_name="Ada"))
+
+    async def route_all():
+        for query in ROUTING_QUERIES:
+            await agent.SalonAgent.process_query(salon, context, query)
+    results["agent.process_query.routing"] = per_item(time_us_async(route_all, number=500), len(ROUTING_QUERIES))
+
+    lookup = main_agent.SalonAgent()._lookup_answer
+    queries = ROUTING_QUERIES + ["do you do facials", "can I bring my dog"]
+    results["main._lookup_answer"] = per_item(time_us(lambda: [lookup(q) for q in queries], number=2000), len(queries))
+
+
+def bench_search(results: Dict[str, Timing]) -> None:
+    # an empty corpus every time the group runs, a re-run must not search the 10k entries
+    backend = create_backend("memory")
+    set_backend(backend)
+    services = ["braids", "gel nails", "bridal makeup", "keratin treatment", "lash extensions", "facial"]
+    filled = 0
+    for size in CORPUS_SIZES:
+        for i in range(filled, size):
+            service = services[i % len(services)]
+            backend.set(KnowledgeBase.collection_name, f"kb{i:06d}", KnowledgeBase(
+                id=f"kb{i:06d}", key_phrase=f"{service} price {i}",
+                question=f"how much is {service} for option {i}", answer=f"{service} is {i} naira").to_dict())
+        filled = size
+        KnowledgeBase._index = None
+        KnowledgeBase.build_index(semantic=False)
+        results[f"kb.search.{size}"] = time_us(lambda: KnowledgeBase.search("how much are lash extensions", mode="keyword"),
+                                               number=200 if size < 10000 else 50)
+
+
+def bench_models(results: Dict[str, Timing]) -> None:
+    request = Request(id="r1", customer_phone="+2348001234567", query="do you do braids", call_id="c1",
+                      category="general").to_dict()
+    call = CallHistory(id="c1", customer_phone="+2348001234567").to_dict()
+    knowledge = KnowledgeBase(id="k1", key_phrase="braids", question="do you do braids", answer="yes").to_dict()
+    results["model.request.roundtrip"] = time_us(lambda: Request(**request).to_dict(), number=20000)
+    results["model.call_history.roundtrip"] = time_us(lambda: CallHistory(**call).to_dict(), number=20000)
+    results["model.knowledge.roundtrip"] = time_us(lambda: KnowledgeBase(**knowledge).to_dict(), number=20000)
+
+
+BENCHMARKS = [bench_escalation, bench_routing, bench_search, bench_models]
+
+
+def load_baseline(path: str) -> Tuple[Dict[str, Timing], float]:
+    if not os.path.exists(path):
+        return {}, None
+    with open(path, 'r') as file:
+        stored = json.load(file)
+    # older baselines kept a bare best time per path, with no noise recorded
+    baseline = {name: (entry['us'], entry['noise']) if isinstance(entry, dict) else (entry, 0.0)
+                for name, entry in stored.get('results', {}).items()}
+    return baseline, stored.get('calibration_us')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save', action='store_true', help="write these results as the new baseline")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="percent slower than the baseline that counts as a regression (env BENCH_THRESHOLD)")
+    parser.add_argument('--floor', type=float, default=DEFAULT_FLOOR_US,
+                        help="microseconds slower that a regression must also exceed (env BENCH_FLOOR_US)")
+    parser.add_argument('--noise', type=float, default=DEFAULT_NOISE,
+                        help="times the combined spread a regression must also exceed (env BENCH_NOISE)")
+    parser.add_argument('--confirm', type=int, default=DEFAULT_CONFIRM,
+                        help="times to re-run a regressed group before failing (env BENCH_CONFIRM)")
+    parser.add_argument('--rounds', type=int, default=DEFAULT_SAVE_ROUNDS,
+                        help="full runs timed with --save, their spread is stored as each path's noise")
+    parser.add_argument('--only', help="only report benchmarks whose name contains this")
+    args = parser.parse_args()
+
+    # sampled between the groups, the fastest sample is the machine's speed for this run
+    samples = [calibrate()]
+    rounds, groups = {}, {}
+    for _ in range(args.rounds if args.save else 1):
+        for bench in BENCHMARKS:
+            timed = {}
+            bench(timed)
+            for name, timing in timed.items():
+                rounds.setdefault(name, []).append(timing)
+                groups[name] = bench
+            samples.append(calibrate())
+    calibration = min(samples)
+    # the spread within a run misses how far a path drifts between runs, so across rounds
+    # the noise is how far apart their medians landed
+    results = {}
+    for name, timings in rounds.items():
+        medians = [median for median, _ in timings]
+        results[name] = (statistics.median(medians),
+                         max(statistics.median(noise for _, noise in timings), max(medians) - min(medians)))
+    if args.only:
+        results = {name: timing for name, timing in results.items() if args.only in name}
+
+    baseline, base_calibration = load_baseline(args.baseline)
+    # >1 when this machine runs the calibration loop slower than when the baseline was saved
+    speed = calibration / base_calibration if base_calibration else 1.0
+
+    def allowed(name: str, timing: Timing) -> float:
+        """How many microseconds slower than the baseline the path may be, or None without one"""
+        if name not in baseline:
+            return None
+        base_us, base_noise = baseline[name]
+        noise = args.noise * (base_noise * speed + timing[1])
+        return max(base_us * speed * args.threshold / 100, args.floor, noise)
+
+    def regressed(name: str, timing: Timing) -> bool:
+        margin = allowed(name, timing)
+        return margin is not None and timing[0] - baseline[name][0] * speed > margin
+
+    # a path that looks slow is timed again with its group, a one-off stall won't repeat
+    rerun = {groups[name] for name, timing in results.items() if regressed(name, timing)}
+    for _ in range(args.confirm if not args.save else 0):
+        if not rerun:
+            break
+        for bench in rerun:
+            timed = {}
+            bench(timed)
+            for name, timing in timed.items():
+                if name in results and timing[0] < results[name][0]:
+                    results[name] = timing
+        rerun = {groups[name] for name, timing in results.items() if regressed(name, timing)}
+
+    regressions = []
+    print(f"machine speed vs baseline: {1 / speed:.2f}x (calibration {calibration:.2f}us)\n")
+    print(f"{'benchmark':<32} {'us/call':>10} {'noise':>8} {'baseline':>10} {'change':>8}")
+    for name, (us, noise) in results.items():
+        base = baseline[name][0] * speed if name in baseline else None
+        change = (us / base - 1) * 100 if base else None
+        flag = ""
+        if regressed(name, (us, noise)):
+            regressions.append(name)
+            flag = "  REGRESSED"
+        print(f"{name:<32} {us:>10.2f} {noise:>8.2f} {f'{base:.2f}' if base else '-':>10} "
+              f"{f'{change:+.0f}%' if change is not None else '-':>8}{flag}")
+
+    if args.save:
+        # keep baseline entries for benchmarks skipped with --only
+        kept = {name: (us * speed, noise * speed) for name, (us, noise) in baseline.items()}
+        with open(args.baseline, 'w') as file:
+            json.dump({'machine': f"{platform.machine()} {platform.processor() or platform.system()}, "
+                                  f"Python {platform.python_version()}",
+                       'calibration_us': round(calibration, 3),
+                       'results': {name: {'us': round(us, 3), 'noise': round(noise, 3)}
+                                   for name, (us, noise) in {**kept, **results}.items()}},
+                      file, indent=2, sort_keys=True)
+            file.write('\n')
+        print(f"\nbaseline saved to {args.baseline}")
+    elif regressions:
+        print(f"\n{len(regressions)} path(s) regressed more than {args.threshold:.0f}% and their noise "
+              f"after {args.confirm} re-run(s): {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Query latency of semantic knowledge base retrieval at growing corpus sizes.
+
+Fills an EmbeddingIndex with random unit vectors (encoding a million texts would
+only measure the encoder) and times the top-k search, plus the cost of encoding
+one query with the configured encoder. Run from the project root:
+
+    python benchmarks/kb_semantic_bench.py
+    python benchmarks/kb_semantic_bench.py --sizes 10000 100000 1000000 --mmap
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from db.embeddings import EmbeddingIndex, get_encoder
+
+QUERY = "when do you close on saturdays"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--limit', type=int, default=5)
+    parser.add_argument('--mmap', action='store_true', help="search through the memory-mapped file store")
+    args = parser.parse_args()
+
+    encoder = get_encoder()
+    encoder.encode([QUERY])
+    start = time.perf_counter()
+    for _ in range(args.queries):
+        query = encoder.encode([QUERY])[0]
+    encode_us = (time.perf_counter() - start) / args.queries * 1e6
+    print(f"encoder {encoder.name} (dim {encoder.dim}): {encode_us:.0f} us per query")
+
+    rng = np.random.default_rng(0)
+    print(f"{'entries':>9} {'matrix MB':>10} {'p50 ms':>8} {'p99 ms':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            path = os.path.join(tmp, f"bench_{size}.f32") if args.mmap else None
+            index = EmbeddingIndex(encoder.dim, path=path, encoder_name=encoder.name)
+            # append in chunks, the same way incremental adds would arrive
+            for offset in range(0, size, 50000):
+                count = min(50000, size - offset)
+                vectors = rng.standard_normal((count, encoder.dim), dtype=np.float32)
+                vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+                index.add([str(i) for i in range(offset, offset + count)], vectors)
+
+            index.search(query, args.limit)
+            timings = []
+            for _ in range(args.queries):
+                start = time.perf_counter()
+                index.search(query, args.limit)
+                timings.append((time.perf_counter() - start) * 1e3)
+            p50, p99 = np.percentile(timings, [50, 99])
+            print(f"{size:>9} {size * encoder.dim * 4 / 2**20:>10.0f} {p50:>8.2f} {p99:>8.2f}")
+            del index
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+"""
+How many simultaneous calls one worker process takes before turn latency degrades.
+
+Runs the real BioCollector -> SalonAgent flow from agent.py in N concurrent
+AgentSessions on one event loop. STT, LLM and TTS are the seeded fakes in
+benchmarks/fakes.py, audio "plays" in real time (or --speed times faster), and the
+models write to the in-memory backend through the write-behind queue as they do in
+a call. For every concurrency step it reports turn latency percentiles (caller stops
+speaking -> agent starts answering), event loop lag, CPU use, memory per session and
+the sessions one core could hold at that CPU cost. Run from the project root:
+
+    python benchmarks/load_test.py
+    python benchmarks/load_test.py --concurrency 10 50 100 200 --speed 4 --llm-ms 400:120
+"""
+import argparse
+import asyncio
+import atexit
+import gc
+import logging
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+
+# everything stays local: throwaway database, outbox and audio cache
+_tmp = tempfile.mkdtemp(prefix="salon-load-")
+atexit.register(shutil.rmtree, _tmp, ignore_errors=True)
+os.environ.setdefault("DB_BACKEND", "memory")
+os.environ.setdefault("OUTBOX_DIR", os.path.join(_tmp, "outbox"))
+os.environ.setdefault("TTS_CACHE_DIR", os.path.join(_tmp, "tts_cache"))
+os.environ.setdefault("ESCALATION_CSV_PATH", os.path.join(ROOT, "db", "engine", "help.csv"))
+os.environ.setdefault("METRICS_ENABLED", "0")
+
+from livekit.agents import AgentSession
+
+import agent
+from benchmarks.fakes import Caller, FakeAudioOutput, FakeLLM, FakeSTT, FakeTTS, Latency
+from db.backends import get_backend
+from db.models import CallHistory, Request
+from db.outbox import start_write_behind
+from utils import latency
+from utils.intents import FastPath
+from utils.tts_cache import tts_cache
+
+# name, two FAQ turns for the fast path, one the LLM routes through process_query, one escalation
+# (the last line must match a phrase in db/engine/help.csv, the run checks it created a request)
+SCRIPT = [
+    "My name is Ada",
+    "What are your hours?",
+    "Do you offer facials?",
+    "Can you fit me in for braids next week?",
+    "Can I speak to a human please?",
+]
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        # peak, not current, outside Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def watch_loop(lags: list, peak_rss: list, interval: float = 0.05) -> None:
+    """Event loop lag: how late a sleep wakes up, sampled every interval"""
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append((time.perf_counter() - start - interval) * 1000)
+        peak_rss[0] = max(peak_rss[0], rss_mb())
+
+
+async def run_call(args, seed: int) -> Caller:
+    plugins_seed = seed * 10
+    call_record = await CallHistory.acreate(customer_phone=f"+234800{seed:07d}")
+    caller = Caller(SCRIPT, Latency.parse(args.think_ms, plugins_seed + 3), args.turn_timeout)
+    session = AgentSession[agent.UserInfo](
+        # the STT "hears" the caller, so it is made per session
+        stt=FakeSTT(caller, Latency.parse(args.stt_ms, plugins_seed + 4)),
+        llm=FakeLLM(Latency.parse(args.llm_ms, plugins_seed + 1)),
+        tts=FakeTTS(Latency.parse(args.tts_ms, plugins_seed + 2)),
+        userdata=agent.UserInfo(call_record=call_record, fast_path=FastPath(agent.SALON_INFO)),
+        min_endpointing_delay=args.endpointing_ms / 1000,
+    )
+    caller.attach(session)
+    session.output.audio = FakeAudioOutput(speed=args.speed)
+
+    @session.on("metrics_collected")
+    def record_metrics(ev):
+        latency.recorder.record_metrics(ev.metrics)
+
+    await session.start(agent=agent.BioCollector())
+    try:
+        await caller.run()
+    finally:
+        await session.aclose()
+        await call_record.aend_call(escalated=False)
+    return caller
+
+
+async def run_step(args, concurrency: int, first_seed: int) -> dict:
+    gc.collect()
+    base_rss = rss_mb()
+    lags, peak_rss = [], [base_rss]
+    watcher = asyncio.create_task(watch_loop(lags, peak_rss))
+    cpu, wall = time.process_time(), time.perf_counter()
+
+    async def staggered(i: int) -> Caller:
+        # calls don't all arrive in the same millisecond
+        await asyncio.sleep(args.ramp * i / concurrency)
+        return await run_call(args, first_seed + i)
+
+    callers = await asyncio.gather(*(staggered(i) for i in range(concurrency)))
+    cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+    watcher.cancel()
+
+    turns = [ms for caller in callers for ms in caller.latencies]
+    p50, p95, p99 = np.percentile(turns, [50, 95, 99]) if turns else (0, 0, 0)
+    busy = cpu / wall
+    return {
+        "sessions": concurrency,
+        "turns": len(turns),
+        "timeouts": sum(caller.timeouts for caller in callers),
+        "p50": p50, "p95": p95, "p99": p99,
+        "lag_p99": float(np.percentile(lags, 99)) if lags else 0.0,
+        "lag_max": max(lags, default=0.0),
+        "cpu": busy * 100,
+        "per_core": concurrency / busy if busy else float("inf"),
+        "mb_per_session": max(0.0, peak_rss[0] - base_rss) / concurrency,
+    }
+
+
+async def main_async(args) -> None:
+    write_queue = start_write_behind()
+    tts_cache.prewarm()
+    print(f"{'sessions':>8} {'turns':>6} {'t/o':>4} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'lag p99':>8} {'lag max':>8} {'cpu %':>6} {'per core':>9} {'MB/sess':>8}")
+    baseline = None
+    seed = 0
+    for concurrency in args.concurrency:
+        row = await run_step(args, concurrency, seed)
+        seed += concurrency
+        baseline = baseline or row["p95"]
+        flag = "  <- degraded" if baseline and row["p95"] > baseline * (1 + args.degraded / 100) else ""
+        print(f"{row['sessions']:>8} {row['turns']:>6} {row['timeouts']:>4} {row['p50']:>8.0f} {row['p95']:>8.0f} "
+              f"{row['p99']:>8.0f} {row['lag_p99']:>8.1f} {row['lag_max']:>8.1f} {row['cpu']:>6.1f} "
+              f"{row['per_core']:>9.0f} {row['mb_per_session']:>8.2f}{flag}")
+    await write_queue.close()
+    print(f"\nstage latency (ms): {latency.recorder.summary()}")
+    print(f"tts cache: {tts_cache.stats.summary()}")
+
+    # unmatched questions become 'general' requests, escalations carry the CSV's category
+    escalations = sum(1 for data in get_backend().query(Request.collection_name, fields=['category'])
+                      if data.get('category') != 'general')
+    print(f"escalation requests: {escalations}")
+    if not escalations:
+        sys.exit("no escalation request was created: the script's escalation line no longer matches help.csv")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 5, 10, 25, 50])
+    parser.add_argument('--stt-ms', default="150:40", help="final transcript delay, mean[:jitter]")
+    parser.add_argument('--llm-ms', default="350:100", help="time to first token, mean[:jitter]")
+    parser.add_argument('--tts-ms', default="200:60", help="time to first byte, mean[:jitter]")
+    parser.add_argument('--think-ms', default="300:100", help="caller pause before speaking, mean[:jitter]")
+    parser.add_argument('--endpointing-ms', type=float, default=500, help="AgentSession min_endpointing_delay")
+    parser.add_argument('--speed', type=float, default=1.0, help="play agent audio this many times faster than real time")
+    parser.add_argument('--ramp', type=float, default=2.0, help="seconds over which a step's calls arrive")
+    parser.add_argument('--turn-timeout', type=float, default=15.0)
+    parser.add_argument('--degraded', type=float, default=25.0, help="flag steps whose p95 is this %% over the first step's")
+    args = parser.parse_args()
+
+    # the agents log every turn, which would be most of the CPU time here
+    logging.basicConfig(level=logging.WARNING)
+    # "VAD is not set" once per session: there is no audio, turns end on the STT transcript
+    logging.getLogger("livekit.agents").setLevel(logging.ERROR)
+    asyncio.run(main_async(args))
+
+
+if __name__ == '__main__':
+    main()
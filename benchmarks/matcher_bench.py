@@ -0,0 +1,104 @@
+"""
+Micro-benchmark for the escalation phrase matcher.
+
+Compares per-call latency of the single-pass PhraseMatcher against the old
+four-regex approach as the phrase list grows. Run from the project root:
+
+    python benchmarks/matcher_bench.py
+    python benchmarks/matcher_bench.py --sizes 100 1000 10000 100000 --regex-limit 10000
+"""
+import argparse
+import os
+import random
+import re
+import string
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils.help import CATEGORIES, classify
+from utils.matcher import PhraseMatcher
+
+SAMPLE_TEXTS = [
+    "what are your hours on saturday",
+    "hi, can I speak to a human please, this is not what I asked",
+    "I have a billing dispute about my last visit and I need it fixed",
+    "this is ridiculous, you don't understand, completely wrong answer",
+    "do you do manicure and pedicure for kids, and how much does a facial cost? " * 4,
+]
+
+
+def make_phrases(count, seed=0):
+    """Synthetic phrase list with a realistic 2-4 word shape"""
+    rng = random.Random(seed)
+    vocab = [''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 9)))
+             for _ in range(5000)]
+    phrases = []
+    for i in range(count):
+        phrase = ' '.join(rng.choice(vocab) for _ in range(rng.randint(2, 4)))
+        phrases.append((phrase, CATEGORIES[i % len(CATEGORIES)]))
+    # keep a few real phrases so the samples actually hit
+    phrases += [("speak to a human", "direct_request"), ("billing dispute", "complexity"),
+                ("not what i asked", "frustration"), ("completely wrong", "frustration"),
+                ("you don't understand", "frustration")]
+    return phrases
+
+
+def build_regexes(phrases):
+    grouped = {c: [] for c in CATEGORIES}
+    for phrase, category in phrases:
+        grouped[category].append(phrase)
+    return {c: re.compile(r'\b(' + '|'.join(re.escape(p) for p in grouped[c]) + r')\b', re.IGNORECASE)
+            for c in CATEGORIES}
+
+
+def regex_classify(patterns, text):
+    for category in ("direct_request", "urgency", "complexity"):
+        if patterns[category].search(text):
+            return True, category
+    if len(patterns["frustration"].findall(text)) >= 2:
+        return True, "multiple_frustration_indicators"
+    return False, ""
+
+
+def time_per_call(fn, texts, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for text in texts:
+            fn(text)
+    return (time.perf_counter() - start) / (rounds * len(texts)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000, 100000])
+    parser.add_argument('--rounds', type=int, default=200)
+    parser.add_argument('--regex-limit', type=int, default=10000,
+                        help="skip the regex baseline above this many phrases (it gets very slow)")
+    args = parser.parse_args()
+
+    print(f"{'phrases':>9} {'build ms':>10} {'matcher us/call':>16} {'regex build ms':>15} {'regex us/call':>14}")
+    for size in args.sizes:
+        phrases = make_phrases(size)
+
+        start = time.perf_counter()
+        matcher = PhraseMatcher(phrases)
+        build_ms = (time.perf_counter() - start) * 1e3
+        matcher_us = time_per_call(lambda t: classify(matcher, t), SAMPLE_TEXTS, args.rounds)
+
+        regex_build, regex_us = "-", "-"
+        if size <= args.regex_limit:
+            start = time.perf_counter()
+            patterns = build_regexes(phrases)
+            regex_build = f"{(time.perf_counter() - start) * 1e3:.1f}"
+            regex_us = f"{time_per_call(lambda t: regex_classify(patterns, t), SAMPLE_TEXTS, max(1, args.rounds // 10)):.1f}"
+
+            # sanity check: both implementations must agree
+            for text in SAMPLE_TEXTS:
+                assert classify(matcher, text) == regex_classify(patterns, text), text
+
+        print(f"{size:>9} {build_ms:>10.1f} {matcher_us:>16.1f} {regex_build:>15} {regex_us:>14}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+import os
+import threading
+from typing import Optional
+
+from db.backends.base import Change, DocumentNotFound, Increment, StorageBackend, WriteOp
+
+# firestore (default), sqlite (file at SQLITE_PATH) or memory (in-process SQLite)
+DB_BACKEND = os.getenv('DB_BACKEND', 'firestore')
+SQLITE_PATH = os.getenv('SQLITE_PATH', os.path.join(os.path.dirname(__file__), '..', 'engine', 'salon.db'))
+
+_backend: Optional[StorageBackend] = None
+_backend_lock = threading.Lock()
+
+
+def create_backend(name: str = DB_BACKEND) -> StorageBackend:
+    if name == 'firestore':
+        from db.backends.firestore import FirestoreBackend
+        return FirestoreBackend()
+    if name == 'sqlite':
+        from db.backends.sqlite import SQLiteBackend
+        return SQLiteBackend(os.path.abspath(SQLITE_PATH))
+    if name == 'memory':
+        from db.backends.sqlite import SQLiteBackend
+        return SQLiteBackend(':memory:')
+    raise ValueError(f"Unknown DB_BACKEND: {name}")
+
+
+def get_backend() -> StorageBackend:
+    """The configured backend, created on first use"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend()
+    return _backend
+
+
+def set_backend(backend: StorageBackend) -> None:
+    """Swap the backend (for tests, benchmarks and offline runs)"""
+    global _backend
+    _backend = backend
+
+
+__all__ = ['Change', 'DocumentNotFound', 'Increment', 'StorageBackend', 'WriteOp', 'create_backend', 'get_backend', 'set_backend']
@@ -0,0 +1,106 @@
+import asyncio
+import secrets
+import string
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# (field, op, value), op is one of == < <= > >=
+Filter = Tuple[str, str, Any]
+
+# (op, collection, doc_id, data), op is 'set' or 'update' (see db/outbox.py)
+WriteOp = Tuple[str, str, str, Dict[str, Any]]
+
+# (change, data) where change is 'added', 'modified' or 'removed'
+Change = Tuple[str, Dict[str, Any]]
+
+_ID_CHARS = string.ascii_letters + string.digits
+
+
+class DocumentNotFound(KeyError):
+    """Raised by update() when the document does not exist"""
+
+
+class Increment:
+    """Field value for commit(): add amount to the stored number (missing counts as 0)"""
+    __slots__ = ('amount',)
+
+    def __init__(self, amount: int = 1):
+        self.amount = amount
+
+    def __add__(self, other: 'Increment') -> 'Increment':
+        return Increment(self.amount + other.amount)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Increment) and other.amount == self.amount
+
+    def __repr__(self) -> str:
+        return f"Increment({self.amount})"
+
+
+class StorageBackend:
+    """Document storage used by db.models.
+
+    Documents are plain dicts keyed by collection and id; reads return the
+    document data with its 'id' added. Async methods default to running the
+    sync ones in a worker thread; backends with a native async client override them.
+    """
+    name = "base"
+
+    def new_id(self, collection: str) -> str:
+        """A Firestore-style 20 character random ID, generated locally"""
+        return ''.join(secrets.choice(_ID_CHARS) for _ in range(20))
+
+    def get(self, collection: str, doc_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def set(self, collection: str, doc_id: str, data: Dict[str, Any]) -> None:
+        """Create or replace a document"""
+        raise NotImplementedError
+
+    def update(self, collection: str, doc_id: str, data: Dict[str, Any]) -> None:
+        """Change some fields of an existing document (DocumentNotFound otherwise)"""
+        raise NotImplementedError
+
+    def commit(self, ops: Sequence[WriteOp]) -> None:
+        """Apply a batch atomically. Every op is a merge-set; field values may be Increment."""
+        raise NotImplementedError
+
+    def commit_if(self, ops: Sequence[WriteOp], collection: str, doc_id: str, field: str, expected: Any) -> bool:
+        """Like commit(), but only if the document's field still holds expected (a missing document
+        or field counts as None). Returns False, writing nothing, when it has changed."""
+        raise NotImplementedError
+
+    def query(self, collection: str, where: Sequence[Filter] = (), order_by: Optional[str] = None,
+              descending: bool = False, limit: Optional[int] = None, start_after: Optional[str] = None,
+              fields: Optional[List[str]] = None) -> Iterator[Dict[str, Any]]:
+        """Stream matching documents. start_after is the id of the last document of the previous page."""
+        raise NotImplementedError
+
+    def watch(self, collection: str, callback: Callable[[List[Change]], None], since: datetime,
+              field: str = 'updated_at') -> Callable[[], None]:
+        """Call callback (from a background thread) with batches of changes to documents whose
+        `field` is >= since, including writes from other processes. Returns a function that stops it."""
+        raise NotImplementedError
+
+    async def aget(self, collection: str, doc_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.get, collection, doc_id)
+
+    async def aset(self, collection: str, doc_id: str, data: Dict[str, Any]) -> None:
+        await asyncio.to_thread(self.set, collection, doc_id, data)
+
+    async def aupdate(self, collection: str, doc_id: str, data: Dict[str, Any]) -> None:
+        await asyncio.to_thread(self.update, collection, doc_id, data)
+
+    async def acommit(self, ops: Sequence[WriteOp]) -> None:
+        await asyncio.to_thread(self.commit, ops)
+
+    async def acommit_if(self, ops: Sequence[WriteOp], collection: str, doc_id: str, field: str,
+                         expected: Any) -> bool:
+        return await asyncio.to_thread(self.commit_if, ops, collection, doc_id, field, expected)
+
+    async def aquery(self, collection: str, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        for data in await asyncio.to_thread(lambda: list(self.query(collection, **kwargs))):
+            yield data
+
+    def close(self) -> None:
+        pass
@@ -0,0 +1,145 @@
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Sequence
+
+from db.backends.base import Change, DocumentNotFound, Filter, Increment, StorageBackend, WriteOp
+
+
+class FirestoreBackend(StorageBackend):
+    """Cloud Firestore through firebase_admin (sync and native async clients)"""
+    name = "firestore"
+
+    def __init__(self):
+        # imported here so other backends never need Firebase credentials
+        from firebase_admin import firestore
+        from google.api_core.exceptions import NotFound
+        from db.firebase import get_db, get_async_db
+        self._firestore = firestore
+        self._not_found = NotFound
+        # waits for db.firebase.prewarm() if it is still running
+        self.db = get_db()
+        self.async_db = get_async_db()
+
+    def new_id(self, collection: str) -> str:
+        # Firestore generates auto IDs client side, this is not a network call
+        return self.db.collection(collection).document().id
+
+    @staticmethod
+    def _data(doc) -> Dict[str, Any]:
+        data = doc.to_dict()
+        data['id'] = doc.id
+        return data
+
+    def get(self, collection: str, doc_id: str) -> Optional[Dict[str, Any]]:
+        doc = self.db.collection(collection).document(doc_id).get()
+        return self._data(doc) if doc.exists else None
+
+    def set(self, collection: str, doc_id: str, data: Dict[str, Any]) -> None:
+        self.db.collection(collection).document(doc_id).set(data)
+
+    def update(self, collection: str, doc_id: str, data: Dict[str, Any]) -> None:
+        try:
+            self.db.collection(collection).document(doc_id).update(data)
+        except self._not_found as e:
+            raise DocumentNotFound(doc_id) from e
+
+    def _values(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        return {key: self._firestore.Increment(value.amount) if isinstance(value, Increment) else value
+                for key, value in data.items()}
+
+    def commit(self, ops: Sequence[WriteOp]) -> None:
+        batch = self.db.batch()
+        for op, collection, doc_id, data in ops:
+            # merge-sets behave like updates but can't fail the whole batch with NotFound
+            batch.set(self.db.collection(collection).document(doc_id), self._values(data), merge=True)
+        batch.commit()
+
+    async def acommit(self, ops: Sequence[WriteOp]) -> None:
+        batch = self.async_db.batch()
+        for op, collection, doc_id, data in ops:
+            batch.set(self.async_db.collection(collection).document(doc_id), self._values(data), merge=True)
+        await batch.commit()
+
+    def commit_if(self, ops: Sequence[WriteOp], collection: str, doc_id: str, field: str, expected: Any) -> bool:
+        # the transaction re-runs the read if the document changes before it commits
+        @self._firestore.transactional
+        def run(transaction) -> bool:
+            doc = self.db.collection(collection).document(doc_id).get(transaction=transaction)
+            if ((doc.to_dict() or {}) if doc.exists else {}).get(field) != expected:
+                return False
+            for op, op_collection, op_doc_id, data in ops:
+                transaction.set(self.db.collection(op_collection).document(op_doc_id), self._values(data), merge=True)
+            return True
+        return run(self.db.transaction())
+
+    async def acommit_if(self, ops: Sequence[WriteOp], collection: str, doc_id: str, field: str,
+                         expected: Any) -> bool:
+        @self._firestore.async_transactional
+        async def run(transaction) -> bool:
+            doc = await self.async_db.collection(collection).document(doc_id).get(transaction=transaction)
+            if ((doc.to_dict() or {}) if doc.exists else {}).get(field) != expected:
+                return False
+            for op, op_collection, op_doc_id, data in ops:
+                transaction.set(self.async_db.collection(op_collection).document(op_doc_id), self._values(data),
+                                merge=True)
+            return True
+        return await run(self.async_db.transaction())
+
+    def _build_query(self, client, collection: str, where: Sequence[Filter], order_by: Optional[str],
+                     descending: bool, limit: Optional[int], fields: Optional[List[str]]):
+        query = client.collection(collection)
+        for field, op, value in where:
+            query = query.where(field, op, value)
+        if order_by:
+            # Firestore adds the document id as an implicit last sort key, so pages stay stable on ties
+            direction = self._firestore.Query.DESCENDING if descending else self._firestore.Query.ASCENDING
+            query = query.order_by(order_by, direction=direction)
+        if fields:
+            query = query.select(fields)
+        if limit:
+            query = query.limit(limit)
+        return query
+
+    def query(self, collection: str, where: Sequence[Filter] = (), order_by: Optional[str] = None,
+              descending: bool = False, limit: Optional[int] = None, start_after: Optional[str] = None,
+              fields: Optional[List[str]] = None) -> Iterator[Dict[str, Any]]:
+        query = self._build_query(self.db, collection, where, order_by, descending, limit, fields)
+        if start_after:
+            cursor = self.db.collection(collection).document(start_after).get()
+            if cursor.exists:
+                query = query.start_after(cursor)
+        for doc in query.stream():
+            yield self._data(doc)
+
+    def watch(self, collection: str, callback: Callable[[List[Change]], None], since: datetime,
+              field: str = 'updated_at') -> Callable[[], None]:
+        # a snapshot listener on recent documents only, so the initial snapshot is (nearly) empty
+        query = self.db.collection(collection).where(field, '>=', since)
+
+        def on_snapshot(snapshot, changes, read_time):
+            callback([(change.type.name.lower(), self._data(change.document)) for change in changes])
+
+        return query.on_snapshot(on_snapshot).unsubscribe
+
+    async def aget(self, collection: str, doc_id: str) -> Optional[Dict[str, Any]]:
+        doc = await self.async_db.collection(collection).document(doc_id).get()
+        return self._data(doc) if doc.exists else None
+
+    async def aset(self, collection: str, doc_id: str, data: Dict[str, Any]) -> None:
+        await self.async_db.collection(collection).document(doc_id).set(data)
+
+    async def aupdate(self, collection: str, doc_id: str, data: Dict[str, Any]) -> None:
+        try:
+            await self.async_db.collection(collection).document(doc_id).update(data)
+        except self._not_found as e:
+            raise DocumentNotFound(doc_id) from e
+
+    async def aquery(self, collection: str, where: Sequence[Filter] = (), order_by: Optional[str] = None,
+                     descending: bool = False, limit: Optional[int] = None, start_after: Optional[str] = None,
+                     fields: Optional[List[str]] = None) -> AsyncIterator[Dict[str, Any]]:
+        query = self._build_query(self.async_db, collection, where, order_by, descending, limit, fields)
+        if start_after:
+            cursor = await self.async_db.collection(collection).document(start_after).get()
+            if cursor.exists:
+                query = query.start_after(cursor)
+        async for doc in query.stream():
+            yield self._data(doc)
@@ -0,0 +1,213 @@
+import json
+import logging
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+from db.backends.base import Change, DocumentNotFound, Filter, Increment, StorageBackend, WriteOp
+
+logger = logging.getLogger(__name__)
+
+# how often watch() looks for changes
+WATCH_INTERVAL = 0.25
+
+# stored as ISO strings (so they sort and compare in SQL) and turned back into datetimes on read
+DATETIME_FIELDS = {'created_at', 'updated_at', 'resolved_at', 'start_time', 'end_time'}
+
+# expression indexes per collection; queries use the exact same json_extract expressions
+INDEXES = {
+    'requests': [('status', 'created_at'), ('call_id', 'status'), ('created_at',), ('updated_at',)],
+    'call_history': [('start_time',)],
+    'knowledge_base': [('key_phrase',)],
+}
+
+OPERATORS = {'==': '=', '<': '<', '<=': '<=', '>': '>', '>=': '>='}
+
+
+def _field(name: str) -> str:
+    if not name.replace('_', '').isalnum():
+        raise ValueError(f"Invalid field name: {name}")
+    return f"json_extract(data, '$.{name}')"
+
+
+def _to_sql(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _encode(data: Dict[str, Any]) -> str:
+    return json.dumps({k: _to_sql(v) for k, v in data.items() if k != 'id'})
+
+
+def _decode(doc_id: str, raw: str) -> Dict[str, Any]:
+    data = json.loads(raw)
+    for key in DATETIME_FIELDS.intersection(data):
+        if isinstance(data[key], str):
+            data[key] = datetime.fromisoformat(data[key])
+    data['id'] = doc_id
+    return data
+
+
+class SQLiteBackend(StorageBackend):
+    """Embedded storage: a SQLite file, or ':memory:' for a throwaway in-process database.
+
+    Each collection is a table of (id, JSON data) with expression indexes on the
+    fields the models filter and sort by (status, call_id, created_at, ...).
+    """
+    name = "sqlite"
+
+    def __init__(self, path: str = ':memory:'):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        if path != ':memory:':
+            # lets the admin app read while an agent worker writes
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA busy_timeout=5000')
+        self._tables = set()
+
+    def _table(self, collection: str) -> str:
+        table = f'"{collection}"'
+        if collection in self._tables:
+            return table
+        if not collection.replace('_', '').isalnum():
+            raise ValueError(f"Invalid collection name: {collection}")
+        with self._lock:
+            self._conn.execute(f'CREATE TABLE IF NOT EXISTS {table} (id TEXT PRIMARY KEY, data TEXT NOT NULL)')
+            for fields in INDEXES.get(collection, []):
+                name = f"ix_{collection}_{'_'.join(fields)}"
+                columns = ', '.join(_field(f) for f in fields)
+                self._conn.execute(f'CREATE INDEX IF NOT EXISTS "{name}" ON {table} ({columns})')
+            self._tables.add(collection)
+        return table
+
+    def get(self, collection: str, doc_id: str) -> Optional[Dict[str, Any]]:
+        table = self._table(collection)
+        with self._lock:
+            row = self._conn.execute(f'SELECT data FROM {table} WHERE id = ?', (doc_id,)).fetchone()
+        return _decode(doc_id, row[0]) if row else None
+
+    def set(self, collection: str, doc_id: str, data: Dict[str, Any]) -> None:
+        table = self._table(collection)
+        with self._lock:
+            self._conn.execute(f'INSERT OR REPLACE INTO {table} (id, data) VALUES (?, ?)', (doc_id, _encode(data)))
+
+    def update(self, collection: str, doc_id: str, data: Dict[str, Any]) -> None:
+        table = self._table(collection)
+        with self._lock:
+            cursor = self._conn.execute(f'UPDATE {table} SET data = json_patch(data, ?) WHERE id = ?',
+                                        (_encode(data), doc_id))
+        if cursor.rowcount == 0:
+            raise DocumentNotFound(doc_id)
+
+    def commit(self, ops: Sequence[WriteOp]) -> None:
+        with self._lock:
+            self._conn.execute('BEGIN')
+            try:
+                self._apply(ops)
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def commit_if(self, ops: Sequence[WriteOp], collection: str, doc_id: str, field: str, expected: Any) -> bool:
+        with self._lock:
+            # IMMEDIATE takes the write lock before the read, so another process can't change it in between
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = self._conn.execute(f'SELECT {_field(field)} FROM {self._table(collection)} WHERE id = ?',
+                                         (doc_id,)).fetchone()
+                if (row[0] if row else None) != _to_sql(expected):
+                    self._conn.execute('ROLLBACK')
+                    return False
+                self._apply(ops)
+                self._conn.execute('COMMIT')
+                return True
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def _apply(self, ops: Sequence[WriteOp]) -> None:
+        for op, collection, doc_id, data in ops:
+            table = self._table(collection)
+            if any(isinstance(value, Increment) for value in data.values()):
+                data = self._apply_increments(table, doc_id, data)
+            self._conn.execute(
+                f'INSERT INTO {table} (id, data) VALUES (?, ?) '
+                f'ON CONFLICT(id) DO UPDATE SET data = json_patch(data, excluded.data)',
+                (doc_id, _encode(data)))
+
+    def _apply_increments(self, table: str, doc_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        # read-modify-write is safe here, commit() and commit_if() hold the lock inside a transaction
+        row = self._conn.execute(f'SELECT data FROM {table} WHERE id = ?', (doc_id,)).fetchone()
+        current = json.loads(row[0]) if row else {}
+        return {key: (current.get(key) or 0) + value.amount if isinstance(value, Increment) else value
+                for key, value in data.items()}
+
+    def query(self, collection: str, where: Sequence[Filter] = (), order_by: Optional[str] = None,
+              descending: bool = False, limit: Optional[int] = None, start_after: Optional[str] = None,
+              fields: Optional[List[str]] = None) -> Iterator[Dict[str, Any]]:
+        table = self._table(collection)
+        clauses, params = [], []
+        for field, op, value in where:
+            clauses.append(f'{_field(field)} {OPERATORS[op]} ?')
+            params.append(_to_sql(value))
+
+        direction = 'DESC' if descending else 'ASC'
+        comparison = '<' if descending else '>'
+        order = f'{_field(order_by)} {direction}, id {direction}' if order_by else f'id {direction}'
+        if start_after:
+            # keyset pagination on (order_by value, id), no OFFSET scans
+            if order_by:
+                clauses.append(f'({_field(order_by)}, id) {comparison} '
+                               f'((SELECT {_field(order_by)} FROM {table} WHERE id = ?), ?)')
+                params.extend([start_after, start_after])
+            else:
+                clauses.append(f'id {comparison} ?')
+                params.append(start_after)
+
+        sql = f'SELECT id, data FROM {table}'
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        sql += f' ORDER BY {order}'
+        if limit:
+            sql += ' LIMIT ?'
+            params.append(limit)
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        for doc_id, raw in rows:
+            data = _decode(doc_id, raw)
+            if fields:
+                data = {key: data[key] for key in ['id', *fields] if key in data}
+            yield data
+
+    def watch(self, collection: str, callback: Callable[[List[Change]], None], since: datetime,
+              field: str = 'updated_at') -> Callable[[], None]:
+        # no push notifications in SQLite, so poll the `field` index; this also sees
+        # writes made by other processes sharing the database file
+        stop = threading.Event()
+
+        def poll():
+            watermark, seen = since, set()
+            while not stop.wait(WATCH_INTERVAL):
+                try:
+                    rows = list(self.query(collection, where=[(field, '>=', watermark)], order_by=field))
+                except Exception as e:
+                    logger.error(f"Watching {collection} failed: {e}")
+                    continue
+                # rows at the watermark itself were already reported last time round
+                changes = [('added' if data.get('created_at') == data.get(field) else 'modified', data)
+                           for data in rows if (data['id'], data.get(field)) not in seen]
+                if rows:
+                    watermark = rows[-1][field]
+                    seen = {(data['id'], data[field]) for data in rows if data[field] == watermark}
+                if changes:
+                    callback(changes)
+
+        threading.Thread(target=poll, name=f"watch-{collection}", daemon=True).start()
+        return stop.set
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,305 @@
+import copy
+import fcntl
+import json
+import os
+import re
+import zlib
+from contextlib import contextmanager
+from typing import Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+class HashingEncoder:
+    """Dependency-free text encoder: hashed word and character n-grams.
+
+    Works fully offline and is stable across processes (crc32, not hash()),
+    so vectors can be persisted. It catches spelling variants and shared word
+    pieces; for real paraphrases point KB_EMBEDDING_MODEL at an ONNX model.
+    """
+    name = "hashing"
+
+    def __init__(self, dim: int = 256, char_ngrams: Tuple[int, int] = (3, 5)):
+        self.dim = dim
+        self.char_ngrams = char_ngrams
+
+    def _features(self, text: str) -> Iterable[str]:
+        words = WORD_RE.findall(text.lower())
+        for word in words:
+            yield word
+            padded = f" {word} "
+            low, high = self.char_ngrams
+            for n in range(low, high + 1):
+                for i in range(len(padded) - n + 1):
+                    yield padded[i:i + n]
+        for first, second in zip(words, words[1:]):
+            yield f"{first} {second}"
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text or ""):
+                h = zlib.crc32(feature.encode('utf-8'))
+                # the top bit picks a sign so collisions tend to cancel out
+                vectors[row, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        return _normalize(vectors)
+
+
+class OnnxEncoder:
+    """Sentence encoder running a local ONNX model through onnxruntime.
+
+    model_dir must hold model.onnx and the matching tokenizer.json (for example
+    an exported all-MiniLM-L6-v2). Token embeddings are mean-pooled.
+    """
+    name = "onnx"
+
+    def __init__(self, model_dir: str, max_length: int = 128):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        self._session = onnxruntime.InferenceSession(os.path.join(model_dir, 'model.onnx'),
+                                                     providers=['CPUExecutionProvider'])
+        self._inputs = {i.name for i in self._session.get_inputs()}
+        self._tokenizer = Tokenizer.from_file(os.path.join(model_dir, 'tokenizer.json'))
+        self._tokenizer.enable_truncation(max_length)
+        self._tokenizer.enable_padding()
+        self.name = f"onnx:{os.path.basename(os.path.normpath(model_dir))}"
+        self.dim = int(self.encode(["warmup"]).shape[1])
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        encoded = self._tokenizer.encode_batch([text or "" for text in texts])
+        ids = np.array([e.ids for e in encoded], dtype=np.int64)
+        mask = np.array([e.attention_mask for e in encoded], dtype=np.int64)
+        feeds = {'input_ids': ids, 'attention_mask': mask}
+        if 'token_type_ids' in self._inputs:
+            feeds['token_type_ids'] = np.zeros_like(ids)
+
+        tokens = self._session.run(None, feeds)[0]
+        weights = mask[..., None].astype(np.float32)
+        pooled = (tokens * weights).sum(axis=1) / np.maximum(weights.sum(axis=1), 1e-9)
+        return _normalize(pooled.astype(np.float32))
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def get_encoder():
+    """ONNX encoder when KB_EMBEDDING_MODEL is set, otherwise the hashing encoder"""
+    model_dir = os.getenv('KB_EMBEDDING_MODEL')
+    if model_dir:
+        return OnnxEncoder(model_dir)
+    return HashingEncoder()
+
+
+class EmbeddingIndex:
+    """Unit vectors in one contiguous float32 matrix with top-k cosine search.
+
+    Without a path the matrix lives in a growable in-memory buffer. With a path,
+    rows are appended to a raw float32 file (ids in a sidecar file) and searched
+    through a read-only memory map, so a restart maps the file instead of
+    re-encoding every entry. Worker processes can share the files: writes take
+    an flock and re-read both files when another process changed them, so rows
+    and ids stay aligned.
+    """
+
+    def __init__(self, dim: int, path: Optional[str] = None, encoder_name: str = ""):
+        self.dim = dim
+        self.path = path
+        self.encoder_name = encoder_name
+        self._ids: List[str] = []
+        self._positions = {}
+        self._buffer = np.zeros((0, dim), dtype=np.float32)
+        self._matrix = self._buffer
+        # rows of deleted entries: the file keeps them, searches skip them
+        self._dead: Set[str] = set()
+        self._dead_rows = np.zeros(0, dtype=np.int64)
+        # (inode, size, mtime) of both files when last read or written by us
+        self._stamp = None
+
+        if path:
+            self._open()
+
+    def __len__(self) -> int:
+        return len(self._ids) - len(self._dead_rows)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._positions and doc_id not in self._dead
+
+    @property
+    def _ids_path(self) -> str:
+        return self.path + '.ids'
+
+    @property
+    def _meta_path(self) -> str:
+        return self.path + '.meta.json'
+
+    @contextmanager
+    def _locked(self):
+        """Exclusive lock on the files across processes"""
+        with open(self.path + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _open(self) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with self._locked():
+            self._check_meta()
+            self._load()
+
+    def _check_meta(self) -> None:
+        meta = {'dim': self.dim, 'encoder': self.encoder_name}
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path, 'r') as file:
+                stored = json.load(file)
+            if stored != meta:
+                # vectors from another encoder (or size) are useless, start over
+                for stale in (self.path, self._ids_path):
+                    if os.path.exists(stale):
+                        os.remove(stale)
+        with open(self._meta_path, 'w') as file:
+            json.dump(meta, file)
+
+    def _load(self) -> None:
+        """Read the ids and map the rows as they are on disk now (call with the lock held)"""
+        ids = []
+        if os.path.exists(self._ids_path):
+            with open(self._ids_path, 'r') as file:
+                ids = [line.rstrip('\n') for line in file if line.strip()]
+        row_bytes = 4 * self.dim
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        # a crash between the two appends can leave either file ahead: cut both back to
+        # the rows they agree on, or the next append would pair a vector with the wrong id
+        rows = min(len(ids), size // row_bytes)
+        if size != rows * row_bytes:
+            os.truncate(self.path, rows * row_bytes)
+        if len(ids) != rows:
+            ids = ids[:rows]
+            with open(self._ids_path, 'w') as file:
+                file.write(''.join(f"{doc_id}\n" for doc_id in ids))
+        self._ids = ids
+        self._positions = {doc_id: i for i, doc_id in enumerate(self._ids)}
+        self._set_dead_rows()
+        self._remap()
+        self._stamp = self._file_stamp()
+
+    def _file_stamp(self) -> Tuple:
+        stamp = []
+        for path in (self.path, self._ids_path):
+            try:
+                stat = os.stat(path)
+                stamp.append((stat.st_ino, stat.st_size, stat.st_mtime_ns))
+            except FileNotFoundError:
+                stamp.append(None)
+        return tuple(stamp)
+
+    def _set_dead_rows(self) -> None:
+        self._dead_rows = np.array(sorted(self._positions[doc_id] for doc_id in self._dead
+                                          if doc_id in self._positions), dtype=np.int64)
+
+    def copy(self) -> 'EmbeddingIndex':
+        """An index over the same rows that can be changed without touching this one.
+        File-backed rows are shared (appends go to the file), the in-memory buffer is copied."""
+        other = copy.copy(self)
+        other._ids = list(self._ids)
+        other._positions = dict(self._positions)
+        other._dead = set(self._dead)
+        if not self.path:
+            other._buffer = self._buffer.copy()
+            other._matrix = other._buffer[:len(self._ids)]
+        return other
+
+    def retain(self, ids: Iterable[str]) -> None:
+        """Leave out of searches every row whose id is not in ids (entries deleted since)"""
+        keep = set(ids)
+        self._dead = {doc_id for doc_id in self._ids if doc_id not in keep}
+        self._set_dead_rows()
+
+    def _remap(self) -> None:
+        if not self._ids:
+            self._matrix = np.zeros((0, self.dim), dtype=np.float32)
+            return
+        self._matrix = np.memmap(self.path, dtype=np.float32, mode='r', shape=(len(self._ids), self.dim))
+
+    def add(self, ids: List[str], vectors: np.ndarray) -> None:
+        """Insert or replace rows; new ids are appended at the end"""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        if self._dead.intersection(ids):
+            self._dead.difference_update(ids)
+            self._set_dead_rows()
+        if not self.path:
+            self._add(ids, vectors)
+            return
+        with self._locked():
+            # other processes may have appended since we last looked; if neither file
+            # changed since our last read or write, what we hold is still current
+            if self._file_stamp() != self._stamp:
+                self._load()
+            self._add(ids, vectors)
+            self._stamp = self._file_stamp()
+
+    def _add(self, ids: List[str], vectors: np.ndarray) -> None:
+        new_ids, new_rows = [], []
+        for doc_id, vector in zip(ids, vectors):
+            position = self._positions.get(doc_id)
+            if position is None:
+                self._positions[doc_id] = len(self._ids) + len(new_ids)
+                new_ids.append(doc_id)
+                new_rows.append(vector)
+            else:
+                self._overwrite(position, vector)
+
+        if not new_ids:
+            return
+        rows = np.stack(new_rows)
+        if self.path:
+            with open(self.path, 'ab') as file:
+                file.write(rows.tobytes())
+            with open(self._ids_path, 'a') as file:
+                file.write(''.join(f"{doc_id}\n" for doc_id in new_ids))
+            self._ids.extend(new_ids)
+            self._remap()
+        else:
+            self._append_in_memory(rows)
+            self._ids.extend(new_ids)
+
+    def _append_in_memory(self, rows: np.ndarray) -> None:
+        size = len(self._ids)
+        needed = size + len(rows)
+        if needed > len(self._buffer):
+            # grow geometrically so a stream of single appends stays amortized O(1)
+            grown = np.zeros((max(needed, 2 * len(self._buffer), 64), self.dim), dtype=np.float32)
+            grown[:size] = self._buffer[:size]
+            self._buffer = grown
+        self._buffer[size:needed] = rows
+        self._matrix = self._buffer[:needed]
+
+    def _overwrite(self, position: int, vector: np.ndarray) -> None:
+        if self.path:
+            with open(self.path, 'r+b') as file:
+                file.seek(position * self.dim * 4)
+                file.write(vector.astype(np.float32).tobytes())
+            self._remap()
+        else:
+            self._buffer[position] = vector
+
+    def search(self, vector: np.ndarray, limit: int = 5) -> List[Tuple[str, float]]:
+        """Top (doc_id, cosine) pairs: one matrix-vector product plus argpartition"""
+        size = len(self._ids)
+        if not size:
+            return []
+        scores = self._matrix[:size] @ np.asarray(vector, dtype=np.float32).reshape(self.dim)
+        if len(self._dead_rows):
+            scores[self._dead_rows] = -np.inf
+        if size > limit:
+            top = np.argpartition(scores, -limit)[-limit:]
+        else:
+            top = np.arange(size)
+        top = top[np.argsort(-scores[top])]
+        return [(self._ids[i], float(scores[i])) for i in top if scores[i] != -np.inf]
@@ -1,9 +1,72 @@
-import firebase_admin
-from firebase_admin import credentials, firestore
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
 
 # Path to the downloaded JSON key
-cred = credentials.Certificate("/home/oladev/ai-agent/db/engine/firebase.json")
-firebase_admin.initialize_app(cred)
+FIREBASE_CREDENTIALS = os.getenv("FIREBASE_CREDENTIALS", "/home/oladev/ai-agent/db/engine/firebase.json")
+
+# Clients are created on first use (or by prewarm), not at import time: setting up the
+# app and the gRPC channels costs every worker and the admin app before they do anything
+_db = None
+_async_db = None
+_lock = threading.Lock()
+_warm_thread: Optional[threading.Thread] = None
+
+# seconds spent importing firebase_admin and creating the clients, for startup reports
+init_seconds: Optional[float] = None
+
+
+def _initialize() -> None:
+    global _db, _async_db, init_seconds
+    with _lock:
+        if _db is not None:
+            return
+        start = time.perf_counter()
+        import firebase_admin
+        from firebase_admin import credentials, firestore, firestore_async
+
+        if not firebase_admin._apps:
+            cred = credentials.Certificate(FIREBASE_CREDENTIALS)
+            firebase_admin.initialize_app(cred)
+
+        # Async client for code running on an event loop (same app, same credentials)
+        _async_db = firestore_async.client()
+        _db = firestore.client()
+        init_seconds = time.perf_counter() - start
+        logger.info(f"Firebase initialized in {init_seconds * 1000:.0f}ms")
+
+
+def get_db():
+    """The Firestore client, created on first use"""
+    if _db is None:
+        _initialize()
+    return _db
+
+
+def get_async_db():
+    """The async Firestore client, created on first use"""
+    if _db is None:
+        _initialize()
+    return _async_db
+
+
+def prewarm() -> None:
+    """Start creating the clients in a background thread so the first query doesn't wait for it"""
+    global _warm_thread
+    if _db is not None or _warm_thread is not None:
+        return
+    _warm_thread = threading.Thread(target=_initialize, name="firebase-prewarm", daemon=True)
+    _warm_thread.start()
+
 
-# Initialize Firestore DB
-db = firestore.client()
+def __getattr__(name: str):
+    # keeps `from db.firebase import db, async_db` working, it just initializes at that point
+    if name == "db":
+        return get_db()
+    if name == "async_db":
+        return get_async_db()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,10 +1,97 @@
+import os
+import threading
+import time
 from datetime import datetime
-import firebase_admin
-from firebase_admin import firestore
-from typing import Dict, List, Optional, Any
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Any, Tuple
+
+# The storage backend (Firestore by default, see db/backends)
+from db.backends import Increment, get_backend
+from db.search import BM25Index
+
+# 'keyword' (BM25) or 'semantic' (embedding similarity) for KnowledgeBase.search
+KB_SEARCH_MODE = os.getenv('KB_SEARCH_MODE', 'keyword')
+KB_EMBEDDINGS_PATH = os.getenv('KB_EMBEDDINGS_PATH',
+                               os.path.join(os.path.dirname(__file__), 'engine', 'kb_embeddings.f32'))
+# supervisors answer from the admin app (another process), so indexes older than this are rebuilt
+KB_INDEX_MAX_AGE = float(os.getenv('KB_INDEX_MAX_AGE', '300'))
+
+# Optional write-behind queue (see db/outbox.py); None means write straight to the backend
+_write_behind = None
+
+def enable_write_behind(queue) -> None:
+    """Route model writes through a WriteBehindQueue instead of blocking on Firestore"""
+    global _write_behind
+    _write_behind = queue
+
+def _new_id(collection: str) -> str:
+    # IDs are generated client side, this is not a network call
+    return get_backend().new_id(collection)
+
+# every write goes out as one atomic batch: the document plus its dashboard counters
+def _commit(ops: List[Tuple[str, str, str, Dict[str, Any]]]) -> None:
+    if _write_behind is not None:
+        _write_behind.enqueue_many(ops)
+    else:
+        get_backend().commit(ops)
+
+async def _acommit(ops: List[Tuple[str, str, str, Dict[str, Any]]]) -> None:
+    if _write_behind is not None:
+        _write_behind.enqueue_many(ops)
+    else:
+        await get_backend().acommit(ops)
+
+
+class DashboardStats:
+    """Dashboard counters kept in one document, updated in the same commit as the writes they count"""
+    collection_name = 'aggregates'
+    doc_id = 'dashboard'
+    fields = ('pending', 'resolved', 'unresolved', 'total_calls', 'ai_handled_calls')
 
-# The firebase connector
-from db.firebase import db
+    @classmethod
+    def op(cls, **deltas: int) -> Tuple[str, str, str, Dict[str, Any]]:
+        """Write op adding the given deltas to the counters"""
+        data = {field: Increment(delta) for field, delta in deltas.items() if delta}
+        data['updated_at'] = datetime.now()
+        return ('update', cls.collection_name, cls.doc_id, data)
+
+    @classmethod
+    def status_change(cls, old: Optional[str], new: str) -> List[Tuple[str, str, str, Dict[str, Any]]]:
+        """Counter op for a request moving from one status to another (none if unchanged).
+        old is the status stored when the change is written, see Request._move."""
+        if old == new:
+            return []
+        return [cls.op(**{old: -1, new: 1})] if old in cls.fields else [cls.op(**{new: 1})]
+
+    @classmethod
+    def _from_doc(cls, data: Optional[Dict[str, Any]]) -> Dict[str, int]:
+        data = data or {}
+        return {field: int(data.get(field) or 0) for field in cls.fields}
+
+    @classmethod
+    def get(cls) -> Dict[str, int]:
+        """Current counters (a single document read)"""
+        return cls._from_doc(get_backend().get(cls.collection_name, cls.doc_id))
+
+    @classmethod
+    async def aget(cls) -> Dict[str, int]:
+        return cls._from_doc(await get_backend().aget(cls.collection_name, cls.doc_id))
+
+    @classmethod
+    def rebuild(cls) -> Dict[str, int]:
+        """Recount everything from the requests and call_history collections and overwrite the counters"""
+        backend = get_backend()
+        counts = dict.fromkeys(cls.fields, 0)
+        for data in backend.query(Request.collection_name, fields=['status']):
+            if data.get('status') in ('pending', 'resolved', 'unresolved'):
+                counts[data['status']] += 1
+        for data in backend.query(CallHistory.collection_name, fields=['ai_handled']):
+            counts['total_calls'] += 1
+            if data.get('ai_handled', True):
+                counts['ai_handled_calls'] += 1
+
+        # writes that happen while counting can be off by one here, run it when things are quiet
+        backend.set(cls.collection_name, cls.doc_id, {**counts, 'updated_at': datetime.now()})
+        return counts
 
 class Request:
     """Model for handling customer requests that need supervisor attention"""
@@ -41,33 +128,31 @@ class Request:
             'updated_at': now
         }
 
-        # Add to Firestore
-        doc_ref = db.collection(cls.collection_name).document()
-        doc_ref.set(new_request)
+        # Add to the database (ID is assigned up front so the write can be deferred)
+        doc_id = _new_id(cls.collection_name)
+        _commit([('set', cls.collection_name, doc_id, new_request), DashboardStats.op(pending=1)])
 
         # Create and return instance with the new ID
-        new_request['id'] = doc_ref.id
+        new_request['id'] = doc_id
         return cls(**new_request)
 
     @classmethod
     def get(cls, request_id: str) -> Optional['Request']:
         """Get a request by ID"""
-        doc = db.collection(cls.collection_name).document(request_id).get()
-        if doc.exists:
-            data = doc.to_dict()
-            data['id'] = doc.id
+        data = get_backend().get(cls.collection_name, request_id)
+        if data:
             return cls(**data)
         return None
 
     @classmethod
-    def get_pending_requests(cls) -> List['Request']:
-        """Get all pending requests"""
+    def get_pending_requests(cls, limit: Optional[int] = None, start_after: Optional[str] = None,
+                             fields: Optional[List[str]] = None) -> List['Request']:
+        """Get pending requests, oldest first (all of them, or one page after the start_after request id)"""
         requests = []
-        query = db.collection(cls.collection_name).where('status', '==', 'pending').order_by('created_at')
+        query = get_backend().query(cls.collection_name, where=[('status', '==', 'pending')], order_by='created_at',
+                                    limit=limit, start_after=start_after, fields=fields)
 
-        for doc in query.stream():
-            data = doc.to_dict()
-            data['id'] = doc.id
+        for data in query:
             requests.append(cls(**data))
 
         return requests
@@ -76,17 +161,50 @@ class Request:
     def get_request_history(cls, limit: int = 50) -> List['Request']:
         """Get request history"""
         requests = []
-        query = db.collection(cls.collection_name).order_by(
-            'created_at', direction=firestore.Query.DESCENDING
-        ).limit(limit)
+        query = get_backend().query(cls.collection_name, order_by='created_at', descending=True, limit=limit)
 
-        for doc in query.stream():
-            data = doc.to_dict()
-            data['id'] = doc.id
+        for data in query:
             requests.append(cls(**data))
 
         return requests
 
+    @classmethod
+    def iter_all(cls, fields: Optional[List[str]] = None, page_size: int = 1000) -> Iterator['Request']:
+        """Stream every request page by page (optionally only some fields)"""
+        last_id = None
+        while True:
+            page = list(get_backend().query(cls.collection_name, limit=page_size,
+                                            start_after=last_id, fields=fields))
+            for data in page:
+                yield cls(**data)
+            if len(page) < page_size:
+                break
+            last_id = page[-1]['id']
+
+    def _move_ops(self, stored: Optional[Dict[str, Any]],
+                  data: Dict[str, Any]) -> Tuple[Optional[str], List[Tuple[str, str, str, Dict[str, Any]]]]:
+        old = stored.get('status') if stored else None
+        return old, [('update', self.collection_name, self.id, data),
+                     *DashboardStats.status_change(old, data['status'])]
+
+    # Status changes skip the write-behind queue: the counters move from the status stored right now
+    # (not self.status, which another supervisor may have changed since), so the write is only
+    # committed if that status is still there and retried otherwise. Two concurrent resolves
+    # then count once.
+    def _move(self, data: Dict[str, Any]) -> None:
+        backend = get_backend()
+        while True:
+            old, ops = self._move_ops(backend.get(self.collection_name, self.id), data)
+            if backend.commit_if(ops, self.collection_name, self.id, 'status', old):
+                return
+
+    async def _amove(self, data: Dict[str, Any]) -> None:
+        backend = get_backend()
+        while True:
+            old, ops = self._move_ops(await backend.aget(self.collection_name, self.id), data)
+            if await backend.acommit_if(ops, self.collection_name, self.id, 'status', old):
+                return
+
     def resolve(self, answer: str) -> bool:
         """Resolve this request with an answer"""
         now = datetime.now()
@@ -97,7 +215,7 @@ class Request:
             'updated_at': now
         }
 
-        db.collection(self.collection_name).document(self.id).update(update_data)
+        self._move(update_data)
 
         # Update instance
         self.status = 'resolved'
@@ -116,7 +234,7 @@ class Request:
             'updated_at': now
         }
 
-        db.collection(self.collection_name).document(self.id).update(update_data)
+        self._move(update_data)
 
         # Update instance
         self.status = 'unresolved'
@@ -125,13 +243,125 @@ class Request:
 
         return True
 
+    @staticmethod
+    def _status_filters(status: str, since: Optional[datetime], until: Optional[datetime]) -> List[Tuple[str, str, Any]]:
+        where = [('status', '==', status)]
+        if since:
+            where.append(('created_at', '>=', since))
+        if until:
+            where.append(('created_at', '<', until))
+        return where
+
+    @classmethod
+    def query_by_status(cls, status: str, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                        limit: Optional[int] = None, start_after: Optional[str] = None,
+                        fields: Optional[List[str]] = None, newest_first: bool = True) -> Iterator['Request']:
+        """Stream requests with a status, created in [since, until), by created_at.
+
+        Uses the (status, created_at) composite index (see firestore.indexes.json),
+        so reads are bounded by limit no matter how many requests there are.
+        """
+        query = get_backend().query(cls.collection_name, where=cls._status_filters(status, since, until),
+                                    order_by='created_at', descending=newest_first,
+                                    limit=limit, start_after=start_after, fields=fields)
+        for data in query:
+            yield cls(**data)
+
     @classmethod
     def has_pending_request_for_call(cls, call_id: str) -> bool:
         """Check if there is a pending request for a specific call ID."""
-        query = db.collection(cls.collection_name).where('call_id', '==', call_id).where('status', '==', 'pending').get()
-        query = query.stream()
+        query = get_backend().query(cls.collection_name, where=[('call_id', '==', call_id), ('status', '==', 'pending')],
+                                    limit=1, fields=['status'])
         for i in query:
-            return True, i.id
+            return True, i['id']
+        return False, None
+
+    # Async variants (same semantics, on the backend's async API)
+
+    @classmethod
+    async def acreate(cls, customer_phone: str, query: str, call_id: str, category: str) -> 'Request':
+        """Create a new request in the database"""
+        now = datetime.now()
+        new_request = {
+            'customer_phone': customer_phone,
+            'query': query,
+            'call_id': call_id,
+            'status': 'pending',
+            'category': category,
+            'created_at': now,
+            'updated_at': now
+        }
+        doc_id = _new_id(cls.collection_name)
+        await _acommit([('set', cls.collection_name, doc_id, new_request), DashboardStats.op(pending=1)])
+        new_request['id'] = doc_id
+        return cls(**new_request)
+
+    @classmethod
+    async def aget(cls, request_id: str) -> Optional['Request']:
+        """Get a request by ID"""
+        data = await get_backend().aget(cls.collection_name, request_id)
+        return cls(**data) if data else None
+
+    @classmethod
+    async def aget_pending_requests(cls, limit: Optional[int] = None, start_after: Optional[str] = None,
+                                    fields: Optional[List[str]] = None) -> List['Request']:
+        """Get pending requests, oldest first (all of them, or one page after the start_after request id)"""
+        query = get_backend().aquery(cls.collection_name, where=[('status', '==', 'pending')], order_by='created_at',
+                                     limit=limit, start_after=start_after, fields=fields)
+        return [cls(**data) async for data in query]
+
+    @classmethod
+    async def aget_request_history(cls, limit: int = 50) -> List['Request']:
+        """Get request history"""
+        query = get_backend().aquery(cls.collection_name, order_by='created_at', descending=True, limit=limit)
+        return [cls(**data) async for data in query]
+
+    async def aresolve(self, answer: str) -> bool:
+        """Resolve this request with an answer"""
+        now = datetime.now()
+        await self._amove({
+            'status': 'resolved',
+            'answer': answer,
+            'resolved_at': now,
+            'updated_at': now
+        })
+        self.status = 'resolved'
+        self.answer = answer
+        self.resolved_at = now
+        self.updated_at = now
+        return True
+
+    async def amark_unresolved(self, reason: str = "Timed out") -> bool:
+        """Mark request as unresolved"""
+        now = datetime.now()
+        await self._amove({
+            'status': 'unresolved',
+            'unresolved_reason': reason,
+            'updated_at': now
+        })
+        self.status = 'unresolved'
+        self.unresolved_reason = reason
+        self.updated_at = now
+        return True
+
+    @classmethod
+    async def aquery_by_status(cls, status: str, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                               limit: Optional[int] = None, start_after: Optional[str] = None,
+                               fields: Optional[List[str]] = None, newest_first: bool = True) -> AsyncIterator['Request']:
+        """Stream requests with a status, created in [since, until), by created_at"""
+        query = get_backend().aquery(cls.collection_name, where=cls._status_filters(status, since, until),
+                                     order_by='created_at', descending=newest_first,
+                                     limit=limit, start_after=start_after, fields=fields)
+        async for data in query:
+            yield cls(**data)
+
+    @classmethod
+    async def ahas_pending_request_for_call(cls, call_id: str) -> Tuple[bool, Optional[str]]:
+        """Check if there is a pending request for a specific call ID."""
+        query = get_backend().aquery(cls.collection_name, where=[('call_id', '==', call_id), ('status', '==', 'pending')],
+                                     limit=1, fields=['status'])
+        async for data in query:
+            return True, data['id']
         return False, None
 
     def to_dict(self) -> Dict[str, Any]:
@@ -154,6 +384,22 @@ class KnowledgeBase:
     """Model for managing the AI's learned knowledge"""
     collection_name = 'knowledge_base'
 
+    # process-local search index. create() in this process updates it right away; entries
+    # created elsewhere (the admin app) show up when it is rebuilt after KB_INDEX_MAX_AGE
+    _index: Optional[BM25Index] = None
+    _entries: Dict[str, 'KnowledgeBase'] = {}
+    _index_built_at: Optional[float] = None
+    _index_lock = threading.Lock()
+    # entries created while a build is reading the collection, applied again when it swaps in
+    _builds_running = 0
+    _indexed_during_build: List['KnowledgeBase'] = []
+    _refreshing = False
+    # fields an update through create() leaves as they are
+    _stored_fields = ['key_phrase', 'question', 'created_at', 'created_by']
+    # embedding matrix for semantic search (only built in semantic mode)
+    _encoder = None
+    _vectors = None
+
     def __init__(self, id: str = None, key_phrase: str = None,
                  question: str = None, answer: str = None,
                  created_at: datetime = None, updated_at: datetime = None,
@@ -181,56 +427,251 @@ class KnowledgeBase:
         }
 
         # Check if knowledge already exists
-        existing = db.collection(cls.collection_name).where('key_phrase', '==', key_phrase).limit(1).get()
+        backend = get_backend()
+        existing = list(backend.query(cls.collection_name, where=[('key_phrase', '==', key_phrase)],
+                                      limit=1, fields=cls._stored_fields))
 
         if len(existing) > 0:
             # Update existing knowledge
-            doc_id = existing[0].id
-            db.collection(cls.collection_name).document(doc_id).update({
+            doc_id = existing[0]['id']
+            backend.update(cls.collection_name, doc_id, {
                 'answer': answer,
                 'updated_at': now
             })
-            new_knowledge['id'] = doc_id
+            # only the answer changed, index what is actually stored
+            new_knowledge.update(existing[0])
         else:
             # Add new knowledge
-            doc_ref = db.collection(cls.collection_name).document()
-            doc_ref.set(new_knowledge)
-            new_knowledge['id'] = doc_ref.id
+            doc_id = backend.new_id(cls.collection_name)
+            backend.set(cls.collection_name, doc_id, new_knowledge)
+            new_knowledge['id'] = doc_id
+
+        entry = cls(**new_knowledge)
+        cls._index_entry(entry)
+        return entry
+
+    @classmethod
+    def _build_started(cls) -> None:
+        with cls._index_lock:
+            cls._builds_running += 1
+
+    @classmethod
+    def _build_finished(cls) -> None:
+        with cls._index_lock:
+            cls._builds_running -= 1
+            if not cls._builds_running:
+                cls._indexed_during_build = []
+
+    @classmethod
+    def build_index(cls, semantic: Optional[bool] = None) -> None:
+        """Load every entry once and build the in-memory search index"""
+        cls._build_started()
+        try:
+            cls._load_index(cls.get_all(), semantic)
+        finally:
+            cls._build_finished()
+
+    @classmethod
+    async def abuild_index(cls, semantic: Optional[bool] = None) -> None:
+        """Async variant of build_index"""
+        cls._build_started()
+        try:
+            cls._load_index(await cls.aget_all(), semantic)
+        finally:
+            cls._build_finished()
 
-        return cls(**new_knowledge)
+    @classmethod
+    def index_stale(cls) -> bool:
+        age = cls.index_age()
+        return age is None or age > KB_INDEX_MAX_AGE
+
+    @classmethod
+    def _refresh_in_background(cls) -> None:
+        """Rebuild a stale index in a thread, searches keep using the current one meanwhile"""
+        with cls._index_lock:
+            if cls._refreshing:
+                return
+            cls._refreshing = True
+
+        def refresh():
+            try:
+                cls.build_index()
+            finally:
+                cls._refreshing = False
+        threading.Thread(target=refresh, name="kb-index-refresh", daemon=True).start()
+
+    @classmethod
+    def _load_index(cls, all_entries: List['KnowledgeBase'], semantic: Optional[bool]) -> None:
+        if semantic is None:
+            semantic = KB_SEARCH_MODE == 'semantic'
+        index = BM25Index()
+        entries = {}
+        for entry in all_entries:
+            entries[entry.id] = entry
+            index.add(entry.id, entry._search_text())
+
+        encoder, vectors = cls._encoder, cls._vectors
+        if semantic:
+            from db.embeddings import EmbeddingIndex, get_encoder
+            encoder = encoder or get_encoder()
+            # searches keep reading the live index, so the build changes a copy that is swapped in below
+            if vectors is None:
+                vectors = EmbeddingIndex(encoder.dim, path=KB_EMBEDDINGS_PATH, encoder_name=encoder.name)
+            else:
+                with cls._index_lock:
+                    vectors = vectors.copy()
+            # only entries missing from the persisted matrix need encoding
+            missing = [entry for entry in entries.values() if entry.id not in vectors]
+            if missing:
+                vectors.add([e.id for e in missing], encoder.encode([e._search_text() for e in missing]))
+            # deleted entries keep their rows in the shared file, they just stop matching
+            vectors.retain(entries)
+
+        with cls._index_lock:
+            # create() calls that landed after the collection was read would be lost in the swap
+            late = list(cls._indexed_during_build)
+            for entry in late:
+                entries[entry.id] = entry
+                index.add(entry.id, entry._search_text())
+            if late and vectors is not None:
+                vectors.add([e.id for e in late], encoder.encode([e._search_text() for e in late]))
+            cls._index, cls._entries = index, entries
+            cls._encoder, cls._vectors = encoder, vectors
+            cls._index_built_at = time.time()
 
     @classmethod
-    def search(cls, query: str) -> List['KnowledgeBase']:
-        """Search knowledge base for relevant information"""
-        results = []
-        all_knowledge = db.collection(cls.collection_name).stream()
+    def index_ready(cls) -> bool:
+        return cls._index is not None
 
-        # Simple search
-        #(I was thinking we could have a db of key_phrases and we update the db with new key phrases)
-        # (so searching for the key phrase would be fixed, defined and faster)
-        query_terms = query.lower().split()
+    @classmethod
+    def _index_entry(cls, entry: 'KnowledgeBase') -> None:
+        """Add or replace an entry in the search index (if one was built)"""
+        with cls._index_lock:
+            if cls._builds_running:
+                cls._indexed_during_build.append(entry)
+            if cls._index is None:
+                return
+            cls._entries[entry.id] = entry
+            cls._index.add(entry.id, entry._search_text())
+            if cls._vectors is not None:
+                cls._vectors.add([entry.id], cls._encoder.encode([entry._search_text()]))
+
+    def _search_text(self) -> str:
+        # the key phrase is what supervisors pick on purpose, so it counts double
+        return f"{self.key_phrase or ''} {self.key_phrase or ''} {self.question or ''}"
+
+    @classmethod
+    def search_scored(cls, query: str, limit: int = 5,
+                      mode: Optional[str] = None) -> List[Tuple['KnowledgeBase', float]]:
+        """Ranked (entry, score) pairs. BM25 scores in keyword mode, cosine in semantic mode."""
+        mode = mode or KB_SEARCH_MODE
+        if cls._index is None or (mode == 'semantic' and cls._vectors is None) or cls.index_stale():
+            cls.build_index(semantic=mode == 'semantic')
+
+        # ranking happens in memory, no database reads per search
+        with cls._index_lock:
+            if mode == 'semantic':
+                hits = cls._vectors.search(cls._encoder.encode([query])[0], limit=limit + cls._unknown_rows())
+            else:
+                hits = cls._index.search(query, limit=limit)
+            return [(cls._entries[doc_id], score) for doc_id, score in hits if doc_id in cls._entries][:limit]
+
+    @classmethod
+    def _unknown_rows(cls) -> int:
+        # rows other processes appended for entries this one hasn't loaded yet can outrank
+        # ours, so semantic searches ask for that many extra hits
+        return max(0, len(cls._vectors) - len(cls._entries))
 
-        for doc in all_knowledge:
-            data = doc.to_dict()
-            key_phrase = data.get('key_phrase', '').lower()
+    @classmethod
+    def best_match(cls, query: str, mode: Optional[str] = None) -> Optional[Tuple['KnowledgeBase', float]]:
+        """Best entry with a 0-1 confidence, using only an already built index (no database reads)"""
+        mode = mode or KB_SEARCH_MODE
+        if cls._index is None or (mode == 'semantic' and cls._vectors is None):
+            return None
+        if cls.index_stale():
+            cls._refresh_in_background()
+
+        with cls._index_lock:
+            if mode == 'semantic':
+                hits = cls._vectors.search(cls._encoder.encode([query])[0], limit=1 + cls._unknown_rows())
+                hits = [hit for hit in hits if hit[0] in cls._entries][:1]
+                confidence = hits[0][1] if hits else 0.0
+            else:
+                hits = cls._index.search(query, limit=1)
+                confidence = cls._index.coverage(query, hits[0][0]) if hits else 0.0
+            if not hits or hits[0][0] not in cls._entries:
+                return None
+            return cls._entries[hits[0][0]], confidence
 
-            # Check if any term is in the key phrase
-            if any(term in key_phrase for term in query_terms):
-                data['id'] = doc.id
-                results.append(cls(**data))
+    @classmethod
+    def index_age(cls) -> Optional[float]:
+        """Seconds since the search index was last built"""
+        return time.time() - cls._index_built_at if cls._index_built_at else None
 
-        return results
+    @classmethod
+    def search(cls, query: str, limit: int = 5, mode: Optional[str] = None) -> List['KnowledgeBase']:
+        """Search knowledge base for relevant information, best match first"""
+        return [entry for entry, _ in cls.search_scored(query, limit=limit, mode=mode)]
 
     @classmethod
-    def get_all(cls) -> List['KnowledgeBase']:
-        """Get all knowledge base entries"""
+    def get_all(cls, limit: Optional[int] = None, start_after: Optional[str] = None,
+                fields: Optional[List[str]] = None) -> List['KnowledgeBase']:
+        """Get knowledge base entries in id order (all of them, or one page after the start_after id)"""
         entries = []
-        for doc in db.collection(cls.collection_name).stream():
-            data = doc.to_dict()
-            data['id'] = doc.id
+        for data in get_backend().query(cls.collection_name, limit=limit, start_after=start_after, fields=fields):
             entries.append(cls(**data))
         return entries
 
+    # Async variants (same semantics, on the backend's async API)
+
+    @classmethod
+    async def acreate(cls, key_phrase: str, question: str, answer: str,
+                      created_by: str = "system") -> 'KnowledgeBase':
+        """Add new knowledge to the knowledge base"""
+        now = datetime.now()
+        new_knowledge = {
+            'key_phrase': key_phrase,
+            'question': question,
+            'answer': answer,
+            'created_at': now,
+            'updated_at': now,
+            'created_by': created_by
+        }
+
+        backend = get_backend()
+        existing = [data async for data in backend.aquery(cls.collection_name, where=[('key_phrase', '==', key_phrase)],
+                                                          limit=1, fields=cls._stored_fields)]
+        if len(existing) > 0:
+            doc_id = existing[0]['id']
+            await backend.aupdate(cls.collection_name, doc_id, {
+                'answer': answer,
+                'updated_at': now
+            })
+            new_knowledge.update(existing[0])
+        else:
+            doc_id = backend.new_id(cls.collection_name)
+            await backend.aset(cls.collection_name, doc_id, new_knowledge)
+            new_knowledge['id'] = doc_id
+
+        entry = cls(**new_knowledge)
+        cls._index_entry(entry)
+        return entry
+
+    @classmethod
+    async def asearch(cls, query: str, limit: int = 5, mode: Optional[str] = None) -> List['KnowledgeBase']:
+        """Search knowledge base for relevant information, best match first"""
+        mode = mode or KB_SEARCH_MODE
+        if cls._index is None or (mode == 'semantic' and cls._vectors is None) or cls.index_stale():
+            await cls.abuild_index(semantic=mode == 'semantic')
+        return cls.search(query, limit=limit, mode=mode)
+
+    @classmethod
+    async def aget_all(cls, limit: Optional[int] = None, start_after: Optional[str] = None,
+                       fields: Optional[List[str]] = None) -> List['KnowledgeBase']:
+        """Get knowledge base entries in id order (all of them, or one page after the start_after id)"""
+        query = get_backend().aquery(cls.collection_name, limit=limit, start_after=start_after, fields=fields)
+        return [cls(**data) async for data in query]
+
     def to_dict(self) -> Dict[str, Any]:
         """Convert instance to dictionary"""
         return {
@@ -247,6 +688,7 @@ class KnowledgeBase:
 class CallHistory:
     """Model for tracking call metrics and history (optional)"""
     collection_name = 'call_history'
+    _end_listeners: List[Callable[[str], None]] = []
 
     def __init__(self, id: Optional[str] = None, customer_phone: str = None,
                  start_time: datetime = None, end_time: datetime = None, duration_seconds: int = 0,
@@ -269,22 +711,37 @@ class CallHistory:
             'ai_handled': True
         }
 
-        doc_ref = db.collection(cls.collection_name).document()
-        doc_ref.set(new_call)
+        doc_id = _new_id(cls.collection_name)
+        _commit([('set', cls.collection_name, doc_id, new_call),
+                 DashboardStats.op(total_calls=1, ai_handled_calls=1)])
 
-        new_call['id'] = doc_ref.id
+        new_call['id'] = doc_id
         return cls(**new_call)
 
+    def _handled_change(self, handled: bool) -> List[Tuple[str, str, str, Dict[str, Any]]]:
+        if bool(handled) == bool(self.ai_handled):
+            return []
+        return [DashboardStats.op(ai_handled_calls=1 if handled else -1)]
+
     def set_ai_handled(self, handled: bool) -> None:
         """Set whether the AI handled the request"""
         new_data = {
             'ai_handled': handled,
             'updated_at': datetime.now()
         }
-        db.collection(self.collection_name).document(self.id).update(new_data)
+        _commit([('update', self.collection_name, self.id, new_data), *self._handled_change(handled)])
         self.ai_handled = handled
         self.updated_at = new_data['updated_at']
 
+    @classmethod
+    def on_end(cls, listener: Callable[[str], None]) -> None:
+        """Call listener(call_id) whenever a call ends in this process (to drop per-call state)"""
+        cls._end_listeners.append(listener)
+
+    def _ended(self) -> None:
+        for listener in self._end_listeners:
+            listener(self.id)
+
     def end_call(self, escalated: bool = False, request_id: Optional[str] = None) -> 'CallHistory':
         """End the call and calculate duration"""
         now = datetime.now()
@@ -299,13 +756,14 @@ class CallHistory:
         if request_id:
             update_data['request_id'] = request_id
 
-        db.collection(self.collection_name).document(self.id).update(update_data)
+        _commit([('update', self.collection_name, self.id, update_data), *self._handled_change(not escalated)])
 
         # Update instance
         self.end_time = now
         self.duration_seconds = duration
         self.ai_handled = not escalated
         self.request_id = request_id
+        self._ended()
 
         return self
 
@@ -313,12 +771,62 @@ class CallHistory:
     def get_all(cls) -> List['CallHistory']:
         """Get all call history entries"""
         calls = []
-        for doc in db.collection(cls.collection_name).stream():
-            data = doc.to_dict()
-            data['id'] = doc.id
+        for data in get_backend().query(cls.collection_name):
             calls.append(cls(**data))
         return calls
 
+    # Async variants (same semantics, on the backend's async API)
+
+    @classmethod
+    async def acreate(cls, customer_phone: str) -> 'CallHistory':
+        """Record a new call"""
+        new_call = {
+            'customer_phone': customer_phone,
+            'start_time': datetime.now(),
+            'ai_handled': True
+        }
+        doc_id = _new_id(cls.collection_name)
+        await _acommit([('set', cls.collection_name, doc_id, new_call),
+                        DashboardStats.op(total_calls=1, ai_handled_calls=1)])
+        new_call['id'] = doc_id
+        return cls(**new_call)
+
+    async def aset_ai_handled(self, handled: bool) -> None:
+        """Set whether the AI handled the request"""
+        new_data = {
+            'ai_handled': handled,
+            'updated_at': datetime.now()
+        }
+        await _acommit([('update', self.collection_name, self.id, new_data), *self._handled_change(handled)])
+        self.ai_handled = handled
+        self.updated_at = new_data['updated_at']
+
+    async def aend_call(self, escalated: bool = False, request_id: Optional[str] = None) -> 'CallHistory':
+        """End the call and calculate duration"""
+        now = datetime.now()
+        duration = int((now - self.start_time).total_seconds())
+        update_data = {
+            'end_time': now,
+            'duration_seconds': duration,
+            'ai_handled': not escalated
+        }
+        if request_id:
+            update_data['request_id'] = request_id
+
+        await _acommit([('update', self.collection_name, self.id, update_data),
+                        *self._handled_change(not escalated)])
+        self.end_time = now
+        self.duration_seconds = duration
+        self.ai_handled = not escalated
+        self.request_id = request_id
+        self._ended()
+        return self
+
+    @classmethod
+    async def aget_all(cls) -> List['CallHistory']:
+        """Get all call history entries"""
+        return [cls(**data) async for data in get_backend().aquery(cls.collection_name)]
+
     def to_dict(self) -> Dict[str, Any]:
         """Convert instance to dictionary"""
         return {
@@ -0,0 +1,422 @@
+import asyncio
+import fcntl
+import glob
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from db.backends.base import Increment
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_DIR = os.getenv('OUTBOX_DIR', os.path.join(os.path.dirname(__file__), 'engine', 'outbox'))
+
+# Firestore allows at most 500 writes in one batch
+MAX_BATCH = 500
+# a batch rejected as invalid this many times in a row is split to find the bad writes, which
+# go to a dead-letter file; anything else (timeouts, unavailable) is retried with backoff forever
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '3'))
+# errors that mean the write itself is bad and resending it can never work (google.api_core
+# names, matched by name so other backends don't need the Google libraries)
+PERMANENT_ERRORS = {'InvalidArgument', 'FailedPrecondition', 'OutOfRange', 'RequestEntityTooLarge'}
+
+# one document per outbox holding the highest sequence number committed from it, written in the
+# same atomic commit as the writes, so a replay can tell which writes already landed
+APPLIED_COLLECTION = 'outbox_applied'
+
+# (op, collection, doc_id, data) where op is 'set' or 'update'
+WriteOp = Tuple[str, str, str, Dict[str, Any]]
+# (outbox id, sequence number, write) as held in the queue
+Entry = Tuple[str, int, WriteOp]
+
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {'$date': value.isoformat()}
+    if isinstance(value, Increment):
+        return {'$inc': value.amount}
+    if isinstance(value, dict):
+        return {k: _encode(v) for k, v in value.items()}
+    return value
+
+
+def _decode(value: Any) -> Any:
+    if isinstance(value, dict):
+        if set(value) == {'$date'}:
+            return datetime.fromisoformat(value['$date'])
+        if set(value) == {'$inc'}:
+            return Increment(value['$inc'])
+        return {k: _decode(v) for k, v in value.items()}
+    return value
+
+
+def _merge(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    merged = dict(old)
+    for key, value in new.items():
+        if isinstance(value, Increment) and isinstance(merged.get(key), Increment):
+            merged[key] = merged[key] + value
+        else:
+            merged[key] = value
+    return merged
+
+
+def coalesce(ops: List[WriteOp]) -> List[WriteOp]:
+    """Merge writes to the same document so each one is written once per batch"""
+    merged: Dict[Tuple[str, str], list] = {}
+    for op, collection, doc_id, data in ops:
+        key = (collection, doc_id)
+        if key in merged:
+            # set + update stays a set, update + update stays an update; later fields win,
+            # increments to the same field add up
+            merged[key][3] = _merge(merged[key][3], data)
+            if op == 'set':
+                merged[key][0] = 'set'
+        else:
+            merged[key] = [op, collection, doc_id, dict(data)]
+    return [tuple(op) for op in merged.values()]
+
+
+def commit_to_backend(ops: List[WriteOp]) -> None:
+    """Commit ops atomically on the configured storage backend (a WriteBatch on Firestore)"""
+    from db.backends import get_backend
+    get_backend().commit(ops)
+
+
+def is_permanent(error: Exception) -> bool:
+    """True for commit errors that retrying can't fix (a malformed or oversized write)"""
+    if isinstance(error, (ValueError, TypeError)):
+        return True
+    return any(cls.__name__ in PERMANENT_ERRORS for cls in type(error).__mro__)
+
+
+def applied_on_backend(outbox_id: str) -> int:
+    """Highest sequence number of the given outbox that has been committed (0 if none)"""
+    from db.backends import get_backend
+    data = get_backend().get(APPLIED_COLLECTION, outbox_id)
+    return int((data or {}).get('seq') or 0)
+
+
+def _fsync_dir(path: str) -> None:
+    # makes a rename durable, not just the renamed file's contents
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class WriteBehindQueue:
+    """Buffers model writes and commits them in batches off the event loop.
+
+    Every write is appended to a per-process outbox file before it is queued,
+    so a crash or a database outage loses nothing: the outbox is replayed on
+    the next start (including outboxes left behind by dead processes).
+
+    Commits that fail for a passing reason (timeouts, the database being down)
+    are retried with backoff for as long as it takes. A batch the database
+    rejects as invalid max_attempts times is split in halves until the failing
+    writes are found, and those (poison writes) are moved to
+    dead-<pid>-<time>.jsonl next to the outbox so the writes behind them go
+    through. Renaming that file to outbox-<anything>.jsonl replays it on the
+    next start.
+
+    Each write carries the id of the outbox it was first queued in and a sequence
+    number, and every commit also records the highest number it applied per outbox.
+    Before a replay (or a retry after a commit that may have landed anyway) the
+    writes at or below that mark are dropped, so counter increments are never
+    applied twice.
+    """
+
+    def __init__(self, commit=commit_to_backend, outbox_dir: str = OUTBOX_DIR,
+                 max_delay: float = 0.2, max_batch: int = MAX_BATCH,
+                 max_attempts: int = OUTBOX_MAX_ATTEMPTS, applied=applied_on_backend):
+        self._commit = commit
+        self._applied = applied
+        self.max_delay = max_delay
+        self.max_batch = min(max_batch, MAX_BATCH)
+        self.max_attempts = max_attempts
+        self._pending: List[Entry] = []
+        self.outbox_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._seq = 0
+        # outboxes whose writes may have been committed already, checked before the next commit
+        self._check: Set[str] = set()
+        # size of the batch being retried, so every attempt commits the same writes
+        self._retrying = 0
+        self._attempts = 0
+        # writes at the head of the queue from a batch that kept failing, tried in halves
+        self._suspect = 0
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+
+        os.makedirs(outbox_dir, exist_ok=True)
+        self._outbox_dir = outbox_dir
+        self._path = os.path.join(outbox_dir, f"outbox-{os.getpid()}.jsonl")
+        self._file = open(self._path, 'a+', encoding='utf-8')
+        # the lock tells other processes this outbox is still owned
+        fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self._recover()
+
+        self.committed = 0
+        self.batches = 0
+        self.failures = 0
+        self.dead_lettered = 0
+
+    def _recover(self) -> None:
+        """Load our own outbox plus any outbox whose process is gone"""
+        self._file.seek(0)
+        self._pending.extend(self._claim(self._read(self._file)))
+        self._rewrite()
+
+        for path in glob.glob(os.path.join(self._outbox_dir, 'outbox-*.jsonl')):
+            if path == self._path:
+                continue
+            try:
+                file = open(path, 'r', encoding='utf-8')
+            except FileNotFoundError:
+                continue  # another worker claimed it first
+            with file:
+                try:
+                    fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue  # a live worker owns it
+                try:
+                    claimed = os.stat(path).st_ino == os.fstat(file.fileno()).st_ino
+                except FileNotFoundError:
+                    claimed = False
+                if not claimed:
+                    continue  # we opened it just before another worker took and removed it
+                entries = self._claim(self._read(file))
+                self._append(entries)
+                os.fsync(self._file.fileno())
+                self._pending.extend(entries)
+                # removed while we still hold the lock, so nobody else can replay it
+                os.remove(path)
+
+        if self._pending:
+            logger.info(f"Recovered {len(self._pending)} unsent writes from the outbox")
+
+    @staticmethod
+    def _read(file) -> List[Tuple[Optional[str], int, WriteOp]]:
+        entries = []
+        for line in file:
+            try:
+                op, collection, doc_id, data, *origin = json.loads(line)
+            except ValueError:
+                continue  # torn last line from a crash mid-write
+            outbox_id, seq = origin if len(origin) == 2 else (None, 0)
+            entries.append((outbox_id, seq, (op, collection, doc_id, _decode(data))))
+        return entries
+
+    def _next_seq(self) -> int:
+        self._seq += 1
+        return self._seq
+
+    def _claim(self, entries: List[Tuple[Optional[str], int, WriteOp]]) -> List[Entry]:
+        """Recovered writes: ones from an outbox get checked against its applied mark,
+        ones without (a dead-letter file put back) were never committed and are new"""
+        claimed = []
+        for outbox_id, seq, op in entries:
+            if outbox_id is None:
+                outbox_id, seq = self.outbox_id, self._next_seq()
+            else:
+                self._check.add(outbox_id)
+            claimed.append((outbox_id, seq, op))
+        return claimed
+
+    def _append(self, entries: List[Entry]) -> None:
+        self._write_entries(self._file, entries)
+
+    @staticmethod
+    def _write_entries(file, entries: List[Entry]) -> None:
+        file.seek(0, os.SEEK_END)
+        for outbox_id, seq, (op, collection, doc_id, data) in entries:
+            file.write(json.dumps([op, collection, doc_id, _encode(data), outbox_id, seq]) + '\n')
+        file.flush()
+
+    def _rewrite(self) -> None:
+        """Shrink the outbox down to the writes that are still pending (at start, before the loop runs)"""
+        self._swap_outbox(self._write_outbox(self._pending), [])
+        _fsync_dir(self._outbox_dir)
+
+    async def _arewrite(self) -> None:
+        """_rewrite without blocking the loop on the fsync; writes enqueued meanwhile are carried over"""
+        with self._lock:
+            snapshot = list(self._pending)
+        new = await asyncio.to_thread(self._write_outbox, snapshot)
+        with self._lock:
+            # only flush() removes writes and it is waiting on us, so the rest are new ones
+            self._swap_outbox(new, self._pending[len(snapshot):])
+        await asyncio.to_thread(_fsync_dir, self._outbox_dir)
+
+    def _write_outbox(self, entries: List[Entry]):
+        """The new outbox contents in a locked, fsynced temp file.
+
+        It is renamed over the outbox afterwards, so a crash at any point leaves either
+        the old or the new file whole, never a truncated one.
+        """
+        new = open(self._path + '.tmp', 'w+', encoding='utf-8')
+        # locked before the rename, so other workers never see the outbox unowned
+        fcntl.flock(new, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self._write_entries(new, entries)
+        os.fsync(new.fileno())
+        return new
+
+    def _swap_outbox(self, new, late: List[Entry]) -> None:
+        self._write_entries(new, late)
+        os.replace(self._path + '.tmp', self._path)
+        old, self._file = self._file, new
+        old.close()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def enqueue(self, op: str, collection: str, doc_id: str, data: Dict[str, Any]) -> None:
+        """Record a write; returns immediately, the commit happens in the background"""
+        self.enqueue_many([(op, collection, doc_id, data)])
+
+    def enqueue_many(self, ops: List[WriteOp]) -> None:
+        """Record writes that belong together; they reach the outbox in one append"""
+        # copy, callers keep using their dicts after handing them over
+        with self._lock:
+            writes = [(self.outbox_id, self._next_seq(), (op, collection, doc_id, dict(data)))
+                      for op, collection, doc_id, data in ops]
+            self._append(writes)
+            self._pending.extend(writes)
+        if self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def start(self) -> None:
+        """Start the background flusher on the running loop"""
+        loop = asyncio.get_running_loop()
+        if self._task is not None and not self._task.done() and self._task.get_loop() is loop:
+            return
+        self._loop = loop
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = loop.create_task(self._run())
+        if self._pending:
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        backoff = self.max_delay
+        while True:
+            await self._wakeup.wait()
+            # give concurrent calls a moment to add their writes to the same batch
+            await asyncio.sleep(self.max_delay)
+            try:
+                await self.flush()
+                backoff = self.max_delay
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"Write-behind commit failed, retrying in {backoff:.1f}s: {e}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+                self._wakeup.set()
+
+    async def flush(self) -> None:
+        """Commit everything queued so far"""
+        async with self._flush_lock:
+            self._wakeup.clear()
+            while self._pending:
+                if self._check:
+                    await self._drop_applied()
+                    continue
+                with self._lock:
+                    taken = self._pending[:self._retrying or self.max_batch]
+                # room for the applied marks in the same commit
+                origins = {outbox_id for outbox_id, _, _ in taken}
+                if len(taken) + len(origins) > MAX_BATCH:
+                    taken = taken[:MAX_BATCH - len(origins)]
+                ops = [op for _, _, op in taken]
+                try:
+                    await asyncio.to_thread(self._commit, coalesce(ops) + self._applied_marks(taken))
+                except Exception as e:
+                    # a commit that timed out may still have landed, look before sending it again
+                    self._check.update(origins)
+                    self._retrying = len(taken)
+                    if not is_permanent(e):
+                        raise  # _run backs off and tries the same batch again
+                    if not self._suspect:
+                        self._attempts += 1
+                        if self._attempts < self.max_attempts:
+                            raise
+                        self._suspect = len(taken)
+                    if len(taken) > 1:
+                        self._retrying = len(taken) // 2
+                        # don't hammer the database while narrowing it down
+                        await asyncio.sleep(self.max_delay)
+                        continue
+                    self._dead_letter(ops)
+                else:
+                    self.committed += len(taken)
+                    self.batches += 1
+                self._attempts = 0
+                self._suspect = max(0, self._suspect - len(taken))
+                self._retrying = min(self._retrying, self._suspect)
+                # writes enqueued during the commit stay behind the ones just sent
+                with self._lock:
+                    del self._pending[:len(taken)]
+                await self._arewrite()
+
+    @staticmethod
+    def _applied_marks(entries: List[Entry]) -> List[WriteOp]:
+        highest: Dict[str, int] = {}
+        for outbox_id, seq, _ in entries:
+            highest[outbox_id] = max(seq, highest.get(outbox_id, 0))
+        return [('set', APPLIED_COLLECTION, outbox_id, {'seq': seq, 'updated_at': datetime.now()})
+                for outbox_id, seq in highest.items()]
+
+    async def _drop_applied(self) -> None:
+        """Drop queued writes that an earlier commit (ours or a dead process's) already applied"""
+        origins = list(self._check)
+        applied = {outbox_id: await asyncio.to_thread(self._applied, outbox_id) for outbox_id in origins}
+        with self._lock:
+            kept = [entry for entry in self._pending if entry[1] > applied.get(entry[0], 0)]
+            dropped = len(self._pending) - len(kept)
+            if dropped:
+                self._pending[:] = kept
+        if dropped:
+            await self._arewrite()
+        self._check.difference_update(origins)
+        if dropped:
+            # whatever was being retried went through after all
+            self._retrying = self._attempts = self._suspect = 0
+            logger.info(f"Skipped {dropped} outbox writes that were already committed")
+
+    def _dead_letter(self, ops: List[WriteOp]) -> None:
+        path = os.path.join(self._outbox_dir, f"dead-{os.getpid()}-{int(time.time())}.jsonl")
+        with open(path, 'a', encoding='utf-8') as file:
+            for op, collection, doc_id, data in ops:
+                file.write(json.dumps([op, collection, doc_id, _encode(data)]) + '\n')
+        self.dead_lettered += len(ops)
+        logger.error(f"The database rejected {len(ops)} write(s) {self.max_attempts} times, moved to {path}")
+
+    async def close(self) -> None:
+        if self._flush_lock is not None:
+            await self.flush()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+_queue: Optional[WriteBehindQueue] = None
+
+
+def start_write_behind(**kwargs) -> WriteBehindQueue:
+    """Create (once per process) and start the write-behind queue, and route model writes through it"""
+    global _queue
+    if _queue is None:
+        _queue = WriteBehindQueue(**kwargs)
+        from db import models
+        models.enable_write_behind(_queue)
+    _queue.start()
+    return _queue
@@ -0,0 +1,103 @@
+import heapq
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Tuple
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# very common words carry no signal for matching a question to an answer
+STOP_WORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "can", "do", "does", "for", "how", "i", "in",
+    "is", "it", "me", "my", "of", "on", "or", "the", "to", "we", "what", "when", "where",
+    "which", "who", "you", "your",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens without stop words, with a plural 's' folded away"""
+    tokens = []
+    for token in TOKEN_RE.findall((text or "").lower()):
+        if token in STOP_WORDS:
+            continue
+        # "hours" and "hour" should meet, same as the old substring search did
+        if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class BM25Index:
+    """Process-local inverted index with Okapi BM25 scoring"""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._doc_lengths: Dict[str, int] = {}
+        self._doc_terms: Dict[str, Tuple[str, ...]] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._doc_lengths)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._doc_lengths
+
+    def add(self, doc_id: str, text: str) -> None:
+        """Index a document, replacing any previous version with the same id"""
+        if doc_id in self._doc_lengths:
+            self.remove(doc_id)
+
+        tokens = tokenize(text)
+        counts = Counter(tokens)
+        for term, tf in counts.items():
+            self._postings.setdefault(term, {})[doc_id] = tf
+        self._doc_terms[doc_id] = tuple(counts)
+        self._doc_lengths[doc_id] = len(tokens)
+        self._total_length += len(tokens)
+
+    def remove(self, doc_id: str) -> None:
+        length = self._doc_lengths.pop(doc_id, None)
+        if length is None:
+            return
+        self._total_length -= length
+        for term in self._doc_terms.pop(doc_id):
+            docs = self._postings[term]
+            del docs[doc_id]
+            if not docs:
+                del self._postings[term]
+
+    def _idf(self, term: str) -> float:
+        df = len(self._postings.get(term, ()))
+        n = len(self._doc_lengths)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, limit: int = 5) -> List[Tuple[str, float]]:
+        """Return the top (doc_id, score) pairs for the query, best first"""
+        if not self._doc_lengths:
+            return []
+
+        avg_length = self._total_length / len(self._doc_lengths) or 1.0
+        k1, b = self.k1, self.b
+        scores: Dict[str, float] = {}
+
+        for term in set(tokenize(query)):
+            docs = self._postings.get(term)
+            if not docs:
+                continue
+            idf = self._idf(term)
+            for doc_id, tf in docs.items():
+                norm = k1 * (1 - b + b * self._doc_lengths[doc_id] / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (k1 + 1) / (tf + norm)
+
+        return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+
+    def coverage(self, query: str, doc_id: str) -> float:
+        """Share of the query's IDF weight found in the document (0 to 1)"""
+        terms = set(tokenize(query))
+        total = sum(self._idf(term) for term in terms)
+        if not total:
+            return 0.0
+        matched = sum(self._idf(term) for term in terms if doc_id in self._postings.get(term, ()))
+        return matched / total
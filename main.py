@@ -1,35 +1,48 @@
+import asyncio
 import logging
+import time
 from datetime import datetime, timezone
 from typing import Optional
 
 from dotenv import load_dotenv
-from livekit import api
-from livekit.agents import (
-    Agent,
-    AgentSession,
-    RoomInputOptions,
-    RoomOutputOptions,
-    RunContext,
-    WorkerOptions,
-    cli,
-    metrics,
-)
-from livekit.agents.llm import function_tool
-from livekit.agents.voice import MetricsCollectedEvent
 
-########################################################################################
-# I am not sure this relates to the project but i just import it to see the use case
-# which i think it should return the list of participants in the room and details
-from livekit.api import LiveKitAPI
-from livekit.api import ListParticipantsRequest
-from livekit.api import RoomParticipantIdentity
-##########################################################################################
+from utils import startup
+
+with startup.timed("livekit_imports"):
+    from livekit import api
+    from livekit.agents import (
+        Agent,
+        AgentSession,
+        JobProcess,
+        RoomInputOptions,
+        RoomOutputOptions,
+        RunContext,
+        WorkerOptions,
+        cli,
+        metrics,
+    )
+    from livekit.agents.llm import function_tool
+    from livekit.agents.voice import MetricsCollectedEvent
+
+    ########################################################################################
+    # I am not sure this relates to the project but i just import it to see the use case
+    # which i think it should return the list of participants in the room and details
+    from livekit.api import LiveKitAPI
+    from livekit.api import ListParticipantsRequest
+    from livekit.api import RoomParticipantIdentity
+    ##########################################################################################
 
-from livekit.plugins import groq, silero
+    from livekit.plugins import groq, silero
 
-# Import database models and intervention checker
-from db.models import Request, CallHistory, db
-from utils.help import needs_human_intervention
+# Import database models and intervention checker (the Firebase client is created lazily)
+with startup.timed("app_imports"):
+    from db import firebase
+    from db.backends import DB_BACKEND
+    from db.models import Request, CallHistory
+    from db.outbox import commit_to_backend, start_write_behind
+    from utils.help import needs_human_intervention, start_pattern_watcher
+    from utils import livekit_api
+    from utils import latency
 
 # Configure logging and environment
 logger = logging.getLogger("salon-agent")
@@ -96,7 +109,7 @@ class SalonAgent(Agent):
         # said in the last video interview
         needs, reason = needs_human_intervention(original_query)
         if needs:
-            req = Request.create(
+            req = await Request.acreate(
                 customer_phone=customer_phone,
                 query=original_query,
                 call_id=call_id,
@@ -116,7 +129,7 @@ class SalonAgent(Agent):
             return answer
 
         # Default escalation for unknown queries
-        req = Request.create(
+        req = await Request.acreate(
             customer_phone=customer_phone,
             query=original_query,
             call_id=call_id,
@@ -144,36 +157,82 @@ class SalonAgent(Agent):
         return None
 
 
+def create_plugins() -> dict:
+    """VAD model and STT/LLM/TTS clients for an AgentSession"""
+    return {
+        "vad": silero.VAD.load(),  # yet to know what this does but i see i need it
+        "stt": groq.STT(),  # this should be openai but i am stuck with groq for free credits
+        "llm": groq.LLM(model="llama3-8b-8192"),
+        "tts": groq.TTS(model="playai-tts"),
+    }
+
+
+def prewarm(proc: JobProcess):
+    # runs once per worker process before it takes jobs, so the Firestore channel,
+    # the VAD model and the plugin clients are ready by the time a call comes in
+    if DB_BACKEND == "firestore":
+        firebase.prewarm()
+    livekit_api.prewarm()
+    latency.start_server()
+    with startup.timed("plugins_load"):
+        proc.userdata["plugins"] = create_plugins()
+    startup.log_report("prewarm")
+
+
 async def entrypoint(ctx: RunContext):
+    accepted = time.perf_counter()
+    # loaded once per process in prewarm; only a job without prewarm pays for it here
+    plugins = ctx.proc.userdata.get("plugins")
+    warm = plugins is not None
+    if not warm:
+        plugins = create_plugins()
 
     # i see i can add room name and identity for participants handling
     room_name = "veluxe-beauty-lounge"
     identity = "salon-assistant" 
+    # the API connection's TLS handshake happens while the room connects
+    warm_api = asyncio.create_task(livekit_api.warm(room_name))
     await ctx.connect(room_name=room_name, identity=identity)  # hoping this would work
     logger.info(f"Connected to room: {room_name}")
+
+    # keeps the escalation phrases current without restarting the worker
+    start_pattern_watcher()
+
+    # database writes are batched in the background so they never block a turn
+    write_queue = start_write_behind(commit=latency.recorder.timed_call("db.commit", commit_to_backend))
+
+    # a plain function: LiveKit passes the shutdown reason to callbacks that take an argument,
+    # and a bound method's `self` counts as one
+    async def flush_writes():
+        await write_queue.flush()
+    ctx.add_shutdown_callback(flush_writes)
     
     # i am simulating phone number extraction which i guess would be gotten
     # from the telephony plugin or SIP :)
     customer_phone = "+2348001234567"
-    call_record = CallHistory.create(customer_phone=customer_phone)
+    call_record = await CallHistory.acreate(customer_phone=customer_phone)
     call_id = call_record.id  # simulating unique call ID generation
     logger.info(f"Call started: {call_id}")
+    startup.log_report("first call")
+
+    async def close_api():
+        logger.info(f"LiveKit API calls: {livekit_api.stats.summary()}")
+        await livekit_api.close_livekit_api()
+    ctx.add_shutdown_callback(close_api)
 
-    async with api.LiveKitAPI() as lkapi:
-        # should return list of participants in the room
-        res = await lkapi.room.list_participants(ListParticipantsRequest(
-            room=room_name
-        ))
-        logger.info(f"Participants in room: {[p.identity for p in res.participants]}") # hopefully this works
+    # should return list of participants in the room (shared pooled client, no new session per call)
+    await warm_api
+    res = await livekit_api.get_livekit_api().room.list_participants(ListParticipantsRequest(
+        room=room_name
+    ))
+    logger.info(f"Participants in room: {[p.identity for p in res.participants]}") # hopefully this works
 
     # Initializing session
     session = AgentSession(
-        vad=silero.VAD.load(),  # yet to know what this does but i see i need it
-        stt=groq.STT(),  # this should be openai but i am stuck with groq for free credits
-        llm=groq.LLM(model="llama3-8b-8192"),
-        tts=groq.TTS(model="playai-tts"),
+        **plugins,
         userdata={"call_id": call_id, "customer_phone": customer_phone}  # i will be using this in function tools
     )
+    startup.log_first_audio(session, accepted, warm)
 
     # Metrics collection
     usage = metrics.UsageCollector()  # from the docs. i see it logs out metrics of the session
@@ -181,10 +240,12 @@ async def entrypoint(ctx: RunContext):
     def log_metrics(ev: MetricsCollectedEvent):
         metrics.log_metrics(ev.metrics)
         usage.collect(ev.metrics)
+        latency.recorder.record_metrics(ev.metrics)
 
     # Shutdown should summary of the session though i am not sure this works yet
     async def on_shutdown():
         logger.info(f"Total usage: {usage.get_summary()}")
+        logger.info(f"Stage latency (ms, this worker): {latency.recorder.summary()}")
     ctx.add_shutdown_callback(on_shutdown)
 
     # Starting agent session
@@ -196,4 +257,4 @@ async def entrypoint(ctx: RunContext):
     )
 
 if __name__ == "__main__":
-    cli.run_app(WorkerOptions(entrypoint))  # code runs from here
+    cli.run_app(WorkerOptions(entrypoint, prewarm_fnc=prewarm))  # code runs from here
@@ -0,0 +1,102 @@
+import threading
+from functools import wraps
+from typing import Any, Callable, Dict, Hashable, Iterable, Set
+
+from cachetools import TTLCache
+
+
+def _freeze(value: Any) -> Hashable:
+    # lists of fields and kwargs dicts end up in keys
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    return value
+
+
+class ReadCache:
+    """In-process read cache: entries expire after ttl seconds, least recently used go first when full.
+
+    Every entry carries tags (e.g. 'pending', 'knowledge'); writes call invalidate()
+    with the tags they affect, so only the reads that could have changed are dropped.
+    Cached values are shared between callers and must be treated as read-only.
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: float = 10.0):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._tags: Dict[str, Set[Hashable]] = {}
+        # bumped by invalidate(), so a load that raced a write isn't cached
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get_or_load(self, key: Hashable, load: Callable[[], Any], tags: Iterable[str] = ()) -> Any:
+        key = _freeze(key)
+        tags = tuple(tags)
+        with self._lock:
+            try:
+                value = self._cache[key]
+                self.hits += 1
+                return value
+            except KeyError:
+                self.misses += 1
+            versions = [self._versions.get(tag, 0) for tag in tags]
+
+        # load outside the lock, concurrent misses on the same key just both read
+        value = load()
+        with self._lock:
+            if versions != [self._versions.get(tag, 0) for tag in tags]:
+                return value  # written while we were reading, don't keep it
+            self._cache[key] = value
+            for tag in tags:
+                keys = self._tags.setdefault(tag, set())
+                keys.add(key)
+                if len(keys) > 2 * self._cache.maxsize:
+                    self._prune(tag)
+        return value
+
+    def _prune(self, tag: str) -> None:
+        # tag sets also hold keys that have since expired or been evicted
+        self._tags[tag] = {key for key in self._tags[tag] if key in self._cache}
+        if not self._tags[tag]:
+            del self._tags[tag]
+
+    def cached(self, *tags: str):
+        """Decorator caching a read function by its arguments under the given tags"""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                return self.get_or_load((func.__qualname__, args, kwargs), lambda: func(*args, **kwargs), tags)
+            return wrapper
+        return decorator
+
+    def invalidate(self, *tags: str) -> None:
+        """Drop every entry carrying any of the tags"""
+        with self._lock:
+            for tag in tags:
+                self._versions[tag] = self._versions.get(tag, 0) + 1
+                for key in self._tags.pop(tag, ()):
+                    if self._cache.pop(key, None) is not None:
+                        self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+            self._tags.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            for tag in list(self._tags):
+                self._prune(tag)
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'invalidations': self.invalidations,
+                'size': len(self._cache),
+                'maxsize': self._cache.maxsize,
+                'ttl': self._cache.ttl,
+            }
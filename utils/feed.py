@@ -0,0 +1,122 @@
+import itertools
+import logging
+import queue
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from db.backends import Change, get_backend
+
+logger = logging.getLogger(__name__)
+
+# what a dashboard needs to show a request without fetching it
+EVENT_FIELDS = ['status', 'query', 'customer_phone', 'call_id', 'category', 'created_at', 'answer']
+
+
+def request_event(change: str, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Turn a change to a request document into a dashboard event (None if nothing to tell)"""
+    status = data.get('status')
+    if change == 'removed':
+        kind = 'request.removed'
+    elif status == 'pending':
+        if change != 'added':
+            return None
+        kind = 'request.new'
+    elif status in ('resolved', 'unresolved'):
+        kind = f'request.{status}'
+    else:
+        return None
+    return {'type': kind, 'id': data['id'], **{field: data.get(field) for field in EVENT_FIELDS}}
+
+
+class Subscriber:
+    """One connected client: a bounded queue of events waiting to be sent"""
+
+    def __init__(self, maxsize: int):
+        self._queue: queue.Queue = queue.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def put(self, event: Dict[str, Any]) -> None:
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            # a slow client never holds up the feed: throw away its backlog and
+            # tell it to reload instead of blocking or growing without bound
+            while True:
+                try:
+                    self._queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    break
+            self.dropped += 1
+            self._queue.put_nowait({'type': 'resync', 'seq': event['seq']})
+
+    def get(self, timeout: float) -> Optional[Dict[str, Any]]:
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class RequestFeed:
+    """Fans changes to the requests collection out to every connected dashboard.
+
+    There is one backend watch per process (a Firestore snapshot listener, or polling
+    on SQLite), started with the first subscriber and stopped after the last one leaves.
+    """
+
+    def __init__(self, queue_size: int = 100, collection: str = 'requests'):
+        self.queue_size = queue_size
+        self.collection = collection
+        self._subscribers: List[Subscriber] = []
+        self._listeners: List[Callable[[Dict[str, Any]], None]] = []
+        self._lock = threading.Lock()
+        self._unwatch: Optional[Callable[[], None]] = None
+        self._seq = itertools.count(1)
+        self.events = 0
+
+    def add_listener(self, listener: Callable[[Dict[str, Any]], None]) -> None:
+        """Also call listener (on the watch thread) for every event, e.g. to invalidate caches"""
+        self._listeners.append(listener)
+
+    def subscribe(self) -> Subscriber:
+        subscriber = Subscriber(self.queue_size)
+        with self._lock:
+            self._subscribers.append(subscriber)
+            if self._unwatch is None:
+                self._unwatch = get_backend().watch(self.collection, self._on_changes, since=datetime.now())
+                logger.info(f"Watching {self.collection} for dashboard events")
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        with self._lock:
+            if subscriber in self._subscribers:
+                self._subscribers.remove(subscriber)
+            if not self._subscribers and self._unwatch is not None:
+                self._unwatch()
+                self._unwatch = None
+
+    def _on_changes(self, changes: List[Change]) -> None:
+        for change, data in changes:
+            event = request_event(change, data)
+            if event is None:
+                continue
+            event['seq'] = next(self._seq)
+            self.events += 1
+            for listener in self._listeners:
+                try:
+                    listener(event)
+                except Exception as e:
+                    logger.error(f"Feed listener failed: {e}")
+            with self._lock:
+                subscribers = list(self._subscribers)
+            for subscriber in subscribers:
+                subscriber.put(event)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'subscribers': len(self._subscribers),
+                'events': self.events,
+                'dropped': sum(s.dropped for s in self._subscribers),
+            }
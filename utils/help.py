@@ -1,52 +1,160 @@
+import asyncio
 import csv
-import re
-from typing import Tuple
+import hashlib
+import logging
+import multiprocessing
+import os
+import threading
+from dataclasses import dataclass, replace
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
-import os.path
+from utils.matcher import PhraseMatcher
 
-# Global variables to store patterns (initialized once)
-_direct_request_pattern = None
-_frustration_pattern = None
-_complexity_pattern = None
-_urgency_pattern = None
+logger = logging.getLogger("salon-agent")
+
+DEFAULT_CSV_PATH = os.getenv("ESCALATION_CSV_PATH", "/home/oladev/ai-agent/db/engine/help.csv")
+
+# Escalation categories in priority order (frustration is handled on its own)
+CATEGORIES = ("direct_request", "urgency", "complexity", "frustration")
+
+
+@dataclass(frozen=True)
+class PhraseIndex:
+    """An immutable, fully built matcher plus where and when it came from"""
+    matcher: PhraseMatcher
+    path: str
+    version: str  # content hash of the CSV, identical across workers for the same file
+    generation: int  # how many times this process has built the index
+    built_at: datetime
+    mtime_ns: int
+
+
+# Global index (swapped as a whole, never mutated in place)
+_index: Optional[PhraseIndex] = None
 _patterns_initialized = False
+_reload_lock = threading.Lock()
+_watch_task: Optional[asyncio.Task] = None
 
-def initialize_patterns(csv_path="/home/oladev/ai-agent/db/engine/help.csv"):
-    """Initialize regex patterns from CSV file (called once)"""
-    global _direct_request_pattern, _frustration_pattern, _complexity_pattern, _urgency_pattern, _patterns_initialized
-    
+# Index used inside batch worker processes
+_worker_index: Optional[PhraseIndex] = None
+
+def load_phrases(csv_path: str) -> List[Tuple[str, str]]:
+    """Read (phrase, category) pairs from the escalation CSV in file order"""
+    phrases = []
+    with open(csv_path, 'r', encoding='utf-8') as file:
+        reader = csv.DictReader(file)
+        for row in reader:
+            phrase = row['phrase'].lower().strip('"')
+            category = row['category']
+            if category in CATEGORIES:
+                phrases.append((phrase, category))
+    return phrases
+
+def build_index(csv_path: str = DEFAULT_CSV_PATH, generation: int = 1) -> PhraseIndex:
+    """Build a new PhraseIndex from the CSV without touching the active one"""
+    mtime_ns = os.stat(csv_path).st_mtime_ns
+    with open(csv_path, 'rb') as file:
+        version = hashlib.sha1(file.read()).hexdigest()[:12]
+
+    # One automaton for all categories so a transcript is scanned only once
+    matcher = PhraseMatcher(load_phrases(csv_path))
+    return PhraseIndex(matcher=matcher, path=csv_path, version=version, generation=generation,
+                       built_at=datetime.now(), mtime_ns=mtime_ns)
+
+def _swap(index: PhraseIndex) -> None:
+    global _index, _patterns_initialized
+    # a single reference assignment, so readers see either the old or the new index
+    _index = index
+    _patterns_initialized = True
+    logger.info(f"Escalation phrases loaded: {get_index_info()}")
+
+def initialize_patterns(csv_path=DEFAULT_CSV_PATH):
+    """Build the escalation phrase index from CSV file (called once)"""
     # Skip if already initialized
     if _patterns_initialized:
         return
     
-    # Collect phrases by category
-    phrases = {
-        "direct_request": [],
-        "frustration": [],
-        "complexity": [],
-        "urgency": []
+    with _reload_lock:
+        if _patterns_initialized:
+            return
+        try:
+            index = build_index(csv_path)
+        except FileNotFoundError:
+            print(f"Warning: Escalation phrases CSV not found at {csv_path}")
+            return
+        _swap(index)
+
+def reload_patterns(csv_path: Optional[str] = None, force: bool = False) -> bool:
+    """Rebuild the index if the CSV changed since the last build. Returns True if swapped."""
+    global _index
+
+    with _reload_lock:
+        current = _index
+        csv_path = csv_path or (current.path if current else DEFAULT_CSV_PATH)
+        try:
+            mtime_ns = os.stat(csv_path).st_mtime_ns
+        except FileNotFoundError:
+            print(f"Warning: Escalation phrases CSV not found at {csv_path}")
+            return False
+        if not force and current and current.path == csv_path and current.mtime_ns == mtime_ns:
+            return False
+
+        index = build_index(csv_path, generation=current.generation + 1 if current else 1)
+        if not force and current and current.path == csv_path and index.version == current.version:
+            # file was touched but the phrases are the same, only remember the new mtime
+            _index = replace(current, mtime_ns=index.mtime_ns)
+            return False
+
+        _swap(index)
+        return True
+
+def get_index_info() -> Dict[str, Any]:
+    """Describe the active phrase index (for checking a rollout reached a worker)"""
+    index = _index
+    if index is None:
+        return {"version": None, "generation": 0, "built_at": None, "path": None, "phrases": 0}
+    return {
+        "version": index.version,
+        "generation": index.generation,
+        "built_at": index.built_at.isoformat(),
+        "path": index.path,
+        "phrases": len(index.matcher),
     }
+
+async def watch_patterns(interval: float = 5.0, csv_path: Optional[str] = None) -> None:
+    """Poll the CSV mtime and rebuild the index in a worker thread when it changes"""
+    while True:
+        try:
+            # building can take a while for big CSVs, keep it off the event loop
+            await asyncio.to_thread(reload_patterns, csv_path)
+        except Exception as e:
+            logger.error(f"Failed to reload escalation phrases, keeping version "
+                         f"{get_index_info()['version']}: {e}")
+        await asyncio.sleep(interval)
+
+def start_pattern_watcher(interval: float = 5.0) -> asyncio.Task:
+    """Start the phrase watcher on the running loop (once per process)"""
+    global _watch_task
+    loop = asyncio.get_running_loop()
+    if _watch_task is None or _watch_task.done() or _watch_task.get_loop() is not loop:
+        _watch_task = loop.create_task(watch_patterns(interval))
+    return _watch_task
+
+def classify(matcher: PhraseMatcher, text: str) -> Tuple[bool, str]:
+    """Run a single scan of text and apply the escalation priority rules"""
+    hits = matcher.match(text)
+
+    # Check for direct requests first (highest priority), then urgency and complexity
+    for category in ("direct_request", "urgency", "complexity"):
+        if hits.get(category):
+            return True, category
     
-    # Read CSV file
-    try:
-        with open(csv_path, 'r', encoding='utf-8') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                phrase = row['phrase'].lower().strip('"')
-                category = row['category']
-                if category in phrases:
-                    phrases[category].append(phrase)
-    except FileNotFoundError:
-        print(f"Warning: Escalation phrases CSV not found at {csv_path}")
-        return
-    
-    # Compile regex for each category
-    _direct_request_pattern = re.compile(r'\b(' + '|'.join(re.escape(p) for p in phrases["direct_request"]) + r')\b', re.IGNORECASE)
-    _frustration_pattern = re.compile(r'\b(' + '|'.join(re.escape(p) for p in phrases["frustration"]) + r')\b', re.IGNORECASE)
-    _complexity_pattern = re.compile(r'\b(' + '|'.join(re.escape(p) for p in phrases["complexity"]) + r')\b', re.IGNORECASE)
-    _urgency_pattern = re.compile(r'\b(' + '|'.join(re.escape(p) for p in phrases["urgency"]) + r')\b', re.IGNORECASE)
+    # Check for frustration (need at least 2 indicators). I could increase to 3 but who needs angry customer lol?
+    if hits.get("frustration", 0) >= 2:
+        return True, "multiple_frustration_indicators"
     
-    _patterns_initialized = True
+    return False, ""
 
 def needs_human_intervention(text: str) -> Tuple[bool, str]:
     """
@@ -63,24 +171,57 @@ def needs_human_intervention(text: str) -> Tuple[bool, str]:
         initialize_patterns()
         
     # Return false if patterns couldn't be initialized (possible error)
-    if not _patterns_initialized:
+    index = _index
+    if index is None:
         return False, ""
     
-    # Check for direct requests first (highest priority)
-    if _direct_request_pattern.search(text):
-        return True, "direct_request"
-    
-    # Check for urgency
-    if _urgency_pattern.search(text):
-        return True, "urgency"
-    
-    # Check for complexity
-    if _complexity_pattern.search(text):
-        return True, "complexity"
-    
-    # Check for frustration (need at least 2 indicators). I could increase to 3 but who needs angry customer lol?
-    frustration_matches = _frustration_pattern.findall(text)
-    if len(frustration_matches) >= 2:
-        return True, "multiple_frustration_indicators"
-    
-    return False, ""
+    return classify(index.matcher, text)
+
+
+def _init_batch_worker(index: PhraseIndex) -> None:
+    # with fork the index arrives through memory, nothing is pickled or rebuilt
+    global _worker_index
+    _worker_index = index
+
+def _classify_reason(text: str) -> str:
+    return classify(_worker_index.matcher, text or "")[1]
+
+
+class BatchClassifier:
+    """Classify many texts against one index, optionally over a process pool"""
+
+    def __init__(self, index: Optional[PhraseIndex] = None, processes: int = 0, chunksize: int = 2000):
+        if index is None:
+            initialize_patterns()
+            index = _index
+        if index is None:
+            raise FileNotFoundError("Escalation phrases CSV could not be loaded")
+        self.index = index
+        self.chunksize = chunksize
+        self._pool = None
+        if processes and processes > 1:
+            self._pool = multiprocessing.Pool(processes, initializer=_init_batch_worker, initargs=(index,))
+
+    def classify(self, texts: Iterable[str]) -> List[str]:
+        """Return the escalation reason for every text, in order ("" when none)"""
+        if self._pool is None:
+            matcher = self.index.matcher
+            return [classify(matcher, text or "")[1] for text in texts]
+        return self._pool.map(_classify_reason, list(texts), self.chunksize)
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self) -> 'BatchClassifier':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+def classify_batch(texts: Iterable[str], index: Optional[PhraseIndex] = None, processes: int = 0) -> List[str]:
+    """Classify an iterable of texts in one call. See BatchClassifier for large jobs."""
+    with BatchClassifier(index, processes=processes) as classifier:
+        return classifier.classify(texts)
@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from db.models import KnowledgeBase
+from db.search import BM25Index
+from utils.help import needs_human_intervention
+from utils import knowledge
+from utils.knowledge import KB_MIN_CONFIDENCE
+
+logger = logging.getLogger("salon-agent")
+
+# answer FAQ turns locally, skipping both LLM hops, when the match is at least this confident (0-1)
+FAST_PATH_ENABLED = os.getenv("FAST_PATH_ENABLED", "1") not in ("0", "false", "no")
+FAST_PATH_MIN_CONFIDENCE = float(os.getenv("FAST_PATH_MIN_CONFIDENCE", "0.8"))
+
+
+@dataclass
+class Intent:
+    name: str
+    examples: List[str]
+    answer: str
+
+
+def salon_intents(info: dict) -> List[Intent]:
+    """FAQ intents answerable straight from the salon info, same answers process_query gives"""
+    services = ", ".join(info["services"])
+    intents = [
+        Intent("hours", ["what are your hours", "when are you open", "opening hours", "what time do you close",
+                         "what time do you open"],
+               f"Our hours are {info['hours']}."),
+        Intent("address", ["where are you located", "what is your address", "where is the salon",
+                           "location of the salon"],
+               f"We are located at {info['address']}."),
+        Intent("phone", ["what is your phone number", "how can i contact you", "contact number"],
+               f"You can reach us at {info['phone']}."),
+        Intent("services", ["what services do you offer", "what do you offer", "list your services"],
+               f"At {info['name']}, we offer {services}."),
+    ]
+    for service in info["services"]:
+        intents.append(Intent(f"service:{service}", [f"do you offer {service}", f"do you do {service}"],
+                              f"Yes, we offer {service} at {info['name']}."))
+    return intents
+
+
+class IntentClassifier:
+    """Matches a transcript to the closest intent example with BM25, confidence is query coverage"""
+
+    def __init__(self, intents: List[Intent]):
+        self._index = BM25Index()
+        self._intents: Dict[str, Intent] = {}
+        for intent in intents:
+            for i, example in enumerate(intent.examples):
+                doc_id = f"{intent.name}#{i}"
+                self._index.add(doc_id, example)
+                self._intents[doc_id] = intent
+
+    def classify(self, text: str) -> Optional[Tuple[Intent, float]]:
+        hits = self._index.search(text, limit=1)
+        if not hits:
+            return None
+        doc_id = hits[0][0]
+        return self._intents[doc_id], self._index.coverage(text, doc_id)
+
+
+@dataclass
+class PathStats:
+    turns: int = 0
+    total_ms: float = 0.0
+
+
+@dataclass
+class FastPathStats:
+    """Fast path hits, and turn-end to first-audio latency per path"""
+    turns: int = 0
+    intent_hits: int = 0
+    knowledge_hits: int = 0
+    escalations: int = 0
+    knowledge_timeouts: int = 0
+    paths: Dict[str, PathStats] = field(default_factory=dict)
+
+    def summary(self) -> dict:
+        hits = self.intent_hits + self.knowledge_hits
+        return {
+            "turns": self.turns,
+            "intent_hits": self.intent_hits,
+            "knowledge_hits": self.knowledge_hits,
+            "escalations": self.escalations,
+            "knowledge_timeouts": self.knowledge_timeouts,
+            "hit_rate": round(hits / self.turns, 3) if self.turns else 0.0,
+            "avg_ms": {name: round(p.total_ms / p.turns, 1) for name, p in self.paths.items() if p.turns},
+        }
+
+
+class FastPath:
+    """Answers FAQ turns from the final transcript without the LLM.
+
+    Await handle_turn() from Agent.on_user_turn_completed; when it returns an answer the
+    agent says it and raises StopResponse. Anything that looks like an escalation or
+    isn't a confident match goes to the LLM as before.
+    """
+
+    def __init__(self, info: dict, min_confidence: float = FAST_PATH_MIN_CONFIDENCE):
+        self.classifier = IntentClassifier(salon_intents(info))
+        self.min_confidence = min_confidence
+        self.stats = FastPathStats()
+        self._turn: Optional[Tuple[str, float]] = None
+
+    async def match(self, text: str) -> Optional[Tuple[str, str, float]]:
+        """(answer, source, confidence) for a transcript, or None to let the LLM handle it"""
+        needs, _ = needs_human_intervention(text)
+        if needs:
+            self.stats.escalations += 1
+            return None
+
+        found = self.classifier.classify(text)
+        if found and found[1] >= self.min_confidence:
+            return found[0].answer, f"intent:{found[0].name}", found[1]
+
+        # learned answers, only if the index is already in memory (never a database read here),
+        # ranked off the loop and within the same budget as process_query's lookup
+        if not KnowledgeBase.index_ready():
+            return None
+        try:
+            learned = await knowledge.match_learned(text)
+        except asyncio.TimeoutError:
+            self.stats.knowledge_timeouts += 1
+            return None
+        if learned and learned[1] >= max(self.min_confidence, KB_MIN_CONFIDENCE):
+            return learned[0].answer, f"knowledge:{learned[0].key_phrase}", learned[1]
+        return None
+
+    async def handle_turn(self, text: str) -> Optional[str]:
+        """Answer for the turn if it can take the fast path, else None"""
+        self.stats.turns += 1
+        started = time.perf_counter()
+        matched = await self.match(text) if FAST_PATH_ENABLED and text else None
+        self._turn = ("fast" if matched else "llm", started)
+        if matched is None:
+            return None
+
+        answer, source, confidence = matched
+        if source.startswith("intent"):
+            self.stats.intent_hits += 1
+        else:
+            self.stats.knowledge_hits += 1
+        logger.info(f"Fast path answered from {source} ({confidence:.2f}) in "
+                    f"{(time.perf_counter() - started) * 1000:.1f}ms")
+        return answer
+
+    def attach(self, session) -> None:
+        """Measure turn end to first audio on the session, per path"""
+        def on_state_changed(ev):
+            if ev.new_state != "speaking" or self._turn is None:
+                return
+            path, started = self._turn
+            self._turn = None
+            stats = self.stats.paths.setdefault(path, PathStats())
+            stats.turns += 1
+            stats.total_ms += (time.perf_counter() - started) * 1000
+
+        session.on("agent_state_changed", on_state_changed)
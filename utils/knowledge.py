@@ -0,0 +1,100 @@
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, asdict
+from typing import Optional, Tuple
+
+from db.models import KnowledgeBase
+
+logger = logging.getLogger("salon-agent")
+
+# learned answers are only used above this confidence (0-1) and within this time budget
+KB_MIN_CONFIDENCE = float(os.getenv("KB_MIN_CONFIDENCE", "0.75"))
+KB_LOOKUP_BUDGET_MS = float(os.getenv("KB_LOOKUP_BUDGET_MS", "50"))
+
+
+@dataclass
+class LookupStats:
+    """Counters for answering from the knowledge base instead of escalating"""
+    lookups: int = 0
+    hits: int = 0
+    low_confidence: int = 0
+    not_ready: int = 0
+    timeouts: int = 0
+    errors: int = 0
+    total_ms: float = 0.0
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.lookups if self.lookups else 0.0
+
+    def summary(self) -> dict:
+        data = asdict(self)
+        data["hit_rate"] = round(self.hit_rate, 3)
+        # every hit is a question that would otherwise have become a general escalation
+        data["escalations_avoided"] = self.hits
+        data["avg_ms"] = round(self.total_ms / self.lookups, 3) if self.lookups else 0.0
+        del data["total_ms"]
+        return data
+
+
+stats = LookupStats()
+_refresh_task: Optional[asyncio.Task] = None
+
+
+def refresh_index_if_stale() -> None:
+    """Rebuild the knowledge index in a thread if it is missing or too old"""
+    global _refresh_task
+    if _refresh_task is not None and not _refresh_task.done():
+        return
+    if KnowledgeBase.index_stale():
+        _refresh_task = asyncio.get_running_loop().create_task(asyncio.to_thread(KnowledgeBase.build_index))
+
+
+async def match_learned(query: str) -> Optional[Tuple[KnowledgeBase, float]]:
+    """Best learned entry and its confidence, ranked in a thread within KB_LOOKUP_BUDGET_MS.
+
+    Raises asyncio.TimeoutError when over budget; the event loop never waits on the ranking.
+    """
+    match = await asyncio.wait_for(asyncio.to_thread(KnowledgeBase.best_match, query),
+                                   timeout=KB_LOOKUP_BUDGET_MS / 1000)
+    refresh_index_if_stale()
+    return match
+
+
+async def lookup_learned_answer(query: str) -> Optional[str]:
+    """Answer from the knowledge base if confident and fast enough, else None"""
+    stats.lookups += 1
+    start = time.perf_counter()
+    try:
+        if not KnowledgeBase.index_ready():
+            # never wait for a full load mid-conversation, just get it going
+            stats.not_ready += 1
+            refresh_index_if_stale()
+            return None
+
+        match = await match_learned(query)
+        if match is None:
+            stats.low_confidence += 1
+            return None
+
+        entry, confidence = match
+        if confidence < KB_MIN_CONFIDENCE:
+            stats.low_confidence += 1
+            logger.info(f"Knowledge match '{entry.key_phrase}' below threshold ({confidence:.2f})")
+            return None
+
+        stats.hits += 1
+        logger.info(f"Answered from knowledge base '{entry.key_phrase}' ({confidence:.2f})")
+        return entry.answer
+    except asyncio.TimeoutError:
+        stats.timeouts += 1
+        logger.warning(f"Knowledge lookup exceeded {KB_LOOKUP_BUDGET_MS}ms budget")
+        return None
+    except Exception as e:
+        stats.errors += 1
+        logger.error(f"Knowledge lookup failed: {e}")
+        return None
+    finally:
+        stats.total_ms += (time.perf_counter() - start) * 1000
@@ -0,0 +1,186 @@
+import bisect
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("salon-agent")
+
+# each worker process serves its histograms on the first free port from METRICS_PORT up
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") not in ("0", "false", "no")
+# upper bounds in milliseconds, the last bucket is +Inf
+BUCKETS_MS = (5, 10, 25, 50, 100, 150, 250, 400, 600, 800, 1000, 1500, 2500, 5000, 10000)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram.
+
+    Every thread writes to its own shard (counts per bucket, then sum and count), so
+    observe() never takes a lock; snapshot() adds the shards up when someone reads.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS_MS):
+        self.buckets = buckets
+        self._shards: Dict[int, List[float]] = {}
+
+    def observe(self, ms: float) -> None:
+        shard = self._shards.get(threading.get_ident())
+        if shard is None:
+            # setdefault is atomic, a thread only ever touches its own list
+            shard = self._shards.setdefault(threading.get_ident(), [0] * (len(self.buckets) + 3))
+        shard[bisect.bisect_left(self.buckets, ms)] += 1
+        shard[-2] += ms
+        shard[-1] += 1
+
+    def snapshot(self) -> Tuple[List[int], float, int]:
+        """(count per bucket including +Inf, sum, count)"""
+        counts = [0] * (len(self.buckets) + 1)
+        total, count = 0.0, 0
+        for shard in list(self._shards.values()):
+            for i in range(len(counts)):
+                counts[i] += shard[i]
+            total += shard[-2]
+            count += shard[-1]
+        return counts, total, count
+
+    def quantile(self, q: float, snapshot: Optional[Tuple[List[int], float, int]] = None) -> float:
+        """Estimate from the buckets, linear within the bucket the quantile falls in"""
+        counts, _, count = snapshot or self.snapshot()
+        if not count:
+            return 0.0
+        rank = q * count
+        seen = 0
+        for i, n in enumerate(counts):
+            if n and seen + n >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                if i == len(self.buckets):
+                    return float(lower)  # +Inf bucket, the best we can say is "over the last bound"
+                return lower + (self.buckets[i] - lower) * (rank - seen) / n
+            seen += n
+        return float(self.buckets[-1])
+
+
+class LatencyRecorder:
+    """Latency histograms per pipeline stage for this worker process"""
+
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS_MS):
+        self.buckets = buckets
+        self._histograms: Dict[str, Histogram] = {}
+
+    def observe(self, stage: str, ms: float) -> None:
+        histogram = self._histograms.get(stage)
+        if histogram is None:
+            histogram = self._histograms.setdefault(stage, Histogram(self.buckets))
+        histogram.observe(ms)
+
+    @contextmanager
+    def timed(self, stage: str):
+        """Time a block, works around awaits too"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, (time.perf_counter() - start) * 1000)
+
+    def timed_call(self, stage: str, func: Callable) -> Callable:
+        """Wrap a plain function so every call is timed"""
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.timed(stage):
+                return func(*args, **kwargs)
+        return wrapper
+
+    def record_metrics(self, metrics) -> None:
+        """Feed a LiveKit metrics_collected event's metrics into the stage histograms"""
+        kind = type(metrics).__name__
+        if kind == "EOUMetrics":
+            # end of speech (VAD) to the end of the user's turn, and to the final transcript
+            self.observe("vad_end_of_speech", metrics.end_of_utterance_delay * 1000)
+            self.observe("stt_final", metrics.transcription_delay * 1000)
+            self.observe("on_user_turn_completed", metrics.on_user_turn_completed_delay * 1000)
+        elif kind == "LLMMetrics" and not metrics.cancelled:
+            self.observe("llm_ttft", metrics.ttft * 1000)
+        elif kind == "TTSMetrics" and not metrics.cancelled:
+            self.observe("tts_ttfb", metrics.ttfb * 1000)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        data = {}
+        for stage, histogram in sorted(self._histograms.items()):
+            snapshot = histogram.snapshot()
+            data[stage] = {"count": snapshot[2],
+                           **{f"p{int(q * 100)}": round(histogram.quantile(q, snapshot), 1) for q in QUANTILES}}
+        return data
+
+    def render(self) -> str:
+        """Prometheus text exposition format"""
+        lines = [
+            "# HELP salon_stage_latency_ms Latency of a voice pipeline stage in milliseconds.",
+            "# TYPE salon_stage_latency_ms histogram",
+        ]
+        quantiles = [
+            "# HELP salon_stage_latency_quantile_ms Latency quantiles estimated from the histogram buckets.",
+            "# TYPE salon_stage_latency_quantile_ms gauge",
+        ]
+        for stage, histogram in sorted(self._histograms.items()):
+            counts, total, count = snapshot = histogram.snapshot()
+            cumulative = 0
+            for bound, n in zip(list(self.buckets) + ["+Inf"], counts):
+                cumulative += n
+                lines.append(f'salon_stage_latency_ms_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'salon_stage_latency_ms_sum{{stage="{stage}"}} {total:.3f}')
+            lines.append(f'salon_stage_latency_ms_count{{stage="{stage}"}} {count}')
+            for q in QUANTILES:
+                quantiles.append(f'salon_stage_latency_quantile_ms{{stage="{stage}",quantile="{q}"}} '
+                                 f'{histogram.quantile(q, snapshot):.3f}')
+        return "\n".join(lines + quantiles) + "\n"
+
+
+recorder = LatencyRecorder()
+
+_server: Optional[ThreadingHTTPServer] = None
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = recorder.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # scraped every few seconds, keep it out of the agent logs
+
+
+def start_server(host: str = METRICS_HOST, port: int = METRICS_PORT, attempts: int = 32) -> Optional[int]:
+    """Serve /metrics in a daemon thread (once per process); returns the port"""
+    global _server
+    if not METRICS_ENABLED:
+        return None
+    if _server is not None:
+        return _server.server_address[1]
+    # several worker processes on one host each take the next free port
+    for candidate in range(port, port + attempts):
+        try:
+            _server = ThreadingHTTPServer((host, candidate), _MetricsHandler)
+            break
+        except OSError:
+            continue
+    else:
+        logger.warning(f"No free port for latency metrics in {port}-{port + attempts - 1}")
+        return None
+    _server.daemon_threads = True
+    threading.Thread(target=_server.serve_forever, name="latency-metrics", daemon=True).start()
+    logger.info(f"Latency metrics at http://{host}:{candidate}/metrics")
+    return candidate
@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Tuple
+
+import aiohttp
+from livekit import api
+
+logger = logging.getLogger("salon-agent")
+
+# every request (list_participants, delete_room, ...) gives up after this many seconds
+LIVEKIT_API_TIMEOUT = float(os.getenv("LIVEKIT_API_TIMEOUT", "10"))
+# open connections kept per process, idle ones are kept alive for reuse
+LIVEKIT_API_POOL_SIZE = int(os.getenv("LIVEKIT_API_POOL_SIZE", "20"))
+LIVEKIT_API_KEEPALIVE = float(os.getenv("LIVEKIT_API_KEEPALIVE", "60"))
+
+
+@dataclass
+class MethodStats:
+    calls: int = 0
+    errors: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+
+
+@dataclass
+class ApiStats:
+    """Latency per LiveKit API method, plus how often a pooled connection was reused"""
+    methods: Dict[str, MethodStats] = field(default_factory=dict)
+    connections_opened: int = 0
+    connections_reused: int = 0
+
+    def record(self, method: str, ms: float, error: bool = False) -> None:
+        stats = self.methods.setdefault(method, MethodStats())
+        stats.calls += 1
+        stats.errors += int(error)
+        stats.total_ms += ms
+        stats.max_ms = max(stats.max_ms, ms)
+
+    def summary(self) -> dict:
+        return {
+            "methods": {
+                name: {"calls": s.calls, "errors": s.errors, "max_ms": round(s.max_ms, 1),
+                       "avg_ms": round(s.total_ms / s.calls, 1) if s.calls else 0.0}
+                for name, s in self.methods.items()
+            },
+            "connections_opened": self.connections_opened,
+            "connections_reused": self.connections_reused,
+        }
+
+
+stats = ApiStats()
+
+# one client per event loop: a process-executor worker has one loop, the thread
+# executor runs each job on its own loop and aiohttp sessions can't cross loops
+_clients: Dict[asyncio.AbstractEventLoop, Tuple[api.LiveKitAPI, aiohttp.ClientSession]] = {}
+
+
+def _method(url) -> str:
+    # twirp paths look like /twirp/livekit.RoomService/ListParticipants
+    return url.path.rsplit("/", 1)[-1] or url.path
+
+
+def _trace_config() -> aiohttp.TraceConfig:
+    trace = aiohttp.TraceConfig()
+
+    async def on_request_start(session, context, params):
+        context.start = time.perf_counter()
+
+    async def on_request_end(session, context, params):
+        stats.record(_method(params.url), (time.perf_counter() - context.start) * 1000,
+                     error=params.response.status >= 400)
+
+    async def on_request_exception(session, context, params):
+        stats.record(_method(params.url), (time.perf_counter() - context.start) * 1000, error=True)
+
+    async def on_connection_create_end(session, context, params):
+        stats.connections_opened += 1
+
+    async def on_connection_reuseconn(session, context, params):
+        stats.connections_reused += 1
+
+    trace.on_request_start.append(on_request_start)
+    trace.on_request_end.append(on_request_end)
+    trace.on_request_exception.append(on_request_exception)
+    trace.on_connection_create_end.append(on_connection_create_end)
+    trace.on_connection_reuseconn.append(on_connection_reuseconn)
+    return trace
+
+
+def get_livekit_api() -> api.LiveKitAPI:
+    """The shared LiveKit API client for the running loop, created on first use. Don't close it."""
+    loop = asyncio.get_running_loop()
+    if loop in _clients and not _clients[loop][1].closed:
+        return _clients[loop][0]
+    # forget clients of loops that have finished (earlier jobs on the thread executor)
+    for old in [old for old in _clients if old.is_closed()]:
+        del _clients[old]
+    session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=LIVEKIT_API_POOL_SIZE, keepalive_timeout=LIVEKIT_API_KEEPALIVE),
+        timeout=aiohttp.ClientTimeout(total=LIVEKIT_API_TIMEOUT),
+        trace_configs=[_trace_config()],
+    )
+    client = api.LiveKitAPI(session=session)
+    _clients[loop] = (client, session)
+    return client
+
+
+async def warm(room_name: str) -> None:
+    """Open the pooled connection (DNS + TLS) early, e.g. while the room connects"""
+    try:
+        await get_livekit_api().room.list_rooms(api.ListRoomsRequest(names=[room_name]))
+    except Exception as e:
+        logger.warning(f"Warming the LiveKit API connection failed: {e}")
+
+
+async def close_livekit_api() -> None:
+    """Close the client of the running loop (at process or job shutdown)"""
+    entry = _clients.pop(asyncio.get_running_loop(), None)
+    if entry is not None:
+        # the session was passed in, so LiveKitAPI.aclose() would leave it open
+        await entry[1].close()
+
+
+def prewarm() -> None:
+    """Check the credentials at worker start instead of on the first call.
+
+    The client itself can't be created here: prewarm runs before the job's event loop
+    exists, so it is created on first use and warm() overlaps its handshake with connect.
+    """
+    missing = [name for name in ("LIVEKIT_URL", "LIVEKIT_API_KEY", "LIVEKIT_API_SECRET") if not os.getenv(name)]
+    if missing:
+        logger.error(f"LiveKit API is not configured, missing {', '.join(missing)}")
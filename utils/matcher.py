@@ -0,0 +1,118 @@
+from collections import defaultdict
+from typing import Dict, Iterable, List, Tuple
+
+
+def _is_word(ch: str) -> bool:
+    """Same idea of a word character as regex \\w"""
+    return ch.isalnum() or ch == '_'
+
+
+class PhraseMatcher:
+    """Aho-Corasick automaton over (phrase, category) pairs.
+
+    A single pass over the text finds every phrase occurrence. Occurrences only
+    count when both ends sit on a word boundary, which mirrors the old
+    ``\\b(p1|p2|...)\\b`` regexes, and per-category counts follow ``re.findall``
+    (leftmost match wins, ties go to the phrase listed first in the CSV).
+    """
+
+    def __init__(self, phrases: Iterable[Tuple[str, str]]):
+        # node 0 is the root; goto holds the trie edges for each node
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Tuple[int, ...]] = [()]
+        self._lengths: List[int] = []
+        self._categories: List[str] = []
+
+        seen = set()
+        for phrase, category in phrases:
+            phrase = phrase.lower()
+            if phrase and (phrase, category) not in seen:
+                seen.add((phrase, category))
+                self._add(phrase, category)
+        self._build_links()
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def _add(self, phrase: str, category: str) -> None:
+        node = 0
+        for ch in phrase:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            node = nxt
+
+        # pattern ids grow in CSV order, which is also the findall tie-break order
+        self._out[node] = self._out[node] + (len(self._lengths),)
+        self._lengths.append(len(phrase))
+        self._categories.append(category)
+
+    def _build_links(self) -> None:
+        """Breadth-first pass computing failure links and merged outputs"""
+        goto, fail, out = self._goto, self._fail, self._out
+        queue = list(goto[0].values())
+        head = 0
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+            for ch, child in goto[node].items():
+                queue.append(child)
+                state = fail[node]
+                while state and ch not in goto[state]:
+                    state = fail[state]
+                link = goto[state].get(ch, 0)
+                fail[child] = link if link != child else 0
+                if out[fail[child]]:
+                    out[child] = out[child] + out[fail[child]]
+
+    def find_all(self, text: str) -> List[Tuple[int, int, int]]:
+        """Return every (start, end, pattern_id) occurrence on word boundaries"""
+        text = text.lower()
+        size = len(text)
+        goto, fail, out, lengths = self._goto, self._fail, self._out, self._lengths
+        hits = []
+        node = 0
+
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if not out[node]:
+                continue
+
+            # every phrase ending here shares the same boundary check at its end
+            end = i + 1
+            if _is_word(ch) == (end < size and _is_word(text[end])):
+                continue
+            for pid in out[node]:
+                start = end - lengths[pid]
+                left_word = start > 0 and _is_word(text[start - 1])
+                if left_word != _is_word(text[start]):
+                    hits.append((start, end, pid))
+
+        return hits
+
+    def match(self, text: str) -> Dict[str, int]:
+        """Count non-overlapping phrase matches per category in a single scan"""
+        by_category = defaultdict(list)
+        for start, end, pid in self.find_all(text):
+            by_category[self._categories[pid]].append((start, pid, end))
+
+        counts = {}
+        for category, hits in by_category.items():
+            hits.sort()
+            count, pos = 0, 0
+            for start, pid, end in hits:
+                # sorted by (start, pid) so the first hit at a start is the one regex picks
+                if start < pos:
+                    continue
+                count += 1
+                pos = end
+            counts[category] = count
+
+        return counts
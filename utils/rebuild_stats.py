@@ -0,0 +1,31 @@
+"""
+Recompute the dashboard counters behind /stats from scratch.
+
+The counters are normally kept up to date by the model writes themselves. Run this
+once after deploying them (to count the existing data), or whenever they look off,
+e.g. after documents were edited by hand in the console. Run from the project root:
+
+    python -m utils.rebuild_stats
+"""
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from db.models import DashboardStats
+
+
+def main():
+    before = DashboardStats.get()
+    start = time.perf_counter()
+    after = DashboardStats.rebuild()
+    elapsed = time.perf_counter() - start
+
+    for field in DashboardStats.fields:
+        change = after[field] - before[field]
+        print(f"{field:<18} {after[field]:>8} ({change:+d})")
+    print(f"\nrebuilt in {elapsed:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Re-run the escalation classifier over stored requests and show how categories shift.
+
+Streams the `requests` collection (only the query and category fields), classifies
+every query with the new help.csv and prints a before/after confusion table.
+"before" is the category stored on each request, or the result of an older CSV
+when --before is given. Run from the project root:
+
+    python -m utils.reclassify --after db/engine/help.csv --processes 8
+    python -m utils.reclassify --before old_help.csv --after db/engine/help.csv --file queries.txt
+"""
+import argparse
+import os
+import sys
+import time
+from collections import Counter
+from itertools import islice
+from typing import Iterator, Tuple
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils.help import DEFAULT_CSV_PATH, BatchClassifier, build_index
+
+NONE_LABEL = "none"
+
+
+def stream_requests() -> Iterator[Tuple[str, str]]:
+    """(stored category, query) for every request in the database"""
+    from db.models import Request
+    for req in Request.iter_all(fields=['query', 'category']):
+        # "general" is what the agent stores when no escalation phrase matched
+        category = req.category if req.category and req.category != 'general' else NONE_LABEL
+        yield category, req.query or ""
+
+
+def stream_file(path: str) -> Iterator[Tuple[str, str]]:
+    """One query per line, no stored category"""
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            yield NONE_LABEL, line.rstrip('\n')
+
+
+def print_confusion(table: Counter) -> None:
+    if not table:
+        print("No requests to classify")
+        return
+    before_labels = sorted({b for b, _ in table})
+    after_labels = sorted({a for _, a in table})
+    corner = 'before \\ after'
+    first = max(len(label) for label in before_labels + [corner]) + 2
+    widths = [max(len(label), len(str(max(table.values())))) + 2 for label in after_labels]
+
+    print(corner.ljust(first) + ''.join(label.rjust(w) for label, w in zip(after_labels, widths)))
+    for before in before_labels:
+        row = ''.join(str(table.get((before, after), 0)).rjust(w) for after, w in zip(after_labels, widths))
+        print(before.ljust(first) + row)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--after', default=DEFAULT_CSV_PATH, help="the new escalation CSV")
+    parser.add_argument('--before', help="an older escalation CSV (default: the stored category)")
+    parser.add_argument('--file', help="read queries from a text file instead of the requests collection")
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--batch-size', type=int, default=50000)
+    args = parser.parse_args()
+
+    records = stream_file(args.file) if args.file else stream_requests()
+    after = BatchClassifier(build_index(args.after), processes=args.processes)
+    before = BatchClassifier(build_index(args.before), processes=args.processes) if args.before else None
+
+    table = Counter()
+    total = 0
+    start = time.perf_counter()
+    try:
+        while True:
+            batch = list(islice(records, args.batch_size))
+            if not batch:
+                break
+            texts = [text for _, text in batch]
+            stored = [label for label, _ in batch]
+            befores = before.classify(texts) if before else stored
+            for b, a in zip(befores, after.classify(texts)):
+                table[(b or NONE_LABEL, a or NONE_LABEL)] += 1
+            total += len(batch)
+            print(f"... {total} requests classified", file=sys.stderr)
+    finally:
+        after.close()
+        if before:
+            before.close()
+
+    elapsed = time.perf_counter() - start
+    changed = sum(count for (b, a), count in table.items() if b != a)
+    print_confusion(table)
+    print(f"\n{total} requests, {changed} changed category, {elapsed:.1f}s "
+          f"({total / elapsed if elapsed else 0:.0f} requests/s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+logger = logging.getLogger("salon-agent")
+
+# milliseconds per labelled startup step (import groups, client setup) in this process
+timings: Dict[str, float] = {}
+
+
+@contextmanager
+def timed(label: str):
+    """Time a block of startup work, e.g. a group of imports"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[label] = timings.get(label, 0.0) + (time.perf_counter() - start) * 1000
+
+
+def report() -> Dict[str, float]:
+    """Startup timings so far, including Firebase client setup once it has happened"""
+    data = {label: round(ms, 1) for label, ms in timings.items()}
+    from db import firebase
+    if firebase.init_seconds is not None:
+        data["firebase_init"] = round(firebase.init_seconds * 1000, 1)
+    return data
+
+
+def log_report(stage: str) -> None:
+    logger.info(f"Startup timings ({stage}, ms): {report()}")
+
+
+def log_first_audio(session, accepted: float, warm: bool) -> None:
+    """Log the time from job accept (perf_counter at entrypoint start) to the agent first speaking"""
+    def on_state_changed(ev):
+        if ev.new_state != "speaking":
+            return
+        session.off("agent_state_changed", on_state_changed)
+        ms = (time.perf_counter() - accepted) * 1000
+        logger.info(f"Job accept to first audio: {ms:.0f}ms ({'warm' if warm else 'cold'} plugins)")
+
+    session.on("agent_state_changed", on_state_changed)
@@ -0,0 +1,230 @@
+import asyncio
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Set
+
+from livekit import rtc
+
+logger = logging.getLogger("salon-agent")
+
+# synthesized phrases are kept here across calls and restarts, one file per phrase
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", os.path.join(os.path.dirname(__file__), "..", "db", "engine", "tts_cache"))
+TTS_CACHE_ENABLED = os.getenv("TTS_CACHE_ENABLED", "1") not in ("0", "false", "no")
+# cached audio is played back in frames of this length
+FRAME_MS = 20
+
+# file layout: magic, sample rate, channels, then raw 16-bit PCM
+_HEADER = struct.Struct("<4sII")
+_MAGIC = b"PCM1"
+
+
+def _options(tts) -> Dict[str, str]:
+    # the groq plugin keeps model and voice in _opts, other plugins may not have them
+    opts = getattr(tts, "_opts", None)
+    return {
+        "provider": type(tts).__module__,
+        "model": str(getattr(opts, "model", "")),
+        "voice": str(getattr(opts, "voice", "")),
+    }
+
+
+def cache_key(text: str, model: str, voice: str, sample_rate: int, provider: str = "") -> str:
+    """Content address of a phrase: the same words from the same voice always map to the same file"""
+    raw = json.dumps([provider, model, voice, sample_rate, text], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class TTSCacheStats:
+    hits: int = 0
+    misses: int = 0
+    stored: int = 0
+    hit_first_frame_ms: float = 0.0
+    miss_first_frame_ms: float = 0.0
+
+    def summary(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stored": self.stored,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            "avg_hit_first_frame_ms": round(self.hit_first_frame_ms / self.hits, 2) if self.hits else 0.0,
+            "avg_miss_first_frame_ms": round(self.miss_first_frame_ms / self.misses, 1) if self.misses else 0.0,
+        }
+
+
+class CachedAudio:
+    """One stored phrase, memory-mapped read-only so playback starts without reading the file"""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.sample_rate, self.num_channels = _HEADER.unpack_from(self._map, 0)
+        if magic != _MAGIC:
+            self._map.close()
+            raise ValueError(f"Not a cached TTS phrase: {path}")
+
+    def frames(self) -> Iterable[rtc.AudioFrame]:
+        samples = self.sample_rate * FRAME_MS // 1000
+        step = samples * self.num_channels * 2
+        data = memoryview(self._map)[_HEADER.size:]
+        for start in range(0, len(data), step):
+            chunk = data[start:start + step]
+            yield rtc.AudioFrame(chunk, self.sample_rate, self.num_channels, len(chunk) // (2 * self.num_channels))
+
+
+class TTSCache:
+    """Persistent cache of synthesized phrases keyed by (text, model, voice, sample rate).
+
+    Use say() in place of session.say() for fixed sentences: a hit plays the stored
+    frames straight from the memory map, a miss streams from the TTS as usual and
+    stores the audio once the phrase has played in full.
+    """
+
+    def __init__(self, directory: str = TTS_CACHE_DIR):
+        self.directory = directory
+        self.stats = TTSCacheStats()
+        self._entries: Dict[str, CachedAudio] = {}
+        # keys being synthesized right now, so warm() doesn't pay for them twice
+        self._pending: Set[str] = set()
+
+    def key_for(self, tts, text: str) -> str:
+        opts = _options(tts)
+        return cache_key(text, opts["model"], opts["voice"], tts.sample_rate, opts["provider"])
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.pcm")
+
+    def get(self, key: str) -> Optional[CachedAudio]:
+        entry = self._entries.get(key)
+        if entry is None and os.path.exists(self._path(key)):
+            # another worker process may have stored it since we loaded
+            try:
+                entry = self._entries[key] = CachedAudio(self._path(key))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping unreadable TTS cache file {key}: {e}")
+        return entry
+
+    async def aget(self, key: str) -> Optional[CachedAudio]:
+        """get() for the event loop: a key not mapped yet is looked up on disk in a thread"""
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = await asyncio.to_thread(self.get, key)
+        return entry
+
+    def load(self) -> int:
+        """Map every stored phrase, at worker start"""
+        if not os.path.isdir(self.directory):
+            return 0
+        for name in os.listdir(self.directory):
+            if name.endswith(".pcm"):
+                self.get(name[:-4])
+        return len(self._entries)
+
+    def prewarm(self) -> None:
+        """Map the stored phrases once per worker process"""
+        if TTS_CACHE_ENABLED:
+            logger.info(f"TTS cache: {self.load()} phrases mapped from {os.path.abspath(self.directory)}")
+
+    async def store(self, key: str, frames: List[rtc.AudioFrame]) -> None:
+        """Save a phrase's audio, the file is written in a thread so the turn isn't held up"""
+        entry = await asyncio.to_thread(self._write, key, frames)
+        if entry is not None:
+            self._entries[key] = entry
+            self.stats.stored += 1
+
+    def _write(self, key: str, frames: List[rtc.AudioFrame]) -> Optional[CachedAudio]:
+        if not frames:
+            return None
+        sample_rate, num_channels = frames[0].sample_rate, frames[0].num_channels
+        if any(f.sample_rate != sample_rate or f.num_channels != num_channels for f in frames):
+            logger.warning("Not caching TTS audio with mixed formats")
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        # write then rename, so other workers never map a half-written file
+        tmp = f"{self._path(key)}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as file:
+            file.write(_HEADER.pack(_MAGIC, sample_rate, num_channels))
+            for frame in frames:
+                file.write(frame.data.cast("B"))
+        os.replace(tmp, self._path(key))
+        return CachedAudio(self._path(key))
+
+    async def _replay(self, entry: CachedAudio, started: float) -> AsyncIterator[rtc.AudioFrame]:
+        first = True
+        for frame in entry.frames():
+            if first:
+                self.stats.hit_first_frame_ms += (time.perf_counter() - started) * 1000
+                first = False
+            yield frame
+
+    async def _synthesize(self, tts, text: str, key: str, started: Optional[float] = None) -> AsyncIterator[rtc.AudioFrame]:
+        frames: List[rtc.AudioFrame] = []
+        self._pending.add(key)
+        try:
+            async with tts.synthesize(text) as stream:
+                async for audio in stream:
+                    if started is not None and not frames:
+                        self.stats.miss_first_frame_ms += (time.perf_counter() - started) * 1000
+                    frames.append(audio.frame)
+                    yield audio.frame
+            # only reached once the session has consumed the whole synthesized phrase (before it
+            # finishes playing); a stream cut short by an interruption isn't stored
+            await self.store(key, frames)
+        finally:
+            self._pending.discard(key)
+
+    async def _lookup(self, tts, text: str, key: str, started: float) -> AsyncIterator[rtc.AudioFrame]:
+        # another worker process may have stored it since we loaded, the disk is checked off the loop
+        entry = await self.aget(key)
+        if entry is not None:
+            self.stats.hits += 1
+            source = self._replay(entry, started)
+        else:
+            self.stats.misses += 1
+            source = self._synthesize(tts, text, key, started)
+        try:
+            async for frame in source:
+                yield frame
+        finally:
+            await source.aclose()
+
+    def audio(self, tts, text: str) -> AsyncIterator[rtc.AudioFrame]:
+        """Frames for text, from the cache or from the TTS (stored for next time)"""
+        started = time.perf_counter()
+        key = self.key_for(tts, text)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self.stats.hits += 1
+            return self._replay(entry, started)
+        return self._lookup(tts, text, key, started)
+
+    def say(self, session, text: str, **kwargs):
+        """session.say() with cached audio; returns the SpeechHandle"""
+        if not TTS_CACHE_ENABLED or session.tts is None:
+            return session.say(text, **kwargs)
+        return session.say(text, audio=self.audio(session.tts, text), **kwargs)
+
+    async def warm(self, tts, phrases: Iterable[str]) -> None:
+        """Synthesize and store the phrases not cached yet (needs a job's HTTP session, so run it in the entrypoint)"""
+        if not TTS_CACHE_ENABLED:
+            return
+        for text in phrases:
+            key = self.key_for(tts, text)
+            if key in self._pending or await self.aget(key) is not None:
+                continue
+            try:
+                async for _ in self._synthesize(tts, text, key):
+                    pass
+            except Exception as e:
+                logger.warning(f"Warming TTS cache failed for {text!r}: {e}")
+
+
+tts_cache = TTSCache()